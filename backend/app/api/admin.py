@@ -0,0 +1,81 @@
+"""
+管理 API 路由
+
+需要配置环境变量 ADMIN_TOKEN，请求头 X-Admin-Token 与之一致才可访问；
+未配置 ADMIN_TOKEN 时管理接口不可用
+"""
+import asyncio
+import os
+import secrets
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+
+from app.services.interaction_index import SORTABLE_FIELDS, interaction_index
+
+# 单页最多返回的记录数
+MAX_PAGE_SIZE = 200
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """校验管理员令牌"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="管理接口未启用（未配置 ADMIN_TOKEN）")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=401, detail="管理员令牌无效")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/interactions")
+async def query_interactions(
+    model: Optional[str] = None,
+    hexagram_number: Optional[int] = Query(default=None, ge=1, le=64),
+    hexagram_name: Optional[str] = None,
+    success: Optional[bool] = None,
+    fallback: Optional[bool] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    min_latency_ms: Optional[float] = None,
+    sort: str = "timestamp",
+    descending: bool = True,
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=50, ge=1, le=MAX_PAGE_SIZE)
+):
+    """
+    分页查询 AI 交互记录
+    
+    例：上周 deepseek 回退的天风姤解读
+        /api/admin/interactions?model=deepseek&hexagram_name=天风姤&fallback=true&since=2026-01-01
+    """
+    if sort not in SORTABLE_FIELDS:
+        raise HTTPException(status_code=400, detail=f"不支持的排序字段: {sort}，可用字段: {', '.join(SORTABLE_FIELDS)}")
+    
+    return await asyncio.to_thread(
+        interaction_index.query,
+        model=model,
+        hexagram_number=hexagram_number,
+        hexagram_name=hexagram_name,
+        success=success,
+        fallback=fallback,
+        since=since,
+        until=until,
+        min_latency_ms=min_latency_ms,
+        sort=sort,
+        descending=descending,
+        page=page,
+        page_size=page_size
+    )
+
+
+@router.get("/interactions/stats")
+async def interaction_stats(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """按模型统计调用次数、失败率、回退率和平均耗时"""
+    models = await asyncio.to_thread(interaction_index.model_stats, since=since, until=until)
+    return {"models": models}
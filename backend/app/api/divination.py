@@ -1,12 +1,29 @@
 """
 占卜相关 API 路由
 """
+import asyncio
+import hashlib
+import json
 import re
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Any
+import sqlite3
+import time
+from contextlib import aclosing
+from functools import lru_cache
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict
+from pydantic_core import to_json
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Any, Tuple
 from app.services.liuyao_service import LiuYaoService
 from app.services.ai_factory import AIServiceFactory
+from app.services.admission import AdmissionRejected
+from app.services.deadline import set_deadline
+from app.services.divination_store import ID_PATTERN, DivinationStore, divination_store
+from app.services.idempotency import IdempotencyConflict, idempotency_store
+from app.services.job_queue import Job, JobQueueFull, job_queue
+from app.services.single_flight import Publish
+from app.services.poster import MEDIA_TYPES as POSTER_MEDIA_TYPES, PosterUnavailable, poster_renderer
+from app.services.metrics import REQUESTS_IN_FLIGHT, observe_stage
 
 router = APIRouter()
 
@@ -14,39 +31,91 @@ router = APIRouter()
 liuyao_service = LiuYaoService()
 
 
+@lru_cache(maxsize=None)
 def snake_to_camel(name: str) -> str:
-    """将 snake_case 转换为 camelCase"""
+    """将 snake_case 转换为 camelCase（结果缓存，key 集合很小）"""
     components = name.split('_')
     return components[0] + ''.join(x.title() for x in components[1:])
 
 
-def convert_keys_to_camel(data: Any) -> Any:
-    """递归将字典的 key 从 snake_case 转换为 camelCase"""
-    if isinstance(data, dict):
-        return {snake_to_camel(k): convert_keys_to_camel(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [convert_keys_to_camel(item) for item in data]
-    return data
-
-
 class LiuYaoRequest(BaseModel):
     """六爻占卜请求"""
     question: str  # 用户的问题
     coin_results: List[List[int]]  # 6次掷铜钱结果，每次3枚铜钱的正反面 [0=反, 1=正]
-    model: Optional[str] = None  # AI 模型选择（gemini/deepseek），默认 gemini
+    model: Optional[str] = None  # AI 模型选择（gemini/deepseek，local 为不调用 AI 的快速模式），默认 gemini
+
+
+class LiuYaoBatchRequest(BaseModel):
+    """六爻批量起卦请求（不含 AI 解读）"""
+    coin_results: List[List[List[int]]]  # 多组起卦结果，每组同 LiuYaoRequest.coin_results
+
+
+class CamelModel(BaseModel):
+    """字段用 snake_case 定义，按 camelCase 别名输入输出"""
+    model_config = ConfigDict(alias_generator=snake_to_camel, populate_by_name=True)
+
+
+class Trigram(CamelModel):
+    """八卦"""
+    name: str
+    symbol: str
+    nature: str
+    attribute: str
+
+
+class Hexagram(CamelModel):
+    """六十四卦"""
+    name: str
+    number: int
+    judgment: str  # 卦辞
+    lower_trigram: Trigram  # 下卦
+    upper_trigram: Trigram  # 上卦
+    lines: List[int]  # 六爻阴阳，初爻在前
 
 
-class LiuYaoResponse(BaseModel):
+class Line(CamelModel):
+    """单爻"""
+    value: int  # 1=阳，0=阴
+    type: str  # old_yang/young_yang/young_yin/old_yin
+    name: str
+    symbol: str
+    number: int  # 9/7/8/6
+    changing: bool  # 是否变爻
+    changed_value: int  # 变后的阴阳
+    position: int  # 爻位，1~6
+    position_name: str
+
+
+class LiuYaoResponse(CamelModel):
     """六爻占卜响应"""
+    share_id: Optional[str] = None  # 保存后的 id，GET /api/divination/{id} 可重新取得
     success: bool
-    originalHexagram: dict  # 本卦
-    changedHexagram: Optional[dict] = None  # 变卦（如有变爻）
-    lines: List[dict]  # 六爻详情
-    a2uiResponse: dict  # A2UI 格式的动态 UI 数据
+    original_hexagram: Hexagram  # 本卦
+    changed_hexagram: Optional[Hexagram] = None  # 变卦（如有变爻）
+    lines: List[Line]  # 六爻详情
+    a2ui_response: dict  # A2UI 格式的动态 UI 数据
     model: str  # 使用的 AI 模型
 
-    class Config:
-        populate_by_name = True
+
+class LiuYaoJobResponse(CamelModel):
+    """六爻占卜后台任务"""
+    job_id: str
+    status: str  # queued/running/succeeded/failed/cancelled
+    original_hexagram: Hexagram
+    changed_hexagram: Optional[Hexagram] = None
+    lines: List[Line]
+    model: str
+    share_id: Optional[str] = None  # 任务成功且保存后的 id，同 LiuYaoResponse.share_id
+    a2ui_response: Optional[dict] = None  # 任务成功后才有
+    error: Optional[str] = None  # 任务失败的原因
+
+
+class HexagramEvent(CamelModel):
+    """流式接口的 hexagram 事件"""
+    original_hexagram: Hexagram
+    changed_hexagram: Optional[Hexagram] = None
+    lines: List[Line]
+    model: str
 
 
 class DivinationMethod(BaseModel):
@@ -67,6 +136,199 @@ class AIModel(BaseModel):
     default: bool
 
 
+# 批量起卦单次请求的最大组数
+BATCH_MAX_SIZE = 10000
+# 批量起卦每次向响应流写出的组数
+BATCH_CHUNK_SIZE = 500
+
+# 检查客户端是否已断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 1.0
+
+# Idempotency-Key 的最大长度
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# 保存的占卜结果内容不变，允许 CDN 和浏览器长期缓存
+DIVINATION_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 后台任务长轮询的最长等待时间（秒）
+JOB_WAIT_MAX = 30.0
+# 后台任务事件流的心跳间隔（秒），避免代理因连接空闲而断开
+JOB_HEARTBEAT_INTERVAL = 15.0
+
+# 预序列化的卦、爻 JSON 片段，批量起卦时直接拼接，无需逐个序列化
+_HEXAGRAM_JSON = [json.dumps(h, ensure_ascii=False, separators=(",", ":")) for h in LiuYaoService.HEXAGRAM_TABLE]
+_LINE_JSON = [
+    [json.dumps(line, ensure_ascii=False, separators=(",", ":")) for line in row]
+    for row in LiuYaoService.LINE_TABLE
+]
+
+# 预先校验的卦、爻模型，与查找表一一对应，组装响应时直接引用，无需再转换和校验
+_HEXAGRAM_MODELS = [Hexagram.model_validate(h) for h in LiuYaoService.HEXAGRAM_TABLE]
+_LINE_MODELS = [[Line.model_validate(line) for line in row] for row in LiuYaoService.LINE_TABLE]
+
+
+def _validate_coin_results(coin_results: List[List[int]]) -> Optional[str]:
+    """校验一组起卦结果，返回错误信息，合法时返回 None"""
+    if len(coin_results) != 6:
+        return "需要6次掷铜钱结果"
+    for i, coins in enumerate(coin_results):
+        if len(coins) != 3:
+            return f"第{i+1}次掷铜钱需要3枚铜钱结果"
+    return None
+
+
+def _iter_batch_ndjson(batch: List[List[List[int]]]) -> Iterator[str]:
+    """
+    分块计算并输出批量起卦结果（NDJSON，每行一组）
+    
+    每块先把起卦结果编码进紧凑数组，再通过查表得到本卦、变爻掩码，
+    最后拼接预序列化的 JSON 片段，内存占用与批量大小无关
+    """
+    mask_by_code = LiuYaoService.MASK_BY_CODE
+    change_mask_by_code = LiuYaoService.CHANGE_MASK_BY_CODE
+    
+    for start in range(0, len(batch), BATCH_CHUNK_SIZE):
+        chunk = batch[start:start + BATCH_CHUNK_SIZE]
+        errors = {}
+        for offset, coin_results in enumerate(chunk):
+            error = _validate_coin_results(coin_results)
+            if error:
+                errors[offset] = error
+        
+        # 不合法的组按空结果编码占位，输出时跳过
+        codes = liuyao_service.encode_heads_batch(
+            [] if offset in errors else coin_results
+            for offset, coin_results in enumerate(chunk)
+        )
+        
+        out = []
+        for offset, code in enumerate(codes):
+            index = start + offset
+            if offset in errors:
+                out.append(json.dumps(
+                    {"index": index, "success": False, "error": errors[offset]},
+                    ensure_ascii=False
+                ))
+                continue
+            
+            mask = mask_by_code[code]
+            change_mask = change_mask_by_code[code]
+            changed = _HEXAGRAM_JSON[mask ^ change_mask] if change_mask else "null"
+            lines = ",".join(_LINE_JSON[i][(code >> (2 * i)) & 3] for i in range(6))
+            out.append(
+                f'{{"index":{index},"success":true,"originalHexagram":{_HEXAGRAM_JSON[mask]},'
+                f'"changedHexagram":{changed},"lines":[{lines}],'
+                f'"hasChanging":{"true" if change_mask else "false"}}}'
+            )
+        
+        yield "\n".join(out) + "\n"
+
+
+def _calculate_hexagram(
+    coin_results: List[List[int]]
+) -> Tuple[Dict, Tuple[Hexagram, Optional[Hexagram], List[Line]]]:
+    """
+    根据起卦结果查表计算卦象（只编码、查表一次）
+    
+    返回：
+        (卦象字典，同 calculate_hexagram，用于生成提示词；(本卦, 变卦, 六爻) 模型，用于组装响应)
+    """
+    code = liuyao_service.encode_heads(coin_results)
+    mask = LiuYaoService.MASK_BY_CODE[code]
+    change_mask = LiuYaoService.CHANGE_MASK_BY_CODE[code]
+    heads = [(code >> (2 * i)) & 3 for i in range(6)]
+    
+    hexagram_result = liuyao_service.build_result(
+        mask, change_mask, [LiuYaoService.LINE_TABLE[i][count] for i, count in enumerate(heads)]
+    )
+    changed = _HEXAGRAM_MODELS[mask ^ change_mask] if change_mask else None
+    lines = [_LINE_MODELS[i][count] for i, count in enumerate(heads)]
+    return hexagram_result, (_HEXAGRAM_MODELS[mask], changed, lines)
+
+
+def _json_response(model: BaseModel, status_code: int = 200) -> Response:
+    """按 camelCase 别名一次性序列化为 JSON 响应"""
+    return Response(
+        content=model.model_dump_json(by_alias=True),
+        status_code=status_code,
+        media_type="application/json"
+    )
+
+
+def _job_model(job: Job) -> LiuYaoJobResponse:
+    """后台任务的当前状态（含卦象，成功后含 A2UI 解读和 shareId）"""
+    return LiuYaoJobResponse(
+        job_id=job.id,
+        status=job.status,
+        error=job.error,
+        **job.payload,
+        **(job.result or {})
+    )
+
+
+def _get_job(job_id: str) -> Job:
+    """获取后台任务，不存在或已过期时返回 404"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job
+
+
+def _validate_liuyao_request(request: LiuYaoRequest) -> str:
+    """
+    验证六爻占卜请求
+    
+    返回：
+        使用的模型名称
+    """
+    error = _validate_coin_results(request.coin_results)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    
+    model_name = request.model or AIServiceFactory.DEFAULT_MODEL
+    if not AIServiceFactory.is_valid_model(model_name):
+        raise HTTPException(
+            status_code=400, 
+            detail=f"不支持的模型: {model_name}，可用模型: gemini, deepseek, local"
+        )
+    return model_name
+
+
+def _admission_error(e: AdmissionRejected) -> HTTPException:
+    """准入被拒时返回 429（队列已满）或 503（排队超时），附带 Retry-After"""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(max(int(e.retry_after + 0.999), 1))}
+    )
+
+
+async def _cancel_on_disconnect(http_request: Request, coro):
+    """
+    执行协程，客户端断开连接时取消它（进而取消仍在进行的上游调用）
+    
+    异常：
+        HTTPException(499): 客户端已断开
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise HTTPException(status_code=499, detail="客户端已断开连接")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _format_sse(event: str, data: Any) -> str:
+    """格式化一条 Server-Sent Event（data 为 pydantic 模型时按 camelCase 别名序列化）"""
+    payload = to_json(data, by_alias=True).decode("utf-8")
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
 @router.get("/methods")
 async def get_divination_methods() -> List[DivinationMethod]:
     """获取所有占卜方式"""
@@ -109,8 +371,91 @@ async def get_ai_models() -> List[AIModel]:
     return [AIModel(**model) for model in models]
 
 
+async def _divine(request: LiuYaoRequest, model_name: str) -> str:
+    """计算卦象并生成 AI 解读，返回序列化好的响应 JSON"""
+    started = time.perf_counter()
+    
+    # 计算卦象（卦、爻模型直接引用预先校验的对象）
+    hexagram_result, (original_hexagram, changed_hexagram, lines) = _calculate_hexagram(request.coin_results)
+    stage_started = observe_stage("hexagram", model_name, started)
+    
+    # 调用 AI 生成 A2UI 解读（相同问题和卦象优先读取缓存）
+    a2ui_response = await AIServiceFactory.generate_liuyao_interpretation(
+        model_name=model_name,
+        question=request.question,
+        original_hexagram=hexagram_result["original_hexagram"],
+        changed_hexagram=hexagram_result.get("changed_hexagram"),
+        lines=hexagram_result["lines"]
+    )
+    stage_started = observe_stage("interpretation", model_name, stage_started)
+    
+    # 整个响应只序列化一次
+    content = _serialize_result(original_hexagram, changed_hexagram, lines, a2ui_response, model_name)
+    stage_started = observe_stage("serialize", model_name, stage_started)
+    
+    _, content = await _save_divination(content)
+    observe_stage("store", model_name, stage_started)
+    return content
+
+
+def _serialize_result(
+    original_hexagram: Hexagram,
+    changed_hexagram: Optional[Hexagram],
+    lines: List[Line],
+    a2ui_response: Dict,
+    model_name: str
+) -> str:
+    """序列化占卜结果（不含 shareId）"""
+    return LiuYaoResponse(
+        success=True,
+        original_hexagram=original_hexagram,
+        changed_hexagram=changed_hexagram,
+        lines=lines,
+        a2ui_response=a2ui_response,
+        model=model_name
+    ).model_dump_json(by_alias=True, exclude={"share_id"})
+
+
+async def _save_divination(content: str) -> Tuple[Optional[str], str]:
+    """
+    保存完成的占卜
+    
+    参数：
+        content: 不含 shareId 的响应 JSON
+    
+    返回：
+        (id, 带 shareId 的响应 JSON)；未启用存储或保存失败时为 (None, 原内容)
+    """
+    if not divination_store.enabled:
+        return None, content
+    
+    # id 由不含 shareId 的内容计算，再拼接到 JSON 开头（与 LiuYaoResponse 的字段顺序一致）
+    divination_id = DivinationStore.make_id(content)
+    saved = f'{{"shareId":"{divination_id}",{content[1:]}'
+    try:
+        await asyncio.to_thread(divination_store.save, divination_id, saved)
+    except sqlite3.Error as e:
+        print(f"[ERROR] 保存占卜结果失败: {e}")
+        return None, content
+    return divination_id, saved
+
+
+def _request_fingerprint(request: LiuYaoRequest, model_name: str) -> str:
+    """请求内容的指纹，相同 Idempotency-Key 的请求必须一致"""
+    content = json.dumps([model_name, request.question, request.coin_results], ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
 @router.post("/liuyao")
-async def liuyao_divination(request: LiuYaoRequest) -> LiuYaoResponse:
+async def liuyao_divination(
+    request: LiuYaoRequest,
+    http_request: Request,
+    idempotency_key: Optional[str] = Header(
+        None,
+        max_length=IDEMPOTENCY_KEY_MAX_LENGTH,
+        description="幂等键：相同的 key 复用进行中或已完成的结果，不重复调用 AI"
+    )
+) -> LiuYaoResponse:
     """
     六爻占卜
     
@@ -119,54 +464,391 @@ async def liuyao_divination(request: LiuYaoRequest) -> LiuYaoResponse:
     参数：
         question: 用户的问题
         coin_results: 6次掷铜钱结果
-        model: AI 模型选择（gemini/deepseek），可选，默认 gemini
+        model: AI 模型选择（gemini/deepseek/local），可选，默认 gemini
+    
+    带 Idempotency-Key 请求头时，相同 key 的重试直接复用之前的结果（响应头 Idempotent-Replayed: true），
+    首个请求的客户端断开后解读仍继续生成；相同 key 对应不同的请求内容时返回 422
     """
+    started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc(endpoint="liuyao")
     try:
-        # 验证输入
-        if len(request.coin_results) != 6:
-            raise HTTPException(status_code=400, detail="需要6次掷铜钱结果")
+        # 验证输入和模型
+        model_name = _validate_liuyao_request(request)
         
-        for i, coins in enumerate(request.coin_results):
-            if len(coins) != 3:
-                raise HTTPException(status_code=400, detail=f"第{i+1}次掷铜钱需要3枚铜钱结果")
-        
-        # 验证模型
-        model_name = request.model or AIServiceFactory.DEFAULT_MODEL
-        if not AIServiceFactory.is_valid_model(model_name):
-            raise HTTPException(
-                status_code=400, 
-                detail=f"不支持的模型: {model_name}，可用模型: gemini, deepseek"
+        # 截止时间向下传递到排队、重试和上游调用，客户端断开时取消
+        # （带幂等键时只停止等待，解读继续生成供重试的请求使用）
+        set_deadline()
+        if idempotency_key:
+            content, replayed = await _cancel_on_disconnect(
+                http_request,
+                idempotency_store.do(
+                    idempotency_key,
+                    _request_fingerprint(request, model_name),
+                    lambda: _divine(request, model_name)
+                )
             )
+        else:
+            content = await _cancel_on_disconnect(http_request, _divine(request, model_name))
+            replayed = False
         
-        # 计算卦象
-        hexagram_result = liuyao_service.calculate_hexagram(request.coin_results)
-        
-        # 获取对应的 AI 服务
-        ai_service = AIServiceFactory.get_service(model_name)
+        observe_stage("total", model_name, started)
+        return Response(
+            content=content,
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"} if replayed else None
+        )
         
-        # 调用 AI 生成 A2UI 解读
-        a2ui_response = await ai_service.generate_liuyao_interpretation(
+    except HTTPException:
+        raise
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AdmissionRejected as e:
+        raise _admission_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"占卜失败: {str(e)}")
+    finally:
+        REQUESTS_IN_FLIGHT.dec(endpoint="liuyao")
+
+
+@router.post("/liuyao/stream")
+async def liuyao_divination_stream(
+    request: LiuYaoRequest,
+    idempotency_key: Optional[str] = Header(
+        None,
+        max_length=IDEMPOTENCY_KEY_MAX_LENGTH,
+        description="幂等键：相同的 key 复用进行中或已完成的结果，不重复调用 AI"
+    )
+) -> StreamingResponse:
+    """
+    六爻占卜（流式）
+    
+    以 Server-Sent Events 返回，事件依次为：
+        hexagram: 卦象计算结果（originalHexagram/changedHexagram/lines/model），立即返回
+        component: 模型每生成完一个 A2UI 组件即推送一个
+        failover: 主模型失败、切换到备用模型（from/to），此前推送的组件应丢弃
+        saved: 完整结果已保存（shareId），可通过 GET /api/divination/{id} 重新取得
+        done: 完整的 A2UI 数据（AI 失败时为回退响应），前端以此为准
+    
+    参数同 /liuyao
+    
+    客户端断开连接时响应流被取消，上游的流式调用随之关闭。
+    带 Idempotency-Key 请求头时解读在后台生成，客户端断开后继续；相同 key 的重试
+    接上进行中的事件流或直接取得已完成的结果（响应头 Idempotent-Replayed: true），
+    与 /liuyao 共用同一个 key 空间
+    """
+    model_name = _validate_liuyao_request(request)
+    set_deadline()
+    hexagram_result, hexagram_models = _calculate_hexagram(request.coin_results)
+    
+    replayed = False
+    if idempotency_key:
+        try:
+            replayed, events = idempotency_store.stream(
+                idempotency_key,
+                _request_fingerprint(request, model_name),
+                lambda publish: _publish_events(
+                    _stream_divination(request, model_name, hexagram_result, hexagram_models), publish
+                )
+            )
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    else:
+        events = _stream_divination(request, model_name, hexagram_result, hexagram_models)
+    
+    # 开始响应前先通过准入检查，服务繁忙时直接返回 429/503
+    REQUESTS_IN_FLIGHT.inc(endpoint="liuyao_stream")
+    try:
+        first = await anext(events)
+    except AdmissionRejected as e:
+        await events.aclose()
+        raise _admission_error(e)
+    finally:
+        REQUESTS_IN_FLIGHT.dec(endpoint="liuyao_stream")
+    
+    async def event_stream():
+        REQUESTS_IN_FLIGHT.inc(endpoint="liuyao_stream")
+        try:
+            original_hexagram, changed_hexagram, lines = hexagram_models
+            yield _format_sse("hexagram", HexagramEvent(
+                original_hexagram=original_hexagram,
+                changed_hexagram=changed_hexagram,
+                lines=lines,
+                model=model_name
+            ))
+            
+            components_sent = False
+            event, data = first
+            while True:
+                if event == "component":
+                    components_sent = True
+                    yield _format_sse(event, data)
+                elif event == "done":
+                    result = json.loads(data)
+                    # 复用已完成的结果时没有中间事件，一次性推送全部组件
+                    if not components_sent:
+                        for component in result["a2uiResponse"].get("components", []):
+                            yield _format_sse("component", component)
+                    if result.get("shareId"):
+                        yield _format_sse("saved", {"shareId": result["shareId"]})
+                    yield _format_sse("done", result["a2uiResponse"])
+                    break
+                elif event != "ready":
+                    yield _format_sse(event, data)
+                event, data = await anext(events)
+        finally:
+            # 客户端断开时关闭事件流：不带幂等键时归还准入许可并关闭上游的流式调用，
+            # 带幂等键时只停止转发，解读继续生成
+            await events.aclose()
+            REQUESTS_IN_FLIGHT.dec(endpoint="liuyao_stream")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 关闭 Nginx 代理缓冲，保证事件即时送达
+            "X-Accel-Buffering": "no",
+            **({"Idempotent-Replayed": "true"} if replayed else {})
+        }
+    )
+
+
+async def _stream_divination(
+    request: LiuYaoRequest,
+    model_name: str,
+    hexagram_result: Dict,
+    hexagram_models: Tuple[Hexagram, Optional[Hexagram], List[Line]]
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    流式生成 AI 解读并保存
+    
+    产出：
+        同 AIServiceFactory.stream_liuyao_interpretation，但最后的 done 为保存后的
+        响应 JSON（同 _divine 的返回值）
+    """
+    async with aclosing(AIServiceFactory.stream_liuyao_interpretation(
+        model_name=model_name,
+        question=request.question,
+        original_hexagram=hexagram_result["original_hexagram"],
+        changed_hexagram=hexagram_result.get("changed_hexagram"),
+        lines=hexagram_result["lines"]
+    )) as events:
+        async for event, data in events:
+            if event != "done":
+                yield event, data
+                continue
+            
+            original_hexagram, changed_hexagram, lines = hexagram_models
+            _, content = await _save_divination(
+                _serialize_result(original_hexagram, changed_hexagram, lines, data, model_name)
+            )
+            yield "done", content
+
+
+async def _publish_events(events: AsyncIterator[Tuple[str, Any]], publish: Publish) -> str:
+    """在后台执行流式占卜（带幂等键时），中间事件交给 publish，返回 done 中的响应 JSON"""
+    async with aclosing(events):
+        async for event, data in events:
+            if event == "done":
+                return data
+            publish(event, data)
+    raise RuntimeError("解读事件流提前结束")
+
+
+@router.post("/liuyao/batch")
+async def liuyao_batch_divination(request: LiuYaoBatchRequest) -> StreamingResponse:
+    """
+    六爻批量起卦
+    
+    只计算本卦、变卦和六爻，不调用 AI 解读，用于数据分析和预生成任务。
+    结果以 NDJSON 流式返回，每行对应一组起卦（带 index），
+    单组不合法时该行 success 为 false 并附带 error，不影响其余各组。
+    
+    参数：
+        coin_results: 多组6次掷铜钱结果
+    """
+    if len(request.coin_results) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"单次最多批量起卦 {BATCH_MAX_SIZE} 组")
+    
+    return StreamingResponse(
+        _iter_batch_ndjson(request.coin_results),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.post("/liuyao/jobs", status_code=202)
+async def submit_liuyao_job(request: LiuYaoRequest) -> LiuYaoJobResponse:
+    """
+    六爻占卜（后台任务）
+    
+    立即返回任务 ID 和卦象，AI 解读在后台执行，
+    之后通过 GET /liuyao/jobs/{job_id} 轮询（可长轮询）或 GET /liuyao/jobs/{job_id}/events 订阅结果
+    
+    参数同 /liuyao
+    
+    任务队列已满时返回 429
+    """
+    model_name = _validate_liuyao_request(request)
+    hexagram_result, (original_hexagram, changed_hexagram, lines) = _calculate_hexagram(request.coin_results)
+    
+    async def interpret() -> Dict:
+        # 截止时间从任务开始执行时计算，约束排队、重试和上游调用
+        set_deadline()
+        a2ui_response = await AIServiceFactory.generate_liuyao_interpretation(
+            model_name=model_name,
             question=request.question,
             original_hexagram=hexagram_result["original_hexagram"],
             changed_hexagram=hexagram_result.get("changed_hexagram"),
             lines=hexagram_result["lines"]
         )
-        
-        # 转换为 camelCase
-        original_hexagram = convert_keys_to_camel(hexagram_result["original_hexagram"])
-        changed_hexagram = convert_keys_to_camel(hexagram_result.get("changed_hexagram")) if hexagram_result.get("changed_hexagram") else None
-        lines = convert_keys_to_camel(hexagram_result["lines"])
-        
-        return LiuYaoResponse(
-            success=True,
-            originalHexagram=original_hexagram,
-            changedHexagram=changed_hexagram,
-            lines=lines,
-            a2uiResponse=a2ui_response,
-            model=model_name
+        # 与同步、流式接口一样保存完整结果，任务结果带上 shareId
+        share_id, _ = await _save_divination(
+            _serialize_result(original_hexagram, changed_hexagram, lines, a2ui_response, model_name)
         )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"占卜失败: {str(e)}")
+        return {"a2ui_response": a2ui_response, "share_id": share_id}
+    
+    try:
+        job = job_queue.submit(interpret, {
+            "original_hexagram": original_hexagram,
+            "changed_hexagram": changed_hexagram,
+            "lines": lines,
+            "model": model_name
+        })
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    
+    return _json_response(_job_model(job), status_code=202)
+
+
+@router.get("/liuyao/jobs/{job_id}")
+async def get_liuyao_job(
+    job_id: str,
+    http_request: Request,
+    wait: float = Query(0, ge=0, le=JOB_WAIT_MAX, description="任务未结束时最多等待的秒数（长轮询）")
+) -> LiuYaoJobResponse:
+    """
+    查询六爻占卜后台任务
+    
+    status 为 succeeded 时 a2uiResponse 为解读结果、shareId 为保存后的 id；failed 时 error 为失败原因
+    """
+    job = _get_job(job_id)
+    if wait > 0 and not job.finished:
+        await _cancel_on_disconnect(http_request, job.wait_finished(wait))
+    return _json_response(_job_model(job))
+
+
+@router.get("/liuyao/jobs/{job_id}/events")
+async def subscribe_liuyao_job(job_id: str) -> StreamingResponse:
+    """
+    订阅六爻占卜后台任务（Server-Sent Events）
+    
+    事件依次为：
+        status: 任务状态变化（jobId/status）
+        done: 任务结束，数据同 GET /liuyao/jobs/{job_id}
+    
+    客户端断开连接不影响任务执行，重新订阅或轮询即可取得结果
+    """
+    job = _get_job(job_id)
+    
+    async def event_stream():
+        status = None
+        while True:
+            if job.finished:
+                yield _format_sse("done", _job_model(job))
+                return
+            if job.status != status:
+                status = job.status
+                yield _format_sse("status", {"jobId": job.id, "status": status})
+            if not await job.wait_changed(JOB_HEARTBEAT_INTERVAL) and not job.finished:
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@router.delete("/liuyao/jobs/{job_id}")
+async def cancel_liuyao_job(job_id: str) -> LiuYaoJobResponse:
+    """
+    取消六爻占卜后台任务
+    
+    排队中的任务不再执行，运行中的任务连同上游调用一起取消；已结束的任务不受影响
+    """
+    job = _get_job(job_id)
+    job_queue.cancel(job_id)
+    # 运行中的任务在下一次调度时才结束，稍等片刻以返回取消后的状态
+    await job.wait_finished(1.0)
+    return _json_response(_job_model(job))
+
+
+@router.get("/{divination_id}")
+async def get_divination(
+    divination_id: str,
+    if_none_match: Optional[str] = Header(None)
+) -> LiuYaoResponse:
+    """
+    读取保存的占卜结果（分享链接、重新打开结果页）
+    
+    内容按 id 寻址、永不改变：返回强 ETag 和 Cache-Control: immutable，
+    带匹配的 If-None-Match 的请求确认 id 存在后直接返回 304（只查主键，不读取内容）
+    """
+    _check_divination_id(divination_id)
+    etag = f'"{divination_id}"'
+    headers = {"ETag": etag, "Cache-Control": DIVINATION_CACHE_CONTROL}
+    if _etag_matches(etag, if_none_match) and await asyncio.to_thread(divination_store.exists, divination_id):
+        return Response(status_code=304, headers=headers)
+    
+    content = await asyncio.to_thread(divination_store.get, divination_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="占卜结果不存在")
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+@router.get("/{divination_id}/poster.{fmt}")
+async def get_divination_poster(
+    divination_id: str,
+    fmt: str,
+    if_none_match: Optional[str] = Header(None)
+) -> Response:
+    """
+    保存的占卜结果的分享海报（svg / png）
+    
+    服务端渲染并按内容 hash 缓存在磁盘，同样返回强 ETag 和 Cache-Control: immutable；
+    带匹配的 If-None-Match 的请求确认占卜结果存在后直接返回 304
+    """
+    _check_divination_id(divination_id)
+    try:
+        poster_renderer.check_format(fmt)
+    except PosterUnavailable as e:
+        raise HTTPException(status_code=404 if fmt not in POSTER_MEDIA_TYPES else 501, detail=str(e))
+    
+    etag = f'"{poster_renderer.cache_key(divination_id, fmt)}"'
+    headers = {"ETag": etag, "Cache-Control": DIVINATION_CACHE_CONTROL}
+    if _etag_matches(etag, if_none_match) and await asyncio.to_thread(divination_store.exists, divination_id):
+        return Response(status_code=304, headers=headers)
+    
+    content = await asyncio.to_thread(divination_store.get, divination_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="占卜结果不存在")
+    
+    poster = await poster_renderer.render(divination_id, json.loads(content), fmt)
+    return Response(content=poster, media_type=POSTER_MEDIA_TYPES[fmt], headers=headers)
+
+
+def _check_divination_id(divination_id: str):
+    """id 格式不符时直接返回 404"""
+    if not ID_PATTERN.match(divination_id):
+        raise HTTPException(status_code=404, detail="占卜结果不存在")
+
+
+def _etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """If-None-Match 是否匹配（弱比较，忽略 W/ 前缀；调用方须先确认资源存在，* 才能匹配）"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags or "*" in tags
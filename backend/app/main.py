@@ -1,15 +1,45 @@
 """
 周易占卜 APP 后端服务
 """
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+
+from app.api import admin, divination
+from app.services.ai_factory import AIServiceFactory
+from app.services.http_client import close_http_client
+from app.services.interaction_logger import interaction_log_writer
+from app.services.divination_store import divination_store
+from app.services.hexagram_corpus import hexagram_corpus
+from app.services.idempotency import idempotency_store
+from app.services.interpretation_cache import interpretation_cache
+from app.services.job_queue import job_queue
+from app.services.poster import poster_renderer
+from app.services.retry import retry_budget
+from app.services.metrics import RETRY_BUDGET_TOKENS, UPSTREAM_IN_FLIGHT, UPSTREAM_WAITING, registry
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时预热 AI 服务，关闭时取消后台任务、释放共享连接池，写完剩余的交互日志"""
+    elapsed = await AIServiceFactory.warm_up()
+    if elapsed:
+        print("[WARMUP] " + "，".join(f"{name} {ms:.0f}ms" for name, ms in elapsed.items()))
+    yield
+    await job_queue.stop()
+    poster_renderer.shutdown()
+    await close_http_client()
+    await asyncio.to_thread(interaction_log_writer.stop)
 
-from app.api import divination
 
 app = FastAPI(
     title="周易占卜 API",
     description="基于中国传统文化的智能占卜服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置 CORS
@@ -23,6 +53,7 @@ app.add_middleware(
 
 # 注册路由
 app.include_router(divination.router, prefix="/api/divination", tags=["占卜"])
+app.include_router(admin.router, prefix="/api/admin", tags=["管理"])
 
 
 @app.get("/")
@@ -34,5 +65,28 @@ async def root():
 @app.get("/api/health")
 async def health_check():
     """健康检查接口"""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "cache": interpretation_cache.stats(),
+        "singleFlight": AIServiceFactory.get_single_flight_stats(),
+        "admission": AIServiceFactory.get_admission_stats(),
+        "circuitBreakers": AIServiceFactory.get_breaker_stats(),
+        "retryBudget": retry_budget.stats(),
+        "routing": AIServiceFactory.get_routing_stats(),
+        "jobs": job_queue.stats(),
+        "idempotency": idempotency_store.stats(),
+        "divinationStore": divination_store.stats(),
+        "poster": poster_renderer.stats(),
+        "corpus": hexagram_corpus.stats(),
+        "interactionLog": interaction_log_writer.stats()
+    }
+
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """运行指标（Prometheus 文本格式）"""
+    for model_name, stats in AIServiceFactory.get_admission_stats().items():
+        UPSTREAM_IN_FLIGHT.set(stats["active"], model=model_name)
+        UPSTREAM_WAITING.set(stats["waiting"], model=model_name)
+    RETRY_BUDGET_TOKENS.set(retry_budget.stats()["tokens"])
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,283 @@
+"""
+A2UI 增量解析器
+
+逐块接收模型输出，跟踪 JSON 的括号栈和字符串状态，
+components 数组中的组件一旦闭合即解析产出，供流式接口逐个推送。
+每个字符只扫描一次，不会回头重扫已处理的文本；根对象的其他成员也在闭合时即解析，
+close() 直接由已解析的成员组装结果，不再整体解析一遍。
+输入块按列表保存，只保留尚未闭合的组件或成员所在的部分，不做整段文本的拼接。
+
+输出被截断时（如达到 max_tokens），close() 根据已跟踪的状态修复：
+补全未闭合的字符串，丢弃不完整的键或值，再按括号栈补齐闭合符号。
+"""
+import json
+import re
+from typing import Dict, List, Optional
+
+
+# 字符串内需要特殊处理的字符：结束引号和转义符
+_STRING_SPECIAL = re.compile(r'["\\]')
+# 字符串末尾不完整的 unicode 转义
+_PARTIAL_UNICODE_ESCAPE = re.compile(r'\\u[0-9a-fA-F]{0,3}$')
+
+# 错误信息中附带的输出开头长度
+_ERROR_CONTEXT_LENGTH = 500
+
+
+class A2UIStreamParser:
+    """A2UI JSON 增量解析器"""
+    
+    def __init__(self):
+        # 保留的输入块，以及第一块在整个输出中的偏移；下文的位置均为整个输出中的偏移
+        self._chunks: List[str] = []
+        self._chunks_start = 0
+        self._end = 0
+        # 输出开头，用于错误信息
+        self._head = ""
+        
+        # JSON 结构状态
+        self._stack: List[str] = []
+        self._in_string = False
+        # 字符串中的转义符位于上一块末尾，本块第一个字符是被转义的字符
+        self._escape_pending = False
+        self._expect_key = False
+        self._key_start: Optional[int] = None
+        self._last_key: Optional[str] = None
+        
+        # 根对象是否已开始、已闭合（忽略前后的代码块标记或说明文字）
+        self._root_started = False
+        self._root_closed = False
+        
+        # 最近一个安全截断点：截到此处再补齐括号即为合法 JSON
+        self._safe_end: Optional[int] = None
+        
+        # 根对象当前成员的键和起始位置（components 成员不保留原文，由各组件组成）
+        self._member_key: Optional[str] = None
+        self._member_start: Optional[int] = None
+        # 已闭合的根对象成员
+        self._members: Dict = {}
+        # 成员解析失败的原因
+        self._error: Optional[str] = None
+        
+        # components 数组所在深度、是否出现过，以及当前组件的起始位置
+        self._components_depth: Optional[int] = None
+        self._components_opened = False
+        self._component_start: Optional[int] = None
+        
+        self.components: List[Dict] = []
+        # close() 时是否对截断的输出做了修复
+        self.repaired = False
+    
+    @property
+    def done(self) -> bool:
+        """根对象是否已闭合"""
+        return self._root_closed
+    
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        输入一段模型输出
+        
+        返回：
+            本次新闭合的组件列表
+        """
+        if self.done or not chunk:
+            return []
+        
+        if len(self._head) < _ERROR_CONTEXT_LENGTH:
+            self._head += chunk[:_ERROR_CONTEXT_LENGTH - len(self._head)]
+        
+        base = self._end
+        self._chunks.append(chunk)
+        self._end += len(chunk)
+        
+        text = chunk
+        n = len(text)
+        i = 0
+        completed = []
+        
+        if self._escape_pending:
+            # 跳过被转义的字符
+            self._escape_pending = False
+            i = 1
+        
+        while i < n:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, i)
+                if not match:
+                    i = n
+                    break
+                j = match.start()
+                if text[j] == "\\":
+                    if j + 1 >= n:
+                        # 转义符在块末尾，被转义的字符在下一块
+                        self._escape_pending = True
+                        i = n
+                        break
+                    i = j + 2
+                    continue
+                self._in_string = False
+                if self._key_start is not None:
+                    self._last_key = self._slice(self._key_start + 1, base + j)
+                    if len(self._stack) == 1:
+                        self._member_key = self._last_key
+                        if self._last_key == "components":
+                            # 组件逐个解析，不保留整个数组的原文
+                            self._member_start = None
+                    self._key_start = None
+                else:
+                    self._safe_end = base + j + 1
+                i = j + 1
+                continue
+            
+            if not self._root_started:
+                j = text.find("{", i)
+                if j < 0:
+                    i = n
+                    break
+                self._root_started = True
+                self._stack.append("{")
+                self._expect_key = True
+                self._safe_end = base + j + 1
+                i = j + 1
+                continue
+            
+            c = text[i]
+            
+            if c == '"':
+                self._in_string = True
+                if self._expect_key:
+                    self._key_start = base + i
+                    self._expect_key = False
+                    if len(self._stack) == 1:
+                        self._member_start = base + i
+            elif c == "{":
+                self._stack.append("{")
+                self._expect_key = True
+                self._safe_end = base + i + 1
+                if self._components_depth is not None and len(self._stack) == self._components_depth + 1:
+                    self._component_start = base + i
+            elif c == "[":
+                self._stack.append("[")
+                self._safe_end = base + i + 1
+                if len(self._stack) == 2 and self._last_key == "components":
+                    self._components_depth = 2
+                    self._components_opened = True
+            elif c == "}" or c == "]":
+                if self._stack:
+                    self._stack.pop()
+                self._safe_end = base + i + 1
+                depth = len(self._stack)
+                if c == "}" and self._component_start is not None and depth == self._components_depth:
+                    component = self._decode_component(self._slice(self._component_start, base + i + 1))
+                    if component is not None:
+                        self.components.append(component)
+                        completed.append(component)
+                    self._component_start = None
+                elif c == "]" and self._components_depth is not None and depth < self._components_depth:
+                    self._components_depth = None
+                if not self._stack:
+                    self._end_member(base + i)
+                    self._root_closed = True
+                    break
+            elif c == ",":
+                # 逗号说明前一个值已完整
+                self._safe_end = base + i
+                self._expect_key = bool(self._stack) and self._stack[-1] == "{"
+                if len(self._stack) == 1:
+                    self._end_member(base + i)
+            
+            i += 1
+        
+        self._trim()
+        return completed
+    
+    def close(self) -> Dict:
+        """
+        结束输入，返回完整的 A2UI 数据（输出被截断时尝试修复）
+        
+        异常：
+            ValueError: 未找到 JSON 对象或成员无法解析
+        """
+        if not self._root_started:
+            raise ValueError(f"AI 响应中未找到有效的 JSON: {self._head}")
+        if self._error is not None:
+            raise ValueError(f"无法解析 AI 返回的 A2UI JSON: {self._error}: {self._head}")
+        
+        result = dict(self._members)
+        if not self.done:
+            self._repair(result)
+            self.repaired = True
+        return result
+    
+    def _end_member(self, end: int):
+        """根对象的成员在 end 处结束（逗号或根对象的右括号）：解析并记录"""
+        if self._member_key == "components" and self._components_opened:
+            self._members["components"] = list(self.components)
+        elif self._member_start is not None:
+            try:
+                self._members.update(json.loads("{" + self._slice(self._member_start, end) + "}"))
+            except json.JSONDecodeError as e:
+                self._error = self._error or str(e)
+        self._member_key = None
+        self._member_start = None
+    
+    def _repair(self, result: Dict):
+        """根据解析状态补全被截断的成员，合并到 result"""
+        if self._member_key == "components" and self._components_opened:
+            components = list(self.components)
+            if self._component_start is not None:
+                component = self._decode_component(
+                    self._repaired_fragment(self._component_start, self._stack[self._components_depth:])
+                )
+                if component is not None:
+                    components.append(component)
+            result["components"] = components
+        elif self._member_start is not None:
+            fragment = self._repaired_fragment(self._member_start, self._stack[1:])
+            try:
+                result.update(json.loads("{" + fragment + "}"))
+            except json.JSONDecodeError:
+                # 截断在键或冒号处，丢弃该成员
+                pass
+    
+    def _repaired_fragment(self, start: int, stack: List[str]) -> str:
+        """从 start 到截断处的文本，补全为合法的 JSON 片段（stack 为片段内未闭合的括号）"""
+        if self._in_string and self._key_start is None:
+            # 截断在字符串值中间：去掉不完整的转义后补上引号
+            end = self._end - 1 if self._escape_pending else self._end
+            body = _PARTIAL_UNICODE_ESCAPE.sub("", self._slice(start, end)) + '"'
+        elif self._safe_end is not None and self._safe_end > start:
+            # 截断在键、数字、字面量或分隔符处：退回到最近的安全截断点
+            body = self._slice(start, self._safe_end)
+        else:
+            return ""
+        
+        closers = "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+        return body + closers
+    
+    def _slice(self, start: int, end: int) -> str:
+        """取出保留部分中 [start, end) 的文本（合并保留的块，之后不再重复拼接）"""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0][start - self._chunks_start:end - self._chunks_start]
+    
+    def _trim(self):
+        """丢弃未闭合的成员、组件和键之前的输入块"""
+        starts = [start for start in (self._member_start, self._component_start, self._key_start) if start is not None]
+        keep = min(starts) if starts else self._end
+        while self._chunks and self._chunks_start + len(self._chunks[0]) <= keep:
+            self._chunks_start += len(self._chunks.pop(0))
+        
+        # 第一块（通常是合并过的块）有一半以上已不需要时截掉，每个字符摊还只复制常数次
+        if self._chunks and (keep - self._chunks_start) * 2 >= len(self._chunks[0]) > 0:
+            self._chunks[0] = self._chunks[0][keep - self._chunks_start:]
+            self._chunks_start = keep
+    
+    @staticmethod
+    def _decode_component(fragment: str) -> Optional[Dict]:
+        """解析单个组件，失败时返回 None（整体结果中同样跳过）"""
+        try:
+            component = json.loads(fragment)
+        except json.JSONDecodeError:
+            return None
+        return component if isinstance(component, dict) else None
@@ -0,0 +1,176 @@
+"""
+AI 服务准入控制
+
+每个模型一个准入控制器：
+- 并发上限：同时进行的上游调用数
+- 令牌桶限速：每秒允许发起的上游调用数（允许一定突发），默认关闭，
+  需要按上游配额限速时设置 {MODEL}_RATE_LIMIT
+- 有界等待队列：超出并发或速率时排队，队列满立即拒绝（429），
+  等待超过期限仍未轮到也拒绝（503），不接收无法在前端超时前完成的请求
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """请求未获准入"""
+    
+    def __init__(self, model_name: str, status_code: int, reason: str, retry_after: float):
+        self.model_name = model_name
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{model_name} 服务繁忙（{reason}），请 {retry_after:.0f} 秒后重试")
+
+
+class TokenBucket:
+    """令牌桶限速"""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+    
+    def try_acquire(self) -> float:
+        """
+        尝试取一个令牌
+        
+        返回：
+            0 表示已取得；否则为还需等待的秒数
+        """
+        if self.rate <= 0:
+            return 0.0
+        
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class AdmissionController:
+    """单个模型的准入控制器"""
+    
+    def __init__(
+        self,
+        model_name: str,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        queue_timeout: float = 15.0,
+        rate: float = 0.0,
+        burst: float = 10.0
+    ):
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(rate, burst)
+        self._active = 0
+        self._waiting = 0
+        
+        # 统计计数
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+    
+    @classmethod
+    def from_env(cls, model_name: str) -> "AdmissionController":
+        """根据环境变量创建，如 DEEPSEEK_MAX_CONCURRENCY、DEEPSEEK_RATE_LIMIT（0 或未设置时不限速）"""
+        prefix = model_name.upper()
+        return cls(
+            model_name=model_name,
+            max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", "16")),
+            max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", "64")),
+            queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT", "15")),
+            rate=float(os.getenv(f"{prefix}_RATE_LIMIT", "0")),
+            burst=float(os.getenv(f"{prefix}_RATE_BURST", "10"))
+        )
+    
+    @asynccontextmanager
+    async def admit(self, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        获取准入许可，离开上下文时归还
+        
+        参数：
+            deadline: 请求截止时间（time.monotonic()），排队不超过它与 queue_timeout 中较早者
+        
+        异常：
+            AdmissionRejected: 队列已满（429）或排队超时（503）
+        """
+        await self.acquire(deadline)
+        try:
+            yield
+        finally:
+            self.release()
+    
+    async def acquire(self, deadline: Optional[float] = None):
+        """获取准入许可（需配对调用 release）"""
+        # 有空闲并发且有令牌时直接放行，不进入队列
+        if not self._semaphore.locked() and self._waiting == 0 and self._bucket.try_acquire() == 0:
+            await self._semaphore.acquire()
+            self._on_admitted()
+            return
+        
+        if self._waiting >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(self.model_name, 429, "等待队列已满", retry_after=self.queue_timeout)
+        
+        queue_deadline = time.monotonic() + self.queue_timeout
+        deadline = queue_deadline if deadline is None else min(deadline, queue_deadline)
+        
+        self._waiting += 1
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise AdmissionRejected(self.model_name, 503, "排队超时", retry_after=self.queue_timeout)
+            
+            # 已占到并发名额，再按速率等待令牌
+            while True:
+                wait = self._bucket.try_acquire()
+                if wait == 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    self._semaphore.release()
+                    self.rejected_timeout += 1
+                    raise AdmissionRejected(self.model_name, 503, "超出速率限制", retry_after=wait)
+                try:
+                    await asyncio.sleep(wait)
+                except BaseException:
+                    self._semaphore.release()
+                    raise
+        finally:
+            self._waiting -= 1
+        
+        self._on_admitted()
+    
+    def release(self):
+        """归还准入许可"""
+        self._active -= 1
+        self._semaphore.release()
+    
+    def stats(self) -> Dict:
+        """准入统计"""
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "maxConcurrency": self.max_concurrency,
+            "maxQueue": self.max_queue,
+            "admitted": self.admitted,
+            "rejectedQueueFull": self.rejected_queue_full,
+            "rejectedTimeout": self.rejected_timeout
+        }
+    
+    def _on_admitted(self):
+        self._active += 1
+        self.admitted += 1
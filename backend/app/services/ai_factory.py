@@ -3,19 +3,37 @@ AI 服务工厂
 
 根据模型名称创建对应的 AI 服务实例
 """
-from typing import Dict, List
+import asyncio
+import importlib
+import os
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from app.services import deadline
+from app.services.admission import AdmissionController, AdmissionRejected
 from app.services.base_ai_service import BaseAIService
-from app.services.gemini_service import GeminiService
-from app.services.deepseek_service import DeepSeekService
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.classic_interpretation import build_classic_response
+from app.services.interaction_logger import is_fallback
+from app.services.interpretation_cache import interpretation_cache
+from app.services.latency_tracker import LatencyTracker
+from app.services.metrics import CACHE_REQUESTS, FALLBACKS, observe_stage
+from app.services.single_flight import Publish, SingleFlight
 
 
 class AIServiceFactory:
     """AI 服务工厂"""
     
-    # 已注册的 AI 服务
-    _services: Dict[str, type] = {
-        "gemini": GeminiService,
-        "deepseek": DeepSeekService,
+    # 已注册的 AI 服务（模块:类名），首次使用时才导入，启动时不加载各家 SDK
+    _services: Dict[str, str] = {
+        "gemini": "app.services.gemini_service:GeminiService",
+        "deepseek": "app.services.deepseek_service:DeepSeekService",
+    }
+    
+    # 各模型的 API key 环境变量，预热时据此判断模型是否已配置，无需导入服务模块
+    _api_key_envs: Dict[str, str] = {
+        "gemini": "GEMINI_API_KEY",
+        "deepseek": "DEEPSEEK_API_KEY",
     }
     
     # 模型信息（用于前端展示）
@@ -33,15 +51,57 @@ class AIServiceFactory:
             "description": "国产大模型，中文理解更优秀",
             "icon": "🔮",
             "default": False
+        },
+        "local": {
+            "id": "local",
+            "name": "快速模式",
+            "description": "不调用 AI，依据《周易》经传原文和传统占法即时断卦",
+            "icon": "⚡",
+            "default": False
         }
     }
     
     # 默认模型
     DEFAULT_MODEL = "gemini"
     
+    # 快速模式：不调用大模型，由经传语料直接生成解读（不经过缓存、准入和熔断）
+    LOCAL_MODEL = "local"
+    
+    # 备用模型：主模型失败或熔断时切换
+    _backup_models: Dict[str, str] = {
+        "gemini": "deepseek",
+        "deepseek": "gemini",
+    }
+    
+    # 路由策略：失败切换默认开启；对冲请求默认关闭，开启后主模型超过
+    # 其近期 p{HEDGE_PERCENTILE} 耗时仍未返回时，向备用模型发出第二个请求
+    FAILOVER_ENABLED = os.getenv("AI_FAILOVER_ENABLED", "1") != "0"
+    HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "0") == "1"
+    HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "5"))
+    
+    # 启动时预热的模型（逗号分隔），未设置时预热所有已配置 API key 的模型，设为空则不预热
+    WARMUP_MODELS = os.getenv("AI_WARMUP_MODELS")
+    
     # 服务实例缓存
     _instances: Dict[str, BaseAIService] = {}
     
+    # 相同解读请求的合并（key 与解读缓存一致）
+    _single_flight = SingleFlight()
+    
+    # 各模型的准入控制器（并发上限、限速、有界等待队列）
+    _admission: Dict[str, AdmissionController] = {}
+    
+    # 各模型的熔断器（上游持续失败或过慢时直接使用回退响应）
+    _breakers: Dict[str, CircuitBreaker] = {}
+    
+    # 各模型近期成功调用的耗时
+    _latencies: Dict[str, LatencyTracker] = {}
+    
+    # 路由统计
+    _routing_stats: Dict[str, int] = {"failovers": 0, "hedged": 0, "hedgeWins": 0}
+    
     @classmethod
     def get_service(cls, model_name: str = None) -> BaseAIService:
         """
@@ -61,12 +121,471 @@ class AIServiceFactory:
         if model_name not in cls._services:
             raise ValueError(f"不支持的模型: {model_name}，可用模型: {list(cls._services.keys())}")
         
-        # 使用缓存的实例
+        # 使用缓存的实例，首次使用时导入服务模块
         if model_name not in cls._instances:
-            cls._instances[model_name] = cls._services[model_name]()
+            module_name, class_name = cls._services[model_name].split(":")
+            service_class = getattr(importlib.import_module(module_name), class_name)
+            cls._instances[model_name] = service_class()
         
         return cls._instances[model_name]
     
+    @classmethod
+    async def warm_up(cls, model_names: Optional[List[str]] = None) -> Dict[str, float]:
+        """
+        预热：导入服务模块，创建客户端、准入控制器和熔断器，并提前建立到上游的连接
+        
+        参数：
+            model_names: 要预热的模型，默认按 AI_WARMUP_MODELS，未设置时为所有已配置 API key 的模型
+        
+        返回：
+            各模型导入服务模块和创建客户端的耗时（毫秒），不含建立连接
+        """
+        if model_names is None:
+            if cls.WARMUP_MODELS is not None:
+                model_names = [name.strip() for name in cls.WARMUP_MODELS.split(",") if name.strip()]
+            else:
+                model_names = [name for name in cls._services if os.getenv(cls._api_key_envs[name])]
+        
+        # 依次导入服务模块、创建客户端（同步操作，分别计时），再并发建立上游连接
+        elapsed = {}
+        for model_name in model_names:
+            started = time.perf_counter()
+            cls.get_service(model_name)
+            cls.get_admission(model_name)
+            cls.get_breaker(model_name)
+            elapsed[model_name] = (time.perf_counter() - started) * 1000
+        
+        await asyncio.gather(*(cls.get_service(name).warm_up() for name in model_names))
+        return elapsed
+    
+    @classmethod
+    def get_admission(cls, model_name: str) -> AdmissionController:
+        """获取模型的准入控制器（首次使用时按环境变量创建）"""
+        if model_name not in cls._admission:
+            cls._admission[model_name] = AdmissionController.from_env(model_name)
+        return cls._admission[model_name]
+    
+    @classmethod
+    def get_breaker(cls, model_name: str) -> CircuitBreaker:
+        """获取模型的熔断器（首次使用时按环境变量创建）"""
+        if model_name not in cls._breakers:
+            cls._breakers[model_name] = CircuitBreaker.from_env(model_name)
+        return cls._breakers[model_name]
+    
+    @classmethod
+    async def generate_liuyao_interpretation(
+        cls,
+        model_name: str,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> Dict:
+        """
+        生成六爻解读（优先读取缓存，并发的相同请求合并为一次上游调用）
+        
+        参数：
+            model_name: 模型名称
+            其余参数同 BaseAIService.generate_liuyao_interpretation
+        
+        返回：
+            A2UI 格式的动态 UI 数据
+        """
+        model_name = (model_name or cls.DEFAULT_MODEL).lower()
+        if model_name == cls.LOCAL_MODEL:
+            return cls._local_interpretation(question, original_hexagram, changed_hexagram, lines)
+        
+        cache_key = interpretation_cache.make_key(model_name, question, original_hexagram, changed_hexagram)
+        
+        cached = await cls._get_cached(model_name, cache_key)
+        if cached is not None:
+            return cls._with_question(cached, question)
+        
+        # 并发的相同请求只调用一次上游
+        a2ui_response, _ = await cls._single_flight.do(
+            cache_key,
+            lambda: cls._generate_and_cache(model_name, cache_key, question, original_hexagram, changed_hexagram, lines)
+        )
+        return cls._with_question(a2ui_response, question)
+    
+    @classmethod
+    async def stream_liuyao_interpretation(
+        cls,
+        model_name: str,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        流式生成六爻解读（优先读取缓存，命中时一次性产出全部组件）
+        
+        第一个产出固定为 ("ready", {"source": ...})，表示已通过准入检查，
+        调用方应先取出它再开始响应，准入被拒时在此之前抛出 AdmissionRejected；
+        主模型失败、切换到备用模型时产出 ("failover", {"from": ..., "to": ...})，
+        此前产出的组件应丢弃；其余产出同 BaseAIService.stream_liuyao_interpretation
+        """
+        model_name = (model_name or cls.DEFAULT_MODEL).lower()
+        if model_name == cls.LOCAL_MODEL:
+            yield "ready", {"source": "local"}
+            a2ui_response = cls._local_interpretation(question, original_hexagram, changed_hexagram, lines)
+            for component in a2ui_response["components"]:
+                yield "component", component
+            yield "done", a2ui_response
+            return
+        
+        cache_key = interpretation_cache.make_key(model_name, question, original_hexagram, changed_hexagram)
+        
+        cached = await cls._get_cached(model_name, cache_key)
+        if cached is not None:
+            yield "ready", {"source": "cache"}
+            a2ui_response = cls._with_question(cached, question)
+            for component in a2ui_response.get("components", []):
+                yield "component", component
+            yield "done", a2ui_response
+            return
+        
+        # 相同请求正在生成中（流式或非流式）时加入该请求，不再通过准入（由发起方负责）
+        shared = cls._single_flight.in_flight(cache_key)
+        if shared:
+            yield "ready", {"source": "shared"}
+        
+        # 上游流式调用在独立的 Task 中运行，事件转发给所有相同请求，调用方断开不影响其他请求；
+        # 发起方的准入被拒时，在 ready 之前抛出 AdmissionRejected
+        components_sent = False
+        async with aclosing(cls._single_flight.stream(
+            cache_key,
+            lambda publish: cls._stream_and_cache(
+                model_name, cache_key, publish, question, original_hexagram, changed_hexagram, lines
+            )
+        )) as events:
+            async for event, data in events:
+                if event == "ready" and shared:
+                    continue
+                if event == "done":
+                    data = cls._with_question(data, question)
+                    # 加入的是非流式请求时没有中间事件，一次性产出全部组件
+                    if not components_sent:
+                        for component in data.get("components", []):
+                            yield "component", component
+                elif event == "component":
+                    components_sent = True
+                yield event, data
+    
+    @classmethod
+    async def _stream_and_cache(
+        cls,
+        model_name: str,
+        cache_key: str,
+        publish: Publish,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> Dict:
+        """
+        按路由策略流式生成解读并写入缓存，事件通过 publish 发布
+        
+        先发布 ("ready", {"source": ...})，再发布各组件；主模型失败时发布
+        ("failover", {"from": 主模型, "to": 备用模型})，再发布备用模型重新生成的组件
+        
+        返回：
+            A2UI 格式的动态 UI 数据
+        """
+        # 先通过主模型的准入检查，被拒时直接抛出；熔断打开时跳过主模型
+        entered = await cls._enter_provider(model_name)
+        publish("ready", {"source": "model" if entered else "fallback"})
+        
+        a2ui_response = None
+        if entered:
+            async with aclosing(cls._stream_provider(model_name, question, original_hexagram, changed_hexagram, lines)) as stream:
+                async for event, data in stream:
+                    if event == "done":
+                        a2ui_response = data
+                    else:
+                        publish(event, data)
+        
+        # 主模型失败时切换到备用模型继续流式生成，前端以 done 中的完整结果为准
+        backup = cls._get_backup(model_name)
+        if (a2ui_response is None or is_fallback(a2ui_response)) and backup:
+            try:
+                backup_entered = await cls._enter_provider(backup)
+            except AdmissionRejected:
+                backup_entered = False
+            if backup_entered:
+                cls._routing_stats["failovers"] += 1
+                # 通知调用方丢弃主模型已产出的组件，之后的组件来自备用模型
+                publish("failover", {"from": model_name, "to": backup})
+                async with aclosing(cls._stream_provider(backup, question, original_hexagram, changed_hexagram, lines)) as stream:
+                    async for event, data in stream:
+                        if event == "done":
+                            if a2ui_response is None or not is_fallback(data):
+                                a2ui_response = data
+                        else:
+                            publish(event, data)
+        
+        if a2ui_response is None:
+            # 主备模型都处于熔断状态
+            FALLBACKS.inc(model=model_name, reason="circuit_open")
+            a2ui_response = cls.get_service(model_name)._generate_fallback_response(
+                question, original_hexagram, changed_hexagram, lines
+            )
+        await cls._cache_response(cache_key, a2ui_response)
+        return a2ui_response
+    
+    @staticmethod
+    def _local_interpretation(
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> Dict:
+        """快速模式的解读"""
+        return build_classic_response(
+            question, original_hexagram, changed_hexagram, lines,
+            generated_by=AIServiceFactory.LOCAL_MODEL,
+            notice="快速模式：未调用 AI，以上依据《周易》经传原文和传统变占规则（朱熹《易学启蒙》）断卦。"
+        )
+    
+    @classmethod
+    async def _generate_and_cache(
+        cls,
+        model_name: str,
+        cache_key: str,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> Dict:
+        """
+        按路由策略生成解读并写入缓存
+        
+        主模型失败（或熔断）时切换到备用模型；开启对冲时，主模型超过 p95 耗时
+        仍未返回则同时请求备用模型，取先返回的有效结果并取消另一个请求
+        """
+        args = (question, original_hexagram, changed_hexagram, lines)
+        backup = cls._get_backup(model_name)
+        tasks = [asyncio.ensure_future(cls._call_provider(model_name, *args))]
+        
+        a2ui_response = None
+        rejection = None
+        hedged = False
+        try:
+            hedge_delay = cls._hedge_delay(model_name) if backup else None
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    hedged = True
+                    cls._routing_stats["hedged"] += 1
+                    tasks.append(asyncio.ensure_future(cls._call_provider(backup, *args)))
+            
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except AdmissionRejected as e:
+                        rejection = rejection or e
+                        continue
+                    if result is not None and (a2ui_response is None or not is_fallback(result)):
+                        a2ui_response = result
+                        if hedged and task is tasks[1] and not is_fallback(result):
+                            cls._routing_stats["hedgeWins"] += 1
+                
+                if a2ui_response is not None and not is_fallback(a2ui_response):
+                    break
+                
+                # 主模型失败且未发出对冲请求时，切换到备用模型
+                if not pending and len(tasks) == 1 and backup:
+                    cls._routing_stats["failovers"] += 1
+                    tasks.append(asyncio.ensure_future(cls._call_provider(backup, *args)))
+                    pending = {tasks[1]}
+        finally:
+            # 取消未完成的请求（对冲中较慢的一方）
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        
+        if a2ui_response is None:
+            if rejection is not None:
+                raise rejection
+            FALLBACKS.inc(model=model_name, reason="circuit_open")
+            a2ui_response = cls.get_service(model_name)._generate_fallback_response(*args)
+        
+        await cls._cache_response(cache_key, a2ui_response)
+        return a2ui_response
+    
+    @classmethod
+    async def _get_cached(cls, model_name: str, cache_key: str) -> Optional[Dict]:
+        """读取解读缓存，并记录命中情况和耗时"""
+        started = time.perf_counter()
+        cached = await interpretation_cache.get(cache_key)
+        observe_stage("cache", model_name, started)
+        CACHE_REQUESTS.inc(model=model_name, result="miss" if cached is None else "hit")
+        return cached
+    
+    @classmethod
+    async def _enter_provider(cls, model_name: str) -> bool:
+        """
+        通过模型的熔断和准入检查
+        
+        返回：
+            是否可以调用该模型，熔断打开时为 False；通过后须由调用方归还准入许可
+        
+        异常：
+            AdmissionRejected: 准入被拒
+        """
+        breaker = cls.get_breaker(model_name)
+        if cls.get_service(model_name).is_configured() and not breaker.allow_request():
+            return False
+        
+        started = time.perf_counter()
+        try:
+            await cls.get_admission(model_name).acquire(deadline.get_deadline())
+        except BaseException:
+            breaker.abandon()
+            raise
+        observe_stage("admission", model_name, started)
+        return True
+    
+    @classmethod
+    async def _call_provider(
+        cls,
+        model_name: str,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> Optional[Dict]:
+        """调用单个模型生成解读，熔断打开时返回 None"""
+        if not await cls._enter_provider(model_name):
+            return None
+        
+        started = time.perf_counter()
+        try:
+            a2ui_response = await cls.get_service(model_name).generate_liuyao_interpretation(
+                question=question,
+                original_hexagram=original_hexagram,
+                changed_hexagram=changed_hexagram,
+                lines=lines
+            )
+        except BaseException:
+            cls.get_breaker(model_name).abandon()
+            raise
+        finally:
+            cls.get_admission(model_name).release()
+        
+        cls._record_outcome(model_name, a2ui_response, started)
+        return a2ui_response
+    
+    @classmethod
+    async def _stream_provider(
+        cls,
+        model_name: str,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """流式调用单个模型（须先通过 _enter_provider），结束或被关闭时归还准入许可"""
+        started = time.perf_counter()
+        recorded = False
+        try:
+            async with aclosing(cls.get_service(model_name).stream_liuyao_interpretation(
+                question=question,
+                original_hexagram=original_hexagram,
+                changed_hexagram=changed_hexagram,
+                lines=lines
+            )) as stream:
+                async for event, data in stream:
+                    if event == "done":
+                        cls._record_outcome(model_name, data, started)
+                        recorded = True
+                    yield event, data
+        finally:
+            cls._leave_provider(model_name, recorded)
+    
+    @classmethod
+    def _leave_provider(cls, model_name: str, recorded: bool = False):
+        """归还 _enter_provider 取得的准入许可；调用没有结果时同时让出熔断器的试探名额"""
+        cls.get_admission(model_name).release()
+        if not recorded:
+            cls.get_breaker(model_name).abandon()
+    
+    @classmethod
+    def _record_outcome(cls, model_name: str, a2ui_response: Dict, started: float):
+        """报告上游调用结果：计入熔断器，成功时计入耗时样本（未配置 API key 的回退不计入）"""
+        if not cls.get_service(model_name).is_configured():
+            return
+        
+        latency_ms = (time.perf_counter() - started) * 1000
+        success = not is_fallback(a2ui_response)
+        cls.get_breaker(model_name).record(success, latency_ms)
+        if success:
+            cls._latencies.setdefault(model_name, LatencyTracker()).add(latency_ms)
+    
+    @classmethod
+    def _get_backup(cls, model_name: str) -> Optional[str]:
+        """可切换的备用模型（需已配置且未熔断），没有时返回 None"""
+        if not cls.FAILOVER_ENABLED:
+            return None
+        
+        backup = cls._backup_models.get(model_name)
+        if backup and cls.get_service(backup).is_configured() and cls.get_breaker(backup).available():
+            return backup
+        return None
+    
+    @classmethod
+    def _hedge_delay(cls, model_name: str) -> Optional[float]:
+        """对冲请求的触发时间（秒），未开启对冲或耗时样本不足时返回 None"""
+        if not cls.HEDGE_ENABLED:
+            return None
+        
+        tracker = cls._latencies.get(model_name)
+        if tracker is None or len(tracker) < cls.HEDGE_MIN_SAMPLES:
+            return None
+        return max(tracker.percentile(cls.HEDGE_PERCENTILE) / 1000, cls.HEDGE_MIN_DELAY)
+    
+    @classmethod
+    def get_single_flight_stats(cls) -> Dict:
+        """请求合并统计"""
+        return cls._single_flight.stats()
+    
+    @classmethod
+    def get_admission_stats(cls) -> Dict:
+        """各模型的准入统计"""
+        return {name: cls.get_admission(name).stats() for name in cls._services}
+    
+    @classmethod
+    def get_breaker_stats(cls) -> Dict:
+        """各模型的熔断器状态"""
+        return {name: cls.get_breaker(name).stats() for name in cls._services}
+    
+    @classmethod
+    def get_routing_stats(cls) -> Dict:
+        """失败切换和对冲请求统计"""
+        return {
+            "failoverEnabled": cls.FAILOVER_ENABLED,
+            "hedgeEnabled": cls.HEDGE_ENABLED,
+            **cls._routing_stats
+        }
+    
+    @staticmethod
+    async def _cache_response(cache_key: str, a2ui_response: Dict):
+        """缓存模型生成的解读（回退响应不缓存）"""
+        if not is_fallback(a2ui_response):
+            await interpretation_cache.set(cache_key, a2ui_response)
+    
+    @staticmethod
+    def _with_question(a2ui_response: Dict, question: str) -> Dict:
+        """缓存按规范化问题命中，返回前把 data、metadata 中的问题换回本次请求的原始问题"""
+        result = dict(a2ui_response)
+        result["data"] = {**a2ui_response.get("data", {}), "question": question}
+        if "metadata" in a2ui_response:
+            result["metadata"] = {**a2ui_response["metadata"], "question": question}
+        return result
+    
     @classmethod
     def get_available_models(cls) -> List[Dict]:
         """
@@ -101,5 +620,6 @@ class AIServiceFactory:
         返回：
             是否有效
         """
-        return model_name.lower() in cls._services
+        model_name = model_name.lower()
+        return model_name in cls._services or model_name == cls.LOCAL_MODEL
 
@@ -3,224 +3,46 @@ AI 服务基类
 
 定义 AI 服务的通用接口，支持多模型切换
 """
+import asyncio
+import hashlib
 import os
-import json
+import sys
+import time
+import uuid
 from abc import ABC, abstractmethod
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+from app.services import deadline
+from app.services.a2ui_stream import A2UIStreamParser
+from app.services.classic_interpretation import build_classic_response
+from app.services.http_client import get_http_client
+from app.services.interaction_logger import interaction_log_writer
+from app.services.metrics import FALLBACKS, STAGE_SECONDS, UPSTREAM_TOKENS, observe_stage
+from app.services.retry import backoff_delay, retry_budget
 
 
 class BaseAIService(ABC):
     """AI 服务基类"""
     
     # 日志目录
-    LOG_DIR = Path(__file__).parent.parent.parent / "logs" / "ai_interactions"
+    LOG_DIR = Path(os.getenv("AI_INTERACTION_LOG_DIR") or Path(__file__).parent.parent.parent / "logs" / "ai_interactions")
     
     # 模型名称（子类需要设置）
     MODEL_NAME = "unknown"
     MODEL_DISPLAY_NAME = "未知模型"
     
-    def __init__(self):
-        """初始化服务"""
-        self.LOG_DIR.mkdir(parents=True, exist_ok=True)
-    
-    @abstractmethod
-    async def generate_liuyao_interpretation(
-        self,
-        question: str,
-        original_hexagram: Dict,
-        changed_hexagram: Optional[Dict],
-        lines: list
-    ) -> Dict:
-        """
-        生成六爻占卜的 AI 解读，返回 A2UI 格式
-        
-        参数：
-            question: 用户的问题
-            original_hexagram: 本卦信息
-            changed_hexagram: 变卦信息（可选）
-            lines: 六爻详情
-        
-        返回：
-            A2UI 格式的动态 UI 数据
-        """
-        pass
+    # 预热时建立连接的上游地址（子类设置），为空时只创建客户端
+    WARM_UP_URL = ""
+    # 预热连接的超时（秒）
+    WARM_UP_TIMEOUT = float(os.getenv("AI_WARMUP_TIMEOUT", "3"))
     
-    def _save_interaction_log(
-        self,
-        question: str,
-        original_hexagram: Dict,
-        changed_hexagram: Optional[Dict],
-        lines: list,
-        prompt: str,
-        raw_response: str,
-        parsed_sections: Dict,
-        a2ui_response: Dict,
-        success: bool,
-        error_message: str = None
-    ):
-        """
-        保存 AI 交互日志为 Markdown 文件
-        """
-        timestamp = datetime.now()
-        log_filename = timestamp.strftime("%Y%m%d_%H%M%S") + f"_{original_hexagram.get('name', 'unknown')}_{self.MODEL_NAME}.md"
-        log_path = self.LOG_DIR / log_filename
-        
-        # 构建 Markdown 内容
-        md_content = f"""# AI 交互日志
-
-## 元信息
-
-| 项目 | 内容 |
-|------|------|
-| **时间** | {timestamp.strftime("%Y年%m月%d日 %H:%M:%S")} |
-| **状态** | {"✅ 成功" if success else "❌ 失败"} |
-| **模型** | {self.MODEL_DISPLAY_NAME} |
-| **卦名** | {original_hexagram.get("name", "未知")} |
-{"| **错误信息** | " + error_message + " |" if error_message else ""}
-
----
-
-## 输入参数
-
-### 用户问题
-
-> {question}
-
-### 本卦信息
-
-| 项目 | 内容 |
-|------|------|
-| **卦名** | {original_hexagram.get("name")} |
-| **卦序** | 第 {original_hexagram.get("number")} 卦 |
-| **卦辞** | {original_hexagram.get("judgment")} |
-| **上卦** | {original_hexagram.get("upperTrigram", {}).get("name")}（{original_hexagram.get("upperTrigram", {}).get("symbol")}）- {original_hexagram.get("upperTrigram", {}).get("nature")} |
-| **下卦** | {original_hexagram.get("lowerTrigram", {}).get("name")}（{original_hexagram.get("lowerTrigram", {}).get("symbol")}）- {original_hexagram.get("lowerTrigram", {}).get("nature")} |
-
-"""
-        
-        # 变卦信息（如果有）
-        if changed_hexagram:
-            md_content += f"""### 变卦信息
-
-| 项目 | 内容 |
-|------|------|
-| **卦名** | {changed_hexagram.get("name")} |
-| **卦序** | 第 {changed_hexagram.get("number")} 卦 |
-| **卦辞** | {changed_hexagram.get("judgment")} |
-
-"""
-        
-        # 六爻详情
-        md_content += """### 六爻详情
-
-| 位置 | 名称 | 符号 | 变爻 |
-|------|------|------|------|
-"""
-        for line in lines:
-            changing_mark = "🔄 是" if line.get("changing") else "否"
-            md_content += f"| {line.get('positionName')} | {line.get('name')} | {line.get('symbol')} | {changing_mark} |\n"
-        
-        # Prompt
-        md_content += f"""
-### 发送给 {self.MODEL_DISPLAY_NAME} 的 Prompt
-
-```
-{prompt}
-```
-
----
-
-## 输出结果
-
-### {self.MODEL_DISPLAY_NAME} 原始响应
-
-```
-{raw_response}
-```
-
-### 解析后的内容
-
-"""
-        
-        # 解析后的 sections
-        for title, content in parsed_sections.items():
-            md_content += f"""#### {title}
-
-{content}
-
-"""
-        
-        # A2UI Response（JSON 格式）
-        md_content += f"""### A2UI Response (JSON)
-
-```json
-{json.dumps(a2ui_response, ensure_ascii=False, indent=2)}
-```
-
----
-
-*日志生成时间: {timestamp.isoformat()}*
-"""
-        
-        try:
-            with open(log_path, "w", encoding="utf-8") as f:
-                f.write(md_content)
-            print(f"[LOG] AI 交互日志已保存: {log_path}")
-        except Exception as e:
-            print(f"[ERROR] 保存 AI 交互日志失败: {e}")
-    
-    def _build_a2ui_prompt(
-        self,
-        question: str,
-        original_hexagram: Dict,
-        changed_hexagram: Optional[Dict],
-        lines: list
-    ) -> str:
-        """
-        构建 A2UI 格式的 Prompt
-        
-        让 AI 直接输出 A2UI 声明式 JSON 格式
-        """
-        
-        # 构建变爻信息
-        changing_lines = [line for line in lines if line.get("changing")]
-        changing_info = ""
-        if changing_lines:
-            changing_positions = [line["positionName"] for line in changing_lines]
-            changing_info = f"变爻位置：{', '.join(changing_positions)}"
-        
-        # 构建变卦信息
-        changed_info = ""
-        if changed_hexagram:
-            changed_info = f"""
-变卦：{changed_hexagram['name']}
-变卦卦辞：{changed_hexagram.get('judgment', '')}
-"""
-        
-        # 六爻信息
-        lines_info = "\n".join([
-            f"{'初' if i == 0 else ['二', '三', '四', '五', '上'][i-1] if i < 6 else ''}爻：{lines[i]['name']}（{lines[i]['symbol']}）{'【变爻】' if lines[i]['changing'] else ''}"
-            for i in range(6)
-        ])
-        
-        prompt = f"""你是一位精通周易的占卜大师。请为求卦者解读卦象，并直接输出 A2UI 格式的 JSON。
-
-## 卦象信息
-
-**求卦者的问题**：{question}
-
-**本卦**：{original_hexagram['name']}
-**卦辞**：{original_hexagram.get('judgment', '')}
-**上卦**：{original_hexagram['upperTrigram']['name']}（{original_hexagram['upperTrigram']['symbol']}，{original_hexagram['upperTrigram']['nature']}）
-**下卦**：{original_hexagram['lowerTrigram']['name']}（{original_hexagram['lowerTrigram']['symbol']}，{original_hexagram['lowerTrigram']['nature']}）
-
-**六爻详情**：
-{lines_info}
-
-{changing_info}
-{changed_info}
+    # A2UI Prompt 静态前缀：角色、输出要求和 JSON 示例，不含任何请求相关内容，
+    # 每次请求逐字节相同，上游的前缀缓存（DeepSeek 上下文硬盘缓存、Gemini 隐式缓存）可以命中
+    A2UI_PROMPT_PREFIX = """你是一位精通周易的占卜大师。请为求卦者解读卦象，并直接输出 A2UI 格式的 JSON。
 
 ## A2UI 输出要求
 
@@ -231,82 +53,82 @@ class BaseAIService(ABC):
 4. 每个 card 的内容要详细，不要太简短
 
 ```json
-{{
+{
   "version": "1.0",
   "root": "interpretation-root",
   "components": [
-    {{
+    {
       "id": "card-overview",
       "type": "card",
-      "props": {{
+      "props": {
         "title": "📖 卦象总论",
         "variant": "elevated"
-      }},
+      },
       "children": ["text-overview"]
-    }},
-    {{
+    },
+    {
       "id": "text-overview",
       "type": "text",
-      "props": {{
+      "props": {
         "content": "这里写2-3段话，解释这个卦的核心含义，打个比喻让人容易理解。比如这个卦就像是...",
         "variant": "body"
-      }}
-    }},
-    {{
+      }
+    },
+    {
       "id": "card-interpretation",
       "type": "card",
-      "props": {{
+      "props": {
         "title": "🔮 直白解读",
         "variant": "default"
-      }},
+      },
       "children": ["text-interpretation"]
-    }},
-    {{
+    },
+    {
       "id": "text-interpretation",
       "type": "text",
-      "props": {{
-        "content": "针对'{question}'这个问题：\\n\\n1. 目前情况：...\\n2. 事情发展：...\\n3. 最终结果：...\\n4. 具体分析：...\\n\\n用大白话，至少200字。",
+      "props": {
+        "content": "针对求卦者的问题：\\n\\n1. 目前情况：...\\n2. 事情发展：...\\n3. 最终结果：...\\n4. 具体分析：...\\n\\n用大白话，至少200字。",
         "variant": "body"
-      }}
-    }},
-    {{
+      }
+    },
+    {
       "id": "card-fortune",
       "type": "card",
-      "props": {{
+      "props": {
         "title": "⚖️ 吉凶判断",
         "variant": "highlighted"
-      }},
+      },
       "children": ["badge-fortune", "text-fortune-reason"]
-    }},
-    {{
+    },
+    {
       "id": "badge-fortune",
       "type": "badge",
-      "props": {{
+      "props": {
         "label": "吉/凶/中吉/小凶等",
         "color": "根据吉凶选择：success/warning/error/info"
-      }}
-    }},
-    {{
+      }
+    },
+    {
       "id": "text-fortune-reason",
       "type": "text",
-      "props": {{
+      "props": {
         "content": "一句话解释为什么是这个吉凶判断",
         "variant": "caption"
-      }}
-    }},
-    {{
+      }
+    },
+    {
       "id": "card-advice",
       "type": "card",
-      "props": {{
+      "props": {
         "title": "💡 具体建议",
         "variant": "default"
-      }},
+      },
       "children": ["list-advice"]
-    }},
-    {{
+    },
+    {
       "id": "list-advice",
       "type": "list",
-      "props": {{
+      "props": {
         "items": [
           "建议1：具体可操作的建议",
           "建议2：什么时候做比较好",
@@ -314,80 +136,415 @@ class BaseAIService(ABC):
           "建议4：不应该做什么"
         ],
         "ordered": true
-      }}
-    }},
-    {{
+      }
+    },
+    {
       "id": "card-warning",
       "type": "card",
-      "props": {{
+      "props": {
         "title": "⚠️ 特别提醒",
         "variant": "warning"
-      }},
+      },
       "children": ["text-warning"]
-    }},
-    {{
+    },
+    {
       "id": "text-warning",
       "type": "text",
-      "props": {{
+      "props": {
         "content": "需要特别注意的陷阱或风险，什么事情千万不能做",
         "variant": "body"
-      }}
-    }}
+      }
+    }
   ],
-  "metadata": {{
-    "hexagramName": "{original_hexagram['name']}",
-    "question": "{question}",
-    "generatedBy": "{self.MODEL_NAME}"
-  }}
-}}
+  "metadata": {
+    "hexagramName": "本卦卦名"
+  }
+}
 ```
 
-请根据卦象信息，生成完整的 A2UI JSON。内容要丰富、接地气，像有经验的长辈在分析问题。
 """
-        return prompt
+    # A2UI Prompt 动态后缀模板（变量见 build_prompt_variables），问题只出现在这里，不进入 JSON 示例
+    A2UI_PROMPT_SUFFIX_TEMPLATE = """
+## 卦象信息
+
+**求卦者的问题**：{question}
+
+**本卦**：{hexagram_name}
+**卦辞**：{judgment}
+**上卦**：{upper_name}（{upper_symbol}，{upper_nature}）
+**下卦**：{lower_name}（{lower_symbol}，{lower_nature}）
+
+**六爻详情**：
+{lines_info}
+
+{changing_info}
+{changed_info}
+
+请根据以上卦象信息，按上面的格式生成完整的 A2UI JSON。内容要丰富、接地气，像有经验的长辈在分析问题。
+"""
+    # 完整模板（静态前缀转义花括号后拼接动态后缀），交互日志据此还原 Prompt
+    A2UI_PROMPT_TEMPLATE = A2UI_PROMPT_PREFIX.replace("{", "{{").replace("}", "}}") + A2UI_PROMPT_SUFFIX_TEMPLATE
+    # 模板 hash，交互日志以此引用模板而不重复保存全文
+    A2UI_PROMPT_TEMPLATE_HASH = hashlib.sha256(A2UI_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:16]
     
-    def _parse_a2ui_response(
+    def __init__(self):
+        """初始化服务"""
+        self.LOG_DIR.mkdir(parents=True, exist_ok=True)
+    
+    @abstractmethod
+    async def generate_liuyao_interpretation(
         self,
-        raw_response: str,
         question: str,
         original_hexagram: Dict,
         changed_hexagram: Optional[Dict],
         lines: list
     ) -> Dict:
         """
-        解析 AI 直接生成的 A2UI JSON
+        生成六爻占卜的 AI 解读，返回 A2UI 格式
+        
+        参数：
+            question: 用户的问题
+            original_hexagram: 本卦信息
+            changed_hexagram: 变卦信息（可选）
+            lines: 六爻详情
+        
+        返回：
+            A2UI 格式的动态 UI 数据
+        """
+        pass
+    
+    @abstractmethod
+    def is_configured(self) -> bool:
+        """是否已配置 API key，未配置时使用回退响应"""
+        pass
+    
+    async def warm_up(self):
+        """提前与上游完成连接和 TLS 握手，连接留在共享连接池中供首个请求复用；失败不影响服务"""
+        if not self.is_configured() or not self.WARM_UP_URL:
+            return
+        try:
+            await get_http_client().head(self.WARM_UP_URL, timeout=self.WARM_UP_TIMEOUT)
+        except httpx.HTTPError as e:
+            print(f"[WARN] {self.MODEL_DISPLAY_NAME} 预热连接失败: {type(e).__name__}")
+    
+    @abstractmethod
+    def _stream_completion(self, prompt: str) -> AsyncIterator[str]:
         """
-        import re
+        流式调用模型（子类实现为异步生成器）
         
-        # 尝试从响应中提取 JSON
-        json_str = raw_response.strip()
+        产出：
+            模型逐块生成的文本
+        """
+        pass
+    
+    async def _stream_with_retry(self, prompt: str) -> AsyncIterator[str]:
+        """
+        流式调用模型
         
-        # 移除可能的 markdown 代码块标记
-        if json_str.startswith("```json"):
-            json_str = json_str[7:]
-        elif json_str.startswith("```"):
-            json_str = json_str[3:]
+        收到首块文本前的可恢复错误按重试策略重试（已输出的内容无法撤回，之后不再重试），
+        等待每块文本的时间不超过请求截止时间
+        """
+        retry_budget.deposit()
+        attempt = 0
+        while True:
+            received = False
+            stream = self._stream_completion(prompt)
+            try:
+                while True:
+                    try:
+                        async with asyncio.timeout(deadline.remaining()):
+                            chunk = await anext(stream)
+                    except StopAsyncIteration:
+                        return
+                    except TimeoutError as e:
+                        if deadline.remaining() == 0:
+                            raise TimeoutError(f"{self.MODEL_DISPLAY_NAME} 流式调用超过请求截止时间") from e
+                        raise
+                    received = True
+                    yield chunk
+            except Exception as e:
+                delay = None if received else backoff_delay(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                print(f"[RETRY] {self.MODEL_DISPLAY_NAME} 流式调用失败（{type(e).__name__}），{delay:.2f} 秒后第 {attempt} 次重试")
+                await asyncio.sleep(delay)
+            finally:
+                await stream.aclose()
+    
+    async def stream_liuyao_interpretation(
+        self,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        流式生成六爻占卜的 AI 解读
         
-        if json_str.endswith("```"):
-            json_str = json_str[:-3]
+        产出：
+            ("component", 组件)：模型输出中每闭合一个 A2UI 组件即产出
+            ("done", A2UI 数据)：最后产出完整结果，失败时为回退响应，以此为准
+        """
+        prompt = ""
+        raw_chunks = []
+        started = time.perf_counter()
         
-        json_str = json_str.strip()
+        if not self.is_configured():
+            a2ui_response = self._generate_fallback_response(question, original_hexagram, changed_hexagram, lines)
+            self._save_interaction_log(
+                question=question,
+                original_hexagram=original_hexagram,
+                changed_hexagram=changed_hexagram,
+                lines=lines,
+                prompt=f"[{self.MODEL_DISPLAY_NAME} API 未配置，使用回退响应]",
+                raw_response="[回退响应]",
+                parsed_sections={},
+                a2ui_response=a2ui_response,
+                success=True,
+                error_message=f"{self.MODEL_DISPLAY_NAME} API key 未配置"
+            )
+            FALLBACKS.inc(model=self.MODEL_NAME, reason="not_configured")
+            yield "done", a2ui_response
+            return
         
-        # 尝试解析 JSON
         try:
-            a2ui_data = json.loads(json_str)
-        except json.JSONDecodeError as e:
-            print(f"JSON 解析失败: {e}")
-            # 尝试用正则表达式提取 JSON 对象
-            json_match = re.search(r'\{[\s\S]*\}', raw_response)
-            if json_match:
-                try:
-                    a2ui_data = json.loads(json_match.group())
-                except json.JSONDecodeError:
-                    raise ValueError(f"无法解析 AI 返回的 A2UI JSON: {raw_response[:500]}")
-            else:
-                raise ValueError(f"AI 响应中未找到有效的 JSON: {raw_response[:500]}")
+            prompt = self._build_a2ui_prompt(question, original_hexagram, changed_hexagram, lines)
+            stage_started = observe_stage("prompt_build", self.MODEL_NAME, started)
+            
+            # 流式输出边接收边解析，上游等待和解析合计为 upstream 阶段
+            parser = A2UIStreamParser()
+            async for chunk in self._stream_with_retry(prompt):
+                raw_chunks.append(chunk)
+                for component in parser.feed(chunk):
+                    yield "component", component
+            observe_stage("upstream", self.MODEL_NAME, stage_started)
+            
+            a2ui_response = self._complete_a2ui_response(
+                a2ui_data=parser.close(),
+                question=question,
+                original_hexagram=original_hexagram,
+                changed_hexagram=changed_hexagram,
+                lines=lines
+            )
+            
+            self._save_interaction_log(
+                question=question,
+                original_hexagram=original_hexagram,
+                changed_hexagram=changed_hexagram,
+                lines=lines,
+                prompt=prompt,
+                raw_response="".join(raw_chunks),
+                parsed_sections=self._extract_sections_from_a2ui(a2ui_response),
+                a2ui_response=a2ui_response,
+                success=True,
+                latency_ms=(time.perf_counter() - started) * 1000
+            )
+        except Exception as e:
+            error_msg = str(e)
+            print(f"{self.MODEL_DISPLAY_NAME} 流式调用失败: {error_msg}")
+            FALLBACKS.inc(model=self.MODEL_NAME, reason=self._fallback_reason(e, "".join(raw_chunks)))
+            
+            a2ui_response = self._generate_fallback_response(question, original_hexagram, changed_hexagram, lines)
+            self._save_interaction_log(
+                question=question,
+                original_hexagram=original_hexagram,
+                changed_hexagram=changed_hexagram,
+                lines=lines,
+                prompt=prompt,
+                raw_response="".join(raw_chunks),
+                parsed_sections={},
+                a2ui_response=a2ui_response,
+                success=False,
+                error_message=error_msg,
+                latency_ms=(time.perf_counter() - started) * 1000
+            )
+        
+        yield "done", a2ui_response
+    
+    def _save_interaction_log(
+        self,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list,
+        prompt: str,
+        raw_response: str,
+        parsed_sections: Dict,
+        a2ui_response: Dict,
+        success: bool,
+        error_message: str = None,
+        latency_ms: Optional[float] = None
+    ):
+        """
+        保存 AI 交互日志（放入后台写入队列，不阻塞请求）
+        """
+        with STAGE_SECONDS.time(stage="log_write", model=self.MODEL_NAME):
+            self._submit_interaction_log(
+                question, original_hexagram, changed_hexagram, lines, prompt, raw_response,
+                parsed_sections, a2ui_response, success, error_message, latency_ms
+            )
+    
+    def _submit_interaction_log(
+        self,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list,
+        prompt: str,
+        raw_response: str,
+        parsed_sections: Dict,
+        a2ui_response: Dict,
+        success: bool,
+        error_message: Optional[str],
+        latency_ms: Optional[float]
+    ):
+        interaction_log_writer.submit({
+            "id": uuid.uuid4().hex,
+            "timestamp": datetime.now(),
+            "log_dir": self.LOG_DIR,
+            "model_name": self.MODEL_NAME,
+            "model_display_name": self.MODEL_DISPLAY_NAME,
+            "question": question,
+            "original_hexagram": original_hexagram,
+            "changed_hexagram": changed_hexagram,
+            "lines": lines,
+            "prompt": prompt,
+            "prompt_template": self.A2UI_PROMPT_TEMPLATE,
+            "prompt_template_hash": self.A2UI_PROMPT_TEMPLATE_HASH,
+            "raw_response": raw_response,
+            "parsed_sections": parsed_sections,
+            "a2ui_response": a2ui_response,
+            "success": success,
+            "error_message": error_message,
+            "latency_ms": latency_ms
+        })
+    
+    def _record_usage(
+        self,
+        prompt_tokens: Optional[int],
+        completion_tokens: Optional[int],
+        cached_tokens: Optional[int] = None
+    ):
+        """记录上游返回的 token 用量（cached_tokens 为命中前缀缓存的输入 token，包含在 prompt_tokens 中）"""
+        if prompt_tokens:
+            UPSTREAM_TOKENS.inc(prompt_tokens, model=self.MODEL_NAME, type="prompt")
+        if cached_tokens:
+            UPSTREAM_TOKENS.inc(cached_tokens, model=self.MODEL_NAME, type="prompt_cached")
+        if completion_tokens:
+            UPSTREAM_TOKENS.inc(completion_tokens, model=self.MODEL_NAME, type="completion")
+    
+    @staticmethod
+    def _fallback_reason(error: Exception, raw_response: str) -> str:
+        """
+        回退原因（用于指标）
+        
+        返回：
+            timeout: 超时；parse_error: 已收到模型输出但无法解析；upstream_error: 其他上游错误
+        """
+        if isinstance(error, (TimeoutError, httpx.TimeoutException)):
+            return "timeout"
+        # openai 只在首次使用 DeepSeek 时导入，未导入时异常不可能来自它
+        openai = sys.modules.get("openai")
+        if openai is not None and isinstance(error, openai.APITimeoutError):
+            return "timeout"
+        if raw_response:
+            return "parse_error"
+        return "upstream_error"
+    
+    @classmethod
+    def build_prompt_variables(
+        cls,
+        model_name: str,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> Dict[str, str]:
+        """构建 A2UI Prompt 模板的变量（日志可据此和模板 hash 还原完整 Prompt）"""
+        # 构建变爻信息
+        changing_lines = [line for line in lines if line.get("changing")]
+        changing_info = ""
+        if changing_lines:
+            changing_positions = [line["positionName"] for line in changing_lines]
+            changing_info = f"变爻位置：{', '.join(changing_positions)}"
+        
+        # 构建变卦信息
+        changed_info = ""
+        if changed_hexagram:
+            changed_info = f"""
+变卦：{changed_hexagram['name']}
+变卦卦辞：{changed_hexagram.get('judgment', '')}
+"""
         
+        # 六爻信息
+        lines_info = "\n".join([
+            f"{'初' if i == 0 else ['二', '三', '四', '五', '上'][i-1] if i < 6 else ''}爻：{lines[i]['name']}（{lines[i]['symbol']}）{'【变爻】' if lines[i]['changing'] else ''}"
+            for i in range(6)
+        ])
+        
+        return {
+            "question": question,
+            "hexagram_name": original_hexagram['name'],
+            "judgment": original_hexagram.get('judgment', ''),
+            "upper_name": original_hexagram['upperTrigram']['name'],
+            "upper_symbol": original_hexagram['upperTrigram']['symbol'],
+            "upper_nature": original_hexagram['upperTrigram']['nature'],
+            "lower_name": original_hexagram['lowerTrigram']['name'],
+            "lower_symbol": original_hexagram['lowerTrigram']['symbol'],
+            "lower_nature": original_hexagram['lowerTrigram']['nature'],
+            "lines_info": lines_info,
+            "changing_info": changing_info,
+            "changed_info": changed_info,
+            "model_name": model_name
+        }
+    
+    def _build_a2ui_prompt(
+        self,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> str:
+        """
+        构建 A2UI 格式的 Prompt
+        
+        让 AI 直接输出 A2UI 声明式 JSON 格式。Prompt 由预先构建的静态前缀和只含本次卦象的后缀拼接而成
+        """
+        return self.A2UI_PROMPT_PREFIX + self.A2UI_PROMPT_SUFFIX_TEMPLATE.format(
+            **self.build_prompt_variables(self.MODEL_NAME, question, original_hexagram, changed_hexagram, lines)
+        )
+    
+    def _parse_a2ui_response(
+        self,
+        raw_response: str,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> Dict:
+        """
+        解析 AI 直接生成的 A2UI JSON
+        
+        使用增量解析器单遍扫描，自动跳过代码块标记，输出被截断时尝试修复
+        """
+        parser = A2UIStreamParser()
+        parser.feed(raw_response)
+        a2ui_data = parser.close()
+        if parser.repaired:
+            print(f"[WARN] {self.MODEL_DISPLAY_NAME} 输出不完整，已自动修复 JSON")
+        
+        return self._complete_a2ui_response(a2ui_data, question, original_hexagram, changed_hexagram, lines)
+    
+    def _complete_a2ui_response(
+        self,
+        a2ui_data: Dict,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict],
+        lines: list
+    ) -> Dict:
+        """为模型生成的 A2UI 数据补充卦象数据和元信息"""
         # 补充卦象数据（前端需要用来展示卦象图形）
         if "data" not in a2ui_data:
             a2ui_data["data"] = {}
@@ -400,12 +557,16 @@ class BaseAIService(ABC):
         # 标记这是真正的 A2UI 响应
         if "metadata" not in a2ui_data:
             a2ui_data["metadata"] = {}
+        # 卦名和问题以服务端为准，Prompt 的 JSON 示例中不再包含
+        a2ui_data["metadata"]["hexagramName"] = original_hexagram["name"]
+        a2ui_data["metadata"]["question"] = question
         a2ui_data["metadata"]["generatedBy"] = self.MODEL_NAME
         a2ui_data["metadata"]["isNativeA2UI"] = True
         
         return a2ui_data
     
-    def _extract_sections_from_a2ui(self, a2ui_response: Dict) -> Dict[str, str]:
+    @staticmethod
+    def _extract_sections_from_a2ui(a2ui_response: Dict) -> Dict[str, str]:
         """从 A2UI 组件中提取 sections 用于日志记录"""
         sections = {}
         components = a2ui_response.get("components", [])
@@ -445,79 +606,11 @@ class BaseAIService(ABC):
         changed_hexagram: Optional[Dict],
         lines: list
     ) -> Dict:
-        """生成回退响应（当 API 调用失败时使用）"""
-        upper_nature = original_hexagram['upperTrigram']['nature']
-        lower_nature = original_hexagram['lowerTrigram']['nature']
-        hexagram_name = original_hexagram['name']
-        judgment = original_hexagram.get('judgment', '')
-        
-        return {
-            "version": "1.0",
-            "root": "fallback-root",
-            "components": [
-                {
-                    "id": "card-overview",
-                    "type": "card",
-                    "props": {
-                        "title": "📖 卦象总论",
-                        "variant": "elevated"
-                    },
-                    "children": ["text-overview"]
-                },
-                {
-                    "id": "text-overview",
-                    "type": "text",
-                    "props": {
-                        "content": f"您所得之卦为「{hexagram_name}」。上卦为{original_hexagram['upperTrigram']['name']}，代表{upper_nature}；下卦为{original_hexagram['lowerTrigram']['name']}，代表{lower_nature}。卦辞：{judgment}",
-                        "variant": "body"
-                    }
-                },
-                {
-                    "id": "card-fortune",
-                    "type": "card",
-                    "props": {
-                        "title": "⚖️ 吉凶判断",
-                        "variant": "highlighted"
-                    },
-                    "children": ["badge-fortune"]
-                },
-                {
-                    "id": "badge-fortune",
-                    "type": "badge",
-                    "props": {
-                        "label": "待解读",
-                        "color": "info"
-                    }
-                },
-                {
-                    "id": "card-warning",
-                    "type": "card",
-                    "props": {
-                        "title": "⚠️ 提示",
-                        "variant": "warning"
-                    },
-                    "children": ["text-warning"]
-                },
-                {
-                    "id": "text-warning",
-                    "type": "text",
-                    "props": {
-                        "content": "AI 服务暂时不可用，显示基础卦象信息。请稍后重试获取详细解读。",
-                        "variant": "body"
-                    }
-                }
-            ],
-            "data": {
-                "question": question,
-                "originalHexagram": original_hexagram,
-                "changedHexagram": changed_hexagram,
-                "lines": lines
-            },
-            "metadata": {
-                "hexagramName": hexagram_name,
-                "question": question,
-                "generatedBy": "fallback",
-                "isNativeA2UI": False
-            }
-        }
+        """生成回退响应（当 API 调用失败时使用）：依据经传原文和传统占法断卦"""
+        return build_classic_response(
+            question, original_hexagram, changed_hexagram, lines,
+            generated_by="fallback",
+            notice="AI 服务暂时不可用，以上为依据《周易》经传原文的基础解读。请稍后重试获取详细解读。",
+            warning=True
+        )
 
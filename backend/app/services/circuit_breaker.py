@@ -0,0 +1,156 @@
+"""
+AI 服务熔断器
+
+每个模型一个熔断器，按滚动时间窗口统计调用的失败率和慢调用率：
+- closed（关闭）：正常放行，窗口内失败率或慢调用率超过阈值时打开
+- open（打开）：不再调用上游，直接短路到回退响应，冷却期过后转为半开
+- half_open（半开）：放行少量试探调用，全部成功则关闭，任一失败则重新打开
+"""
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+
+class CircuitBreaker:
+    """单个模型的熔断器"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60.0,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_ms: float = 60000.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._trials = 0  # 半开状态下已放行、尚未返回的试探调用数
+        self._trial_successes = 0
+        # 窗口内的调用结果：(时间, 是否成功, 耗时毫秒)
+        self._window: Deque[Tuple[float, bool, float]] = deque()
+        
+        # 统计计数
+        self.short_circuited = 0
+        self.opened = 0
+    
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        """根据环境变量创建，如 GEMINI_BREAKER_FAILURE_RATE、GEMINI_BREAKER_OPEN_SECONDS"""
+        prefix = f"{name.upper()}_BREAKER"
+        return cls(
+            name=name,
+            window_seconds=float(os.getenv(f"{prefix}_WINDOW_SECONDS", "60")),
+            min_calls=int(os.getenv(f"{prefix}_MIN_CALLS", "5")),
+            failure_rate=float(os.getenv(f"{prefix}_FAILURE_RATE", "0.5")),
+            slow_call_ms=float(os.getenv(f"{prefix}_SLOW_CALL_MS", "60000")),
+            slow_call_rate=float(os.getenv(f"{prefix}_SLOW_CALL_RATE", "0.8")),
+            open_seconds=float(os.getenv(f"{prefix}_OPEN_SECONDS", "30")),
+            half_open_calls=int(os.getenv(f"{prefix}_HALF_OPEN_CALLS", "1"))
+        )
+    
+    def allow_request(self) -> bool:
+        """
+        是否放行本次调用
+        
+        放行后必须调用 record 或 abandon 报告结果
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.short_circuited += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._trials = 0
+            self._trial_successes = 0
+        
+        if self.state == self.HALF_OPEN:
+            if self._trials + self._trial_successes >= self.half_open_calls:
+                self.short_circuited += 1
+                return False
+            self._trials += 1
+        
+        return True
+    
+    def available(self) -> bool:
+        """当前是否可能放行调用（只查询状态，不占用半开试探名额）"""
+        return self.state != self.OPEN or time.monotonic() - self._opened_at >= self.open_seconds
+    
+    def record(self, success: bool, latency_ms: float):
+        """报告一次调用的结果"""
+        now = time.monotonic()
+        
+        if self.state == self.HALF_OPEN:
+            self._trials = max(self._trials - 1, 0)
+            if not success or latency_ms >= self.slow_call_ms:
+                self._open(now)
+                return
+            self._trial_successes += 1
+            if self._trial_successes >= self.half_open_calls:
+                self.state = self.CLOSED
+                self._window.clear()
+            return
+        
+        if self.state == self.OPEN:
+            # 打开前已放行的调用，结果不再计入
+            return
+        
+        self._window.append((now, success, latency_ms))
+        self._evict(now)
+        
+        total = len(self._window)
+        if total < self.min_calls:
+            return
+        failures = sum(1 for _, ok, _ in self._window if not ok)
+        slow = sum(1 for _, _, latency in self._window if latency >= self.slow_call_ms)
+        if failures / total >= self.failure_rate or slow / total >= self.slow_call_rate:
+            self._open(now)
+    
+    def abandon(self):
+        """放行的调用被取消、没有结果"""
+        if self.state == self.HALF_OPEN:
+            self._trials = max(self._trials - 1, 0)
+    
+    def stats(self) -> Dict:
+        """熔断器状态和窗口统计"""
+        self._evict(time.monotonic())
+        total = len(self._window)
+        failures = sum(1 for _, ok, _ in self._window if not ok)
+        slow = sum(1 for _, _, latency in self._window if latency >= self.slow_call_ms)
+        return {
+            "state": self.state,
+            "windowCalls": total,
+            "failureRate": round(failures / total, 3) if total else 0.0,
+            "slowCallRate": round(slow / total, 3) if total else 0.0,
+            "opened": self.opened,
+            "shortCircuited": self.short_circuited
+        }
+    
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._trials = 0
+        self._trial_successes = 0
+        self._window.clear()
+        self.opened += 1
+        print(f"[BREAKER] {self.name} 熔断器打开，{self.open_seconds:g} 秒内直接使用回退响应")
+    
+    def _evict(self, now: float):
+        """移出窗口外的调用结果"""
+        while self._window and now - self._window[0][0] > self.window_seconds:
+            self._window.popleft()
@@ -0,0 +1,250 @@
+"""
+经传解读（不调用大模型）
+
+按传统变占规则（朱熹《易学启蒙》）从经传语料中选取断辞，生成 A2UI 解读：
+- 六爻不变：以本卦卦辞断
+- 一爻变：以本卦变爻爻辞断
+- 二爻变：以本卦两变爻爻辞断，以上爻为主
+- 三爻变：以本卦、之卦卦辞断，以本卦为主
+- 四爻变：以之卦两不变爻爻辞断，以下爻为主
+- 五爻变：以之卦不变爻爻辞断
+- 六爻皆变：乾坤以用九、用六断，余卦以之卦卦辞断
+
+用于上游模型不可用时的回退响应，以及跳过大模型的快速模式，只需几十微秒。
+"""
+from typing import Dict, List, Optional, Tuple
+
+from app.services.hexagram_corpus import TUAN, USE, XIANG, hexagram_corpus
+
+
+# 断辞中的吉凶用语及分值，按顺序匹配，匹配后从文本中去掉，避免「元吉」再计为「吉」
+_FORTUNE_WORDS = (
+    ("元吉", 2), ("大吉", 2), ("无不利", 1), ("无攸利", -1),
+    ("吉", 1), ("凶", -2), ("悔亡", 0.5), ("无悔", 0.5), ("无咎", 0.5),
+    ("吝", -0.5), ("厉", -0.5), ("悔", -0.5),
+)
+
+
+def select_readings(
+    original_hexagram: Dict,
+    changed_hexagram: Optional[Dict],
+    lines: list
+) -> Tuple[str, List[str]]:
+    """
+    按变爻数选取断辞
+    
+    返回：
+        (占法说明, 断辞列表)，断辞以主断之辞在前
+    """
+    original = original_hexagram["number"]
+    name = original_hexagram["name"]
+    changing = [line["position"] for line in lines if line["changing"]]
+    count = len(changing)
+    
+    if count == 0:
+        return "六爻安静，以本卦卦辞断", [f"「{name}」卦辞：{hexagram_corpus.judgment(original)}"]
+    
+    changed = changed_hexagram["number"]
+    changed_name = changed_hexagram["name"]
+    static = [position for position in range(1, 7) if position not in changing]
+    
+    if count == 1:
+        return "一爻变，以本卦变爻爻辞断", [f"「{name}」{hexagram_corpus.line(original, changing[0])}"]
+    if count == 2:
+        return "二爻变，以本卦两变爻爻辞断，以上爻为主", [
+            f"「{name}」{hexagram_corpus.line(original, position)}" for position in reversed(changing)
+        ]
+    if count == 3:
+        return "三爻变，以本卦及之卦卦辞断，以本卦为主", [
+            f"「{name}」卦辞：{hexagram_corpus.judgment(original)}",
+            f"「{changed_name}」卦辞：{hexagram_corpus.judgment(changed)}"
+        ]
+    if count == 4:
+        return "四爻变，以之卦两不变爻爻辞断，以下爻为主", [
+            f"「{changed_name}」{hexagram_corpus.line(changed, position)}" for position in static
+        ]
+    if count == 5:
+        return "五爻变，以之卦不变爻爻辞断", [f"「{changed_name}」{hexagram_corpus.line(changed, static[0])}"]
+    
+    use = hexagram_corpus.get(original, USE)
+    if use:
+        return f"六爻皆变，以「{name}」{use[:2]}断", [f"「{name}」{use}"]
+    return "六爻皆变，以之卦卦辞断", [f"「{changed_name}」卦辞：{hexagram_corpus.judgment(changed)}"]
+
+
+def judge_fortune(readings: List[str]) -> Tuple[str, str]:
+    """
+    由断辞中的吉凶用语判断吉凶（主断之辞全权计分，其余断辞计一半）
+    
+    返回：
+        (吉凶, badge 颜色)
+    """
+    score = 0.0
+    for i, reading in enumerate(readings):
+        text = reading.split("：", 1)[-1]
+        weight = 1.0 if i == 0 else 0.5
+        for word, value in _FORTUNE_WORDS:
+            score += text.count(word) * value * weight
+            text = text.replace(word, "")
+    
+    if score >= 2:
+        return "大吉", "success"
+    if score >= 1:
+        return "吉", "success"
+    if score > 0:
+        return "小吉", "success"
+    if score == 0:
+        return "平", "info"
+    if score > -2:
+        return "小凶", "warning"
+    return "凶", "error"
+
+
+def build_classic_response(
+    question: str,
+    original_hexagram: Dict,
+    changed_hexagram: Optional[Dict],
+    lines: list,
+    generated_by: str,
+    notice: str,
+    warning: bool = False
+) -> Dict:
+    """
+    生成经传解读的 A2UI 数据
+    
+    参数：
+        question, original_hexagram, changed_hexagram, lines: 同 BaseAIService.generate_liuyao_interpretation
+        generated_by: metadata.generatedBy（fallback 表示回退响应）
+        notice: 结尾提示卡片的内容
+        warning: 提示卡片是否使用警告样式
+    
+    语料不可用时只给出卦名、卦辞
+    """
+    upper = original_hexagram["upperTrigram"]
+    lower = original_hexagram["lowerTrigram"]
+    hexagram_name = original_hexagram["name"]
+    number = original_hexagram.get("number", 0)
+    
+    overview = (
+        f"您所得之卦为「{hexagram_name}」。上卦为{upper['name']}，代表{upper['nature']}；"
+        f"下卦为{lower['name']}，代表{lower['nature']}。"
+    )
+    if changed_hexagram:
+        overview += f"有变爻，之卦为「{changed_hexagram['name']}」。"
+    
+    try:
+        tuan = hexagram_corpus.get(number, TUAN)
+        xiang = hexagram_corpus.get(number, XIANG)
+        overview += f"卦辞：{hexagram_corpus.judgment(number)}"
+        rule, readings = select_readings(original_hexagram, changed_hexagram, lines)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] 经传语料不可用，只显示卦辞: {e}")
+        overview += f"卦辞：{original_hexagram.get('judgment', '')}"
+        tuan = xiang = ""
+        rule, readings = "", []
+    
+    overview_children = ["text-overview"]
+    components = [
+        {
+            "id": "card-overview",
+            "type": "card",
+            "props": {"title": "📖 卦象总论", "variant": "elevated"},
+            "children": overview_children
+        },
+        {
+            "id": "text-overview",
+            "type": "text",
+            "props": {"content": overview, "variant": "body"}
+        }
+    ]
+    for component_id, label, content in (("text-tuan", "彖曰", tuan), ("text-xiang", "象曰", xiang)):
+        if content:
+            overview_children.append(component_id)
+            components.append({
+                "id": component_id,
+                "type": "text",
+                "props": {"content": f"{label}：{content}", "variant": "body"}
+            })
+    
+    if readings:
+        fortune, color = judge_fortune(readings)
+        components += [
+            {
+                "id": "card-interpretation",
+                "type": "card",
+                "props": {"title": "🔮 占断", "variant": "default"},
+                "children": ["text-rule", "list-readings"]
+            },
+            {
+                "id": "text-rule",
+                "type": "text",
+                "props": {"content": f"{rule}：", "variant": "body"}
+            },
+            {
+                "id": "list-readings",
+                "type": "list",
+                "props": {"items": readings, "ordered": False}
+            },
+            {
+                "id": "card-fortune",
+                "type": "card",
+                "props": {"title": "⚖️ 吉凶判断", "variant": "highlighted"},
+                "children": ["badge-fortune", "text-fortune-reason"]
+            },
+            {
+                "id": "badge-fortune",
+                "type": "badge",
+                "props": {"label": fortune, "color": color}
+            },
+            {
+                "id": "text-fortune-reason",
+                "type": "text",
+                "props": {"content": f"依断辞中的吉凶之语而定，以{readings[0].split('：', 1)[0]}为主。", "variant": "caption"}
+            }
+        ]
+    else:
+        components += [
+            {
+                "id": "card-fortune",
+                "type": "card",
+                "props": {"title": "⚖️ 吉凶判断", "variant": "highlighted"},
+                "children": ["badge-fortune"]
+            },
+            {
+                "id": "badge-fortune",
+                "type": "badge",
+                "props": {"label": "待解读", "color": "info"}
+            }
+        ]
+    
+    components += [
+        {
+            "id": "card-warning",
+            "type": "card",
+            "props": {"title": "⚠️ 提示" if warning else "💡 说明", "variant": "warning" if warning else "default"},
+            "children": ["text-warning"]
+        },
+        {
+            "id": "text-warning",
+            "type": "text",
+            "props": {"content": notice, "variant": "body"}
+        }
+    ]
+    
+    return {
+        "version": "1.0",
+        "root": f"{generated_by}-root",
+        "components": components,
+        "data": {
+            "question": question,
+            "originalHexagram": original_hexagram,
+            "changedHexagram": changed_hexagram,
+            "lines": lines
+        },
+        "metadata": {
+            "hexagramName": hexagram_name,
+            "question": question,
+            "generatedBy": generated_by,
+            "isNativeA2UI": False
+        }
+    }
@@ -0,0 +1,44 @@
+"""
+请求截止时间
+
+API 层为每个占卜请求设置截止时间（早于前端 120 秒超时），
+通过 contextvars 向下传递到准入排队、重试和上游调用，超过截止时间的工作不再继续
+"""
+import contextvars
+import os
+import time
+from typing import Optional
+
+
+# 占卜请求的默认总时限（秒）
+REQUEST_DEADLINE_SECONDS = float(os.getenv("AI_REQUEST_DEADLINE", "110"))
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def set_deadline(seconds: float = REQUEST_DEADLINE_SECONDS) -> float:
+    """
+    为当前请求设置截止时间
+    
+    参数：
+        seconds: 从现在起的时限（秒）
+    
+    返回：
+        截止时间（time.monotonic()）
+    """
+    deadline = time.monotonic() + seconds
+    _deadline.set(deadline)
+    return deadline
+
+
+def get_deadline() -> Optional[float]:
+    """当前请求的截止时间（time.monotonic()），未设置时返回 None"""
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """距截止时间的剩余秒数（不小于 0），未设置时返回 None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
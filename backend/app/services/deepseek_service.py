@@ -5,9 +5,13 @@ DeepSeek AI 服务
 DeepSeek API 兼容 OpenAI 接口格式
 """
 import os
-from typing import Dict, Optional
-from openai import OpenAI
+import time
+from typing import AsyncIterator, Dict, List, Optional
+from openai import AsyncOpenAI
 from app.services.base_ai_service import BaseAIService
+from app.services.http_client import DEFAULT_TIMEOUT, get_http_client
+from app.services.metrics import FALLBACKS, observe_stage
+from app.services.retry import call_with_retry
 
 
 class DeepSeekService(BaseAIService):
@@ -17,8 +21,12 @@ class DeepSeekService(BaseAIService):
     MODEL_DISPLAY_NAME = "DeepSeek"
     
     # DeepSeek API 配置
-    DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+    DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
     DEEPSEEK_MODEL = "deepseek-chat"
+    WARM_UP_URL = DEEPSEEK_BASE_URL
+    
+    # 系统提示词
+    SYSTEM_PROMPT = "你是一位精通周易的占卜大师，擅长用通俗易懂的语言解读卦象。你需要直接输出 JSON 格式的 A2UI 响应，不要输出任何其他文字。"
     
     def __init__(self):
         """初始化 DeepSeek 服务"""
@@ -26,13 +34,57 @@ class DeepSeekService(BaseAIService):
         
         api_key = os.getenv("DEEPSEEK_API_KEY")
         if api_key:
-            self.client = OpenAI(
+            # 异步客户端，复用共享连接池；重试由 call_with_retry 统一控制，关闭 SDK 自带的重试
+            self.client = AsyncOpenAI(
                 api_key=api_key,
-                base_url=self.DEEPSEEK_BASE_URL
+                base_url=self.DEEPSEEK_BASE_URL,
+                http_client=get_http_client(),
+                timeout=DEFAULT_TIMEOUT,
+                max_retries=0
             )
         else:
             self.client = None
     
+    def is_configured(self) -> bool:
+        """是否已配置 DeepSeek API key"""
+        return self.client is not None
+    
+    def _build_messages(self, prompt: str) -> List[Dict]:
+        """构建对话消息"""
+        return [
+            {
+                "role": "system",
+                "content": self.SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    def _record_completion_usage(self, usage):
+        """记录 DeepSeek 返回的 token 用量（prompt_cache_hit_tokens 为命中上下文缓存的部分）"""
+        self._record_usage(
+            usage.prompt_tokens, usage.completion_tokens, getattr(usage, "prompt_cache_hit_tokens", None)
+        )
+    
+    async def _stream_completion(self, prompt: str) -> AsyncIterator[str]:
+        """流式调用 DeepSeek API，逐块产出生成的文本"""
+        stream = await self.client.chat.completions.create(
+            model=self.DEEPSEEK_MODEL,
+            messages=self._build_messages(prompt),
+            temperature=0.7,
+            max_tokens=4000,
+            stream=True,
+            # 最后一块附带 token 用量
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                self._record_completion_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
     async def generate_liuyao_interpretation(
         self,
         question: str,
@@ -48,6 +100,7 @@ class DeepSeekService(BaseAIService):
         prompt = ""
         raw_response = ""
         parsed_sections = {}
+        started = time.perf_counter()
         
         if not self.client:
             # 使用回退响应
@@ -64,30 +117,29 @@ class DeepSeekService(BaseAIService):
                 success=True,
                 error_message="DeepSeek API key 未配置"
             )
+            FALLBACKS.inc(model=self.MODEL_NAME, reason="not_configured")
             return a2ui_response
         
         try:
             # 构建 A2UI 格式的提示词
             prompt = self._build_a2ui_prompt(question, original_hexagram, changed_hexagram, lines)
+            stage_started = observe_stage("prompt_build", self.MODEL_NAME, started)
             
-            # 调用 DeepSeek API（同步调用，但在 async 函数中使用）
-            response = self.client.chat.completions.create(
-                model=self.DEEPSEEK_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一位精通周易的占卜大师，擅长用通俗易懂的语言解读卦象。你需要直接输出 JSON 格式的 A2UI 响应，不要输出任何其他文字。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=4000
+            # 调用 DeepSeek API（异步调用，不阻塞事件循环，可恢复错误有限次重试）
+            response = await call_with_retry(
+                lambda: self.client.chat.completions.create(
+                    model=self.DEEPSEEK_MODEL,
+                    messages=self._build_messages(prompt),
+                    temperature=0.7,
+                    max_tokens=4000
+                ),
+                "DeepSeek chat.completions"
             )
             
             raw_response = response.choices[0].message.content
+            if response.usage:
+                self._record_completion_usage(response.usage)
+            stage_started = observe_stage("upstream", self.MODEL_NAME, stage_started)
             
             # 解析 A2UI JSON
             a2ui_response = self._parse_a2ui_response(
@@ -100,6 +152,7 @@ class DeepSeekService(BaseAIService):
             
             # 提取 sections 用于日志
             parsed_sections = self._extract_sections_from_a2ui(a2ui_response)
+            observe_stage("parse", self.MODEL_NAME, stage_started)
             
             # 保存成功的交互日志
             self._save_interaction_log(
@@ -111,7 +164,8 @@ class DeepSeekService(BaseAIService):
                 raw_response=raw_response,
                 parsed_sections=parsed_sections,
                 a2ui_response=a2ui_response,
-                success=True
+                success=True,
+                latency_ms=(time.perf_counter() - started) * 1000
             )
             
             return a2ui_response
@@ -119,6 +173,7 @@ class DeepSeekService(BaseAIService):
         except Exception as e:
             error_msg = str(e)
             print(f"DeepSeek API 调用失败: {error_msg}")
+            FALLBACKS.inc(model=self.MODEL_NAME, reason=self._fallback_reason(e, raw_response))
             
             # 使用回退响应
             a2ui_response = self._generate_fallback_response(question, original_hexagram, changed_hexagram, lines)
@@ -134,7 +189,8 @@ class DeepSeekService(BaseAIService):
                 parsed_sections={},
                 a2ui_response=a2ui_response,
                 success=False,
-                error_message=error_msg
+                error_message=error_msg,
+                latency_ms=(time.perf_counter() - started) * 1000
             )
             
             return a2ui_response
@@ -0,0 +1,128 @@
+"""
+占卜结果存储
+
+完成的占卜（卦象 + A2UI 解读）以响应 JSON 原样保存在 SQLite 中，
+id 为内容 hash 的前 9 字节（base64url，12 个字符）：相同内容得到相同 id，
+id 对应的内容永不改变，可作为强 ETag 并让 CDN、浏览器长期缓存。
+用于分享链接和重新打开结果页，无需再次占卜。
+
+环境变量：
+    DIVINATION_STORE_DB: 存储文件路径，默认 logs/divinations.db
+    DIVINATION_STORE_ENABLED: 设为 0 关闭保存
+"""
+import base64
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+DEFAULT_STORE_PATH = Path(__file__).parent.parent.parent / "logs" / "divinations.db"
+
+# id 的格式：12 个 base64url 字符
+ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{12}$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS divinations (
+    id TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class DivinationStore:
+    """占卜结果存储（SQLite，按内容寻址）"""
+    
+    def __init__(self, db_path: Path = DEFAULT_STORE_PATH, enabled: bool = True):
+        self.db_path = Path(db_path)
+        self.enabled = enabled
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        
+        # 统计计数
+        self.saved = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @classmethod
+    def from_env(cls) -> "DivinationStore":
+        """根据环境变量创建存储"""
+        return cls(
+            Path(os.getenv("DIVINATION_STORE_DB") or DEFAULT_STORE_PATH),
+            enabled=os.getenv("DIVINATION_STORE_ENABLED", "1") != "0"
+        )
+    
+    @staticmethod
+    def make_id(content: str) -> str:
+        """内容寻址的 id"""
+        digest = hashlib.sha256(content.encode("utf-8")).digest()
+        return base64.urlsafe_b64encode(digest[:9]).decode("ascii")
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            self._db = db
+        return self._db
+    
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+    
+    def save(self, divination_id: str, content: str):
+        """保存（id 已存在时内容必然相同，直接忽略）"""
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute(
+                    "INSERT OR IGNORE INTO divinations (id, content, created_at) VALUES (?, ?, ?)",
+                    (divination_id, content, time.time())
+                )
+            self.saved += 1
+    
+    def get(self, divination_id: str) -> Optional[str]:
+        """读取保存的响应 JSON，不存在时返回 None"""
+        if not ID_PATTERN.match(divination_id):
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT content FROM divinations WHERE id = ?", (divination_id,)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+    
+    def exists(self, divination_id: str) -> bool:
+        """id 是否已保存（只查主键索引，不读取内容）"""
+        if not ID_PATTERN.match(divination_id):
+            return False
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT 1 FROM divinations WHERE id = ?", (divination_id,)
+            ).fetchone()
+        return row is not None
+    
+    def stats(self) -> Dict:
+        """存储统计"""
+        return {
+            "enabled": self.enabled,
+            "saved": self.saved,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# 全局占卜结果存储
+divination_store = DivinationStore.from_env()
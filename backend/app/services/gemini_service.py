@@ -2,11 +2,16 @@
 Gemini AI 服务
 
 使用 Google Gemini API 生成卦象解读，并返回 A2UI 格式的动态 UI 数据
+通过 REST 接口调用，与其他 AI 服务共用异步 HTTP 连接池
 """
+import json
 import os
-from typing import Dict, Optional
-import google.generativeai as genai
+import time
+from typing import AsyncIterator, Dict, Optional
 from app.services.base_ai_service import BaseAIService
+from app.services.http_client import get_http_client
+from app.services.metrics import FALLBACKS, observe_stage
+from app.services.retry import call_with_retry
 
 
 class GeminiService(BaseAIService):
@@ -15,17 +20,79 @@ class GeminiService(BaseAIService):
     MODEL_NAME = "gemini"
     MODEL_DISPLAY_NAME = "Google Gemini"
     
+    # Gemini API 配置
+    GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+    GEMINI_MODEL = "gemini-2.0-flash"
+    WARM_UP_URL = GEMINI_BASE_URL
+    
     def __init__(self):
         """初始化 Gemini 服务"""
         super().__init__()
         
-        api_key = os.getenv("GEMINI_API_KEY")
-        if api_key:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel("gemini-2.0-flash")
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        if self.api_key:
+            self.model = self.GEMINI_MODEL
         else:
             self.model = None
     
+    def is_configured(self) -> bool:
+        """是否已配置 Gemini API key"""
+        return self.model is not None
+    
+    @staticmethod
+    def _extract_text(data: Dict) -> str:
+        """从 Gemini 响应中提取文本，没有候选结果时返回空字符串"""
+        candidates = data.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+    
+    def _record_usage_metadata(self, usage: Optional[Dict]):
+        """记录 Gemini 返回的 token 用量（usageMetadata，cachedContentTokenCount 为命中缓存的部分）"""
+        if usage:
+            self._record_usage(
+                usage.get("promptTokenCount"), usage.get("candidatesTokenCount"), usage.get("cachedContentTokenCount")
+            )
+    
+    async def _generate_content(self, prompt: str) -> str:
+        """调用 Gemini generateContent 接口，返回生成的文本"""
+        response = await get_http_client().post(
+            f"{self.GEMINI_BASE_URL}/models/{self.model}:generateContent",
+            headers={"x-goog-api-key": self.api_key},
+            json={"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        )
+        response.raise_for_status()
+        
+        data = response.json()
+        self._record_usage_metadata(data.get("usageMetadata"))
+        if not data.get("candidates"):
+            raise ValueError(f"Gemini 未返回候选结果: {data.get('promptFeedback')}")
+        
+        return self._extract_text(data)
+    
+    async def _stream_completion(self, prompt: str) -> AsyncIterator[str]:
+        """调用 Gemini streamGenerateContent 接口（SSE），逐块产出生成的文本"""
+        async with get_http_client().stream(
+            "POST",
+            f"{self.GEMINI_BASE_URL}/models/{self.model}:streamGenerateContent",
+            params={"alt": "sse"},
+            headers={"x-goog-api-key": self.api_key},
+            json={"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        ) as response:
+            response.raise_for_status()
+            # 每块的 usageMetadata 为累计值，结束后记录最后一次
+            usage = None
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:])
+                usage = data.get("usageMetadata") or usage
+                text = self._extract_text(data)
+                if text:
+                    yield text
+            self._record_usage_metadata(usage)
+    
     async def generate_liuyao_interpretation(
         self,
         question: str,
@@ -41,6 +108,7 @@ class GeminiService(BaseAIService):
         prompt = ""
         raw_response = ""
         parsed_sections = {}
+        started = time.perf_counter()
         
         if not self.model:
             # 使用回退响应
@@ -57,15 +125,18 @@ class GeminiService(BaseAIService):
                 success=True,
                 error_message="Gemini API key 未配置"
             )
+            FALLBACKS.inc(model=self.MODEL_NAME, reason="not_configured")
             return a2ui_response
         
         try:
             # 构建 A2UI 格式的提示词
             prompt = self._build_a2ui_prompt(question, original_hexagram, changed_hexagram, lines)
+            stage_started = observe_stage("prompt_build", self.MODEL_NAME, started)
             
-            # 调用 Gemini API
-            response = self.model.generate_content(prompt)
-            raw_response = response.text
+            # 调用 Gemini API（异步调用，不阻塞事件循环，可恢复错误有限次重试）
+            raw_response = await call_with_retry(lambda: self._generate_content(prompt), "Gemini generateContent")
+            
+            stage_started = observe_stage("upstream", self.MODEL_NAME, stage_started)
             
             # 解析 A2UI JSON
             a2ui_response = self._parse_a2ui_response(
@@ -78,6 +149,7 @@ class GeminiService(BaseAIService):
             
             # 提取 sections 用于日志
             parsed_sections = self._extract_sections_from_a2ui(a2ui_response)
+            observe_stage("parse", self.MODEL_NAME, stage_started)
             
             # 保存成功的交互日志
             self._save_interaction_log(
@@ -89,7 +161,8 @@ class GeminiService(BaseAIService):
                 raw_response=raw_response,
                 parsed_sections=parsed_sections,
                 a2ui_response=a2ui_response,
-                success=True
+                success=True,
+                latency_ms=(time.perf_counter() - started) * 1000
             )
             
             return a2ui_response
@@ -97,6 +170,7 @@ class GeminiService(BaseAIService):
         except Exception as e:
             error_msg = str(e)
             print(f"Gemini API 调用失败: {error_msg}")
+            FALLBACKS.inc(model=self.MODEL_NAME, reason=self._fallback_reason(e, raw_response))
             
             # 使用回退响应
             a2ui_response = self._generate_fallback_response(question, original_hexagram, changed_hexagram, lines)
@@ -112,7 +186,8 @@ class GeminiService(BaseAIService):
                 parsed_sections={},
                 a2ui_response=a2ui_response,
                 success=False,
-                error_message=error_msg
+                error_message=error_msg,
+                latency_ms=(time.perf_counter() - started) * 1000
             )
             
             return a2ui_response
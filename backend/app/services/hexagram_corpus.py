@@ -0,0 +1,240 @@
+"""
+周易经传语料
+
+64 卦的卦辞、彖传、大象传和 384 爻辞（含用九、用六），用于不调用大模型的本地解读。
+原文维护在 app/data/zhouyi.txt，预编译为带索引的二进制文件 app/data/zhouyi.bin：
+
+    头部    magic(4) 卦数(uint16) 每卦字段数(uint16)
+    索引    卦数 × 字段数 个 (偏移 uint32, 长度 uint32)，按卦序、字段顺序排列
+    正文    UTF-8 文本
+
+首次读取时以只读 mmap 打开，按索引直接切片解码，不整体载入内存；
+各 worker 进程共享同一份页缓存。
+
+修改原文后重新生成：
+    python -m app.services.hexagram_corpus
+
+环境变量：
+    HEXAGRAM_CORPUS_PATH: 语料文件路径，默认 app/data/zhouyi.bin
+"""
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.services.liuyao_service import LiuYaoService
+
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+DEFAULT_SOURCE_PATH = DATA_DIR / "zhouyi.txt"
+DEFAULT_CORPUS_PATH = DATA_DIR / "zhouyi.bin"
+
+MAGIC = b"ZYC1"
+_HEADER = struct.Struct("<4sHH")
+_ENTRY = struct.Struct("<II")
+
+HEXAGRAM_COUNT = 64
+
+# 每卦的字段：卦辞、彖、象、初爻至上爻、用九/用六（仅乾坤）
+JUDGMENT = 0
+TUAN = 1
+XIANG = 2
+LINE_BASE = 3
+USE = 9
+FIELD_COUNT = 10
+
+_SOURCE_KEYS = ("卦辞", "彖", "象")
+_HEADER_PATTERN = re.compile(r"^# (\d+) (\S+)$")
+
+
+def line_heading(position: int, value: int) -> str:
+    """
+    爻题，如 初九、六二、上六
+    
+    参数：
+        position: 爻位（1-6）
+        value: 1=阳，0=阴
+    """
+    number = "九" if value else "六"
+    if position == 1:
+        return f"初{number}"
+    if position == 6:
+        return f"上{number}"
+    return f"{number}{'二三四五'[position - 2]}"
+
+
+def parse_source(text: str) -> List[List[str]]:
+    """
+    解析原文，并与卦画核对爻题
+    
+    返回：
+        按卦序排列的 64 卦，每卦 FIELD_COUNT 个字段；爻辞、用九/用六带爻题，如「初九：潜龙勿用。」
+    
+    异常：
+        ValueError: 卦序、字段或爻题与卦画不符
+    """
+    lines_by_number = {hexagram["number"]: hexagram["lines"] for hexagram in LiuYaoService.HEXAGRAM_TABLE}
+    names_by_number = {hexagram["number"]: hexagram["name"] for hexagram in LiuYaoService.HEXAGRAM_TABLE}
+    
+    hexagrams: List[List[str]] = []
+    records: List[tuple] = []
+    
+    def finish():
+        if not hexagrams:
+            return
+        number = len(hexagrams)
+        values = lines_by_number[number]
+        expected = list(_SOURCE_KEYS) + [line_heading(i + 1, values[i]) for i in range(6)]
+        if number in (1, 2):
+            expected.append("用九" if number == 1 else "用六")
+        keys = [key for key, _ in records]
+        if keys != expected:
+            raise ValueError(f"第 {number} 卦字段应为 {expected}，实际为 {keys}")
+        
+        fields = hexagrams[-1]
+        for i, (key, content) in enumerate(records):
+            fields[i] = content if i < LINE_BASE else f"{key}：{content}"
+        records.clear()
+    
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        header = _HEADER_PATTERN.match(line)
+        if header:
+            finish()
+            number, name = int(header.group(1)), header.group(2)
+            full_name = names_by_number.get(number, "")
+            if number != len(hexagrams) + 1 or not (full_name.endswith(name) or full_name.startswith(f"{name}为")):
+                raise ValueError(f"卦序错误：# {number} {name}（应为第 {len(hexagrams) + 1} 卦）")
+            hexagrams.append([""] * FIELD_COUNT)
+            continue
+        if line.startswith("#"):
+            continue
+        if not hexagrams:
+            raise ValueError(f"原文出现在第一卦之前: {line}")
+        key, _, content = line.partition("\t")
+        records.append((key, content.strip()))
+    finish()
+    
+    if len(hexagrams) != HEXAGRAM_COUNT:
+        raise ValueError(f"应有 {HEXAGRAM_COUNT} 卦，实际 {len(hexagrams)} 卦")
+    return hexagrams
+
+
+def build(source_path: Path = DEFAULT_SOURCE_PATH, output_path: Path = DEFAULT_CORPUS_PATH) -> int:
+    """
+    由原文生成二进制语料文件
+    
+    返回：
+        文件大小（字节）
+    """
+    hexagrams = parse_source(Path(source_path).read_text(encoding="utf-8"))
+    
+    index = bytearray()
+    body = bytearray()
+    for fields in hexagrams:
+        for content in fields:
+            data = content.encode("utf-8")
+            index += _ENTRY.pack(len(body), len(data))
+            body += data
+    content = _HEADER.pack(MAGIC, HEXAGRAM_COUNT, FIELD_COUNT) + bytes(index) + bytes(body)
+    
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(f"{output_path.name}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, output_path)
+    return len(content)
+
+
+class HexagramCorpus:
+    """周易经传语料（mmap，首次读取时打开）"""
+    
+    def __init__(self, path: Path = DEFAULT_CORPUS_PATH):
+        self.path = Path(path)
+        self._map: Optional[mmap.mmap] = None
+        self._body_offset = 0
+        self._lock = threading.Lock()
+        
+        # 统计计数
+        self.reads = 0
+    
+    @classmethod
+    def from_env(cls) -> "HexagramCorpus":
+        """根据环境变量创建语料"""
+        return cls(Path(os.getenv("HEXAGRAM_CORPUS_PATH") or DEFAULT_CORPUS_PATH))
+    
+    def _open(self) -> mmap.mmap:
+        """
+        打开语料文件并校验头部
+        
+        异常：
+            OSError: 文件不存在或无法读取
+            ValueError: 文件格式不符
+        """
+        with self._lock:
+            if self._map is None:
+                with open(self.path, "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, count, fields = _HEADER.unpack_from(data, 0)
+                if magic != MAGIC or count != HEXAGRAM_COUNT or fields != FIELD_COUNT:
+                    data.close()
+                    raise ValueError(f"语料文件格式不符: {self.path}")
+                self._body_offset = _HEADER.size + count * fields * _ENTRY.size
+                self._map = data
+            return self._map
+    
+    def get(self, number: int, field: int) -> str:
+        """
+        读取一段原文
+        
+        参数：
+            number: 卦序（1-64）
+            field: 字段（JUDGMENT/TUAN/XIANG/LINE_BASE+爻位-1/USE）
+        
+        返回：
+            原文，该卦没有此字段时（如非乾坤的用九/用六）为空字符串
+        """
+        if not 1 <= number <= HEXAGRAM_COUNT or not 0 <= field < FIELD_COUNT:
+            raise ValueError(f"卦序或字段超出范围: {number}, {field}")
+        data = self._map or self._open()
+        offset, length = _ENTRY.unpack_from(data, _HEADER.size + ((number - 1) * FIELD_COUNT + field) * _ENTRY.size)
+        start = self._body_offset + offset
+        self.reads += 1
+        return data[start:start + length].decode("utf-8")
+    
+    def judgment(self, number: int) -> str:
+        """卦辞"""
+        return self.get(number, JUDGMENT)
+    
+    def line(self, number: int, position: int) -> str:
+        """爻辞（带爻题），position 为爻位 1-6"""
+        return self.get(number, LINE_BASE + position - 1)
+    
+    def stats(self) -> Dict:
+        """语料统计"""
+        return {
+            "loaded": self._map is not None,
+            "bytes": len(self._map) if self._map is not None else 0,
+            "reads": self.reads
+        }
+    
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+
+# 全局语料
+hexagram_corpus = HexagramCorpus.from_env()
+
+
+if __name__ == "__main__":
+    output = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CORPUS_PATH
+    size = build(DEFAULT_SOURCE_PATH, output)
+    print(f"已生成 {output}（{size} 字节）")
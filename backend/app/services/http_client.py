@@ -0,0 +1,47 @@
+"""
+共享 HTTP 连接池
+
+所有 AI 服务共用一个 httpx.AsyncClient，复用 keep-alive 连接，
+避免在事件循环中发起阻塞调用
+"""
+import os
+from typing import Optional
+
+import httpx
+
+
+# 连接池配置
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 30.0
+
+# 默认超时（秒）：读超时需大于模型非流式生成的耗时，总时长另由请求截止时间限制
+CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("AI_READ_TIMEOUT", "100"))
+POOL_TIMEOUT = float(os.getenv("AI_POOL_TIMEOUT", "5"))
+DEFAULT_TIMEOUT = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享的异步 HTTP 客户端（首次调用时创建）"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            ),
+            timeout=DEFAULT_TIMEOUT
+        )
+    return _client
+
+
+async def close_http_client():
+    """关闭共享的 HTTP 客户端（应用关闭时调用）"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
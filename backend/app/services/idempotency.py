@@ -0,0 +1,208 @@
+"""
+幂等请求存储
+
+客户端超时重试或重复点击时带上相同的 Idempotency-Key，
+相同 key 的请求复用进行中或已完成的结果，不再重复调用上游模型、重复写交互日志。
+- 请求在独立的 Task 中执行：首个请求的客户端断开后仍继续执行，供重试的请求取得结果
+- 流式请求（stream）执行中发布的事件转发给重试的请求，完成后重试的请求只取得最终结果
+- 执行失败的结果不保存，重试时重新执行
+- 相同 key 对应不同的请求内容时拒绝（IdempotencyConflict）
+- 按 LRU 保留有限条数（进行中的 key 不淘汰），结果超过 TTL 后失效
+
+环境变量：
+    IDEMPOTENCY_MAX_KEYS: 最多保留的 key 数，默认 4096
+    IDEMPOTENCY_TTL: 结果保留时长（秒），默认 600
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from app.services.single_flight import Publish
+
+
+T = TypeVar("T")
+
+
+class IdempotencyConflict(Exception):
+    """Idempotency-Key 已用于内容不同的请求"""
+    
+    def __init__(self, key: str):
+        super().__init__("Idempotency-Key 已用于内容不同的请求")
+        self.key = key
+
+
+class _Entry:
+    """一个 key 对应的请求"""
+    
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.task: Optional[asyncio.Task] = None
+        # 完成时间，进行中为 None
+        self.completed_at: Optional[float] = None
+        # 流式请求进行中发布的事件，完成后清空
+        self.events: List[Tuple[str, Any]] = []
+        self.updated = asyncio.get_running_loop().create_future()
+    
+    def publish(self, event: str, data: Any):
+        """记录事件并唤醒等待新事件的请求"""
+        self.events.append((event, data))
+        if not self.updated.done():
+            self.updated.set_result(None)
+        self.updated = asyncio.get_running_loop().create_future()
+
+
+class IdempotencyStore:
+    """按 Idempotency-Key 复用请求结果（LRU + TTL）"""
+    
+    def __init__(self, max_keys: int = 4096, ttl: float = 600):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        
+        # 统计计数
+        self.executed = 0
+        self.replayed = 0
+        self.conflicts = 0
+        self.evictions = 0
+    
+    @classmethod
+    def from_env(cls) -> "IdempotencyStore":
+        """根据环境变量创建存储"""
+        return cls(
+            max_keys=int(os.getenv("IDEMPOTENCY_MAX_KEYS", "4096")),
+            ttl=float(os.getenv("IDEMPOTENCY_TTL", "600"))
+        )
+    
+    async def do(self, key: str, fingerprint: str, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        执行请求，相同 key 已有进行中或已完成的请求时直接复用其结果
+        
+        参数：
+            key: Idempotency-Key
+            fingerprint: 请求内容的指纹，相同 key 的请求必须一致
+            func: 执行请求的函数
+        
+        返回：
+            (结果, 是否复用了之前的请求)
+        
+        异常：
+            IdempotencyConflict: 相同 key 对应不同的请求内容
+        """
+        entry, replayed = self._join(key, fingerprint, lambda entry: func())
+        
+        # 调用方取消（客户端断开）不影响请求继续执行
+        return await asyncio.shield(entry.task), replayed
+    
+    def stream(
+        self,
+        key: str,
+        fingerprint: str,
+        func: Callable[[Publish], Awaitable[T]]
+    ) -> Tuple[bool, AsyncIterator[Tuple[str, Any]]]:
+        """
+        流式执行请求，相同 key 已有进行中或已完成的请求时复用
+        
+        参数：
+            key、fingerprint: 同 do
+            func: 执行请求的函数，通过传入的 publish 回调发布事件
+        
+        返回：
+            (是否复用了之前的请求, 事件流)；事件流产出已发布和后续发布的 (事件, 数据)，
+            最后产出 ("done", func 的返回值)。请求已完成或由 do 发起时只有 ("done", 结果)
+        
+        异常：
+            IdempotencyConflict: 相同 key 对应不同的请求内容
+        """
+        entry, replayed = self._join(key, fingerprint, lambda entry: func(entry.publish))
+        return replayed, self._subscribe(entry)
+    
+    def stats(self) -> Dict:
+        """幂等存储统计"""
+        return {
+            "keys": len(self._entries),
+            "inFlight": sum(1 for entry in self._entries.values() if entry.completed_at is None),
+            "maxKeys": self.max_keys,
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+            "evictions": self.evictions
+        }
+    
+    def _join(self, key: str, fingerprint: str, start: Callable[[_Entry], Awaitable[T]]) -> Tuple[_Entry, bool]:
+        """取得 key 对应的请求，没有时发起新请求"""
+        entry = self._get(key)
+        replayed = entry is not None
+        
+        if entry is None:
+            entry = _Entry(fingerprint)
+            entry.task = asyncio.ensure_future(start(entry))
+            entry.task.add_done_callback(lambda task: self._on_done(key, entry, task))
+            self._entries[key] = entry
+            self.executed += 1
+            self._evict()
+        elif entry.fingerprint != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyConflict(key)
+        else:
+            self.replayed += 1
+        return entry, replayed
+    
+    @staticmethod
+    async def _subscribe(entry: _Entry) -> AsyncIterator[Tuple[str, Any]]:
+        """转发请求已发布和后续发布的事件，最后产出结果（调用方离开不影响请求继续执行）"""
+        events = entry.events
+        index = 0
+        while True:
+            while index < len(events):
+                yield events[index]
+                index += 1
+            if entry.task.done():
+                break
+            await asyncio.wait({entry.updated, entry.task}, return_when=asyncio.FIRST_COMPLETED)
+        yield "done", entry.task.result()
+    
+    def _get(self, key: str) -> Optional[_Entry]:
+        """获取未过期的请求"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.completed_at is not None and time.monotonic() - entry.completed_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+    
+    def _on_done(self, key: str, entry: _Entry, task: asyncio.Task):
+        """请求完成：成功的结果开始计算 TTL，失败或取消的不保存"""
+        # 总是取出异常，调用方都已断开时也不会产生未处理异常的警告
+        failed = task.cancelled() or task.exception() is not None
+        # 事件只转发给进行中的请求，之后复用结果即可（正在转发的调用方保留原列表）
+        entry.events = []
+        if self._entries.get(key) is not entry:
+            return
+        if failed:
+            del self._entries[key]
+        else:
+            entry.completed_at = time.monotonic()
+            self._evict()
+    
+    def _evict(self):
+        """
+        超出条数上限时淘汰最久未使用的已完成 key
+        
+        进行中的 key 不淘汰（否则重试会再发起一次上游调用），全部进行中时暂时超出上限，
+        完成后再淘汰
+        """
+        excess = len(self._entries) - self.max_keys
+        if excess <= 0:
+            return
+        completed = [key for key, entry in self._entries.items() if entry.completed_at is not None]
+        for key in completed[:excess]:
+            del self._entries[key]
+            self.evictions += 1
+
+
+# 全局幂等存储
+idempotency_store = IdempotencyStore.from_env()
@@ -0,0 +1,459 @@
+"""
+AI 交互记录索引
+
+用 SQLite 为交互记录建立可查询的索引（时间、模型、卦序、成功与否、是否回退、耗时），
+写入日志时由后台写入器增量更新，历史日志可通过 backfill 导入：
+    python -m app.services.interaction_index backfill logs/ai_interactions
+
+支持导入的历史格式：
+    *.md: 旧版 Markdown 日志
+    *.json: 更早的 JSON 日志
+    interactions-*.jsonl[.gz|.zst]: JSONL 分段
+
+环境变量：
+    INTERACTION_INDEX_DB: 索引文件路径，默认 logs/interaction_index.db
+    INTERACTION_INDEX_ENABLED: 设为 0 关闭写入时的增量索引
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+
+DEFAULT_INDEX_PATH = Path(__file__).parent.parent.parent / "logs" / "interaction_index.db"
+
+# 旧日志中的模型显示名 -> 模型名称
+_MODEL_BY_DISPLAY_NAME = {
+    "Google Gemini": "gemini",
+    "DeepSeek": "deepseek",
+}
+
+# 可排序的字段
+SORTABLE_FIELDS = ("timestamp", "latency_ms", "hexagram_number")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    model TEXT NOT NULL,
+    hexagram_number INTEGER,
+    hexagram_name TEXT,
+    changed_hexagram_number INTEGER,
+    changed_hexagram_name TEXT,
+    success INTEGER NOT NULL,
+    fallback INTEGER NOT NULL,
+    latency_ms REAL,
+    question TEXT,
+    error_message TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_timestamp ON interactions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_interactions_model_timestamp ON interactions (model, timestamp);
+CREATE INDEX IF NOT EXISTS idx_interactions_hexagram ON interactions (hexagram_number, timestamp);
+CREATE INDEX IF NOT EXISTS idx_interactions_success ON interactions (success, timestamp);
+CREATE INDEX IF NOT EXISTS idx_interactions_latency ON interactions (latency_ms);
+CREATE TABLE IF NOT EXISTS imported_sources (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    records INTEGER NOT NULL
+);
+"""
+
+_COLUMNS = (
+    "id", "timestamp", "model", "hexagram_number", "hexagram_name",
+    "changed_hexagram_number", "changed_hexagram_name", "success", "fallback",
+    "latency_ms", "question", "error_message", "source"
+)
+
+
+class InteractionIndex:
+    """交互记录索引（SQLite）"""
+    
+    def __init__(self, db_path: Path = DEFAULT_INDEX_PATH):
+        self.db_path = Path(db_path)
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls) -> "InteractionIndex":
+        """根据环境变量创建索引"""
+        return cls(Path(os.getenv("INTERACTION_INDEX_DB") or DEFAULT_INDEX_PATH))
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            self._db = db
+        return self._db
+    
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+    
+    def add_rows(self, rows: Iterable[Dict]) -> int:
+        """批量写入索引行（id 已存在时忽略），返回新增条数"""
+        values = [tuple(row.get(column) for column in _COLUMNS) for row in rows]
+        if not values:
+            return 0
+        with self._lock:
+            db = self._connect()
+            with db:
+                before = db.total_changes
+                db.executemany(
+                    f"INSERT OR IGNORE INTO interactions ({', '.join(_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                    values
+                )
+                return db.total_changes - before
+    
+    def query(
+        self,
+        model: Optional[str] = None,
+        hexagram_number: Optional[int] = None,
+        hexagram_name: Optional[str] = None,
+        success: Optional[bool] = None,
+        fallback: Optional[bool] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        min_latency_ms: Optional[float] = None,
+        sort: str = "timestamp",
+        descending: bool = True,
+        page: int = 1,
+        page_size: int = 50
+    ) -> Dict:
+        """
+        按条件分页查询交互记录
+        
+        返回：
+            {"items": [...], "total": 总数, "page": 页码, "pageSize": 每页条数}
+        """
+        if sort not in SORTABLE_FIELDS:
+            raise ValueError(f"不支持的排序字段: {sort}，可用字段: {', '.join(SORTABLE_FIELDS)}")
+        
+        where, params = self._build_filters(
+            model=model, hexagram_number=hexagram_number, hexagram_name=hexagram_name,
+            success=success, fallback=fallback, since=since, until=until, min_latency_ms=min_latency_ms
+        )
+        order = f"{sort} {'DESC' if descending else 'ASC'}, id"
+        
+        with self._lock:
+            db = self._connect()
+            total = db.execute(f"SELECT COUNT(*) FROM interactions {where}", params).fetchone()[0]
+            rows = db.execute(
+                f"SELECT * FROM interactions {where} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [page_size, (page - 1) * page_size]
+            ).fetchall()
+        
+        return {
+            "items": [self._row_to_item(row) for row in rows],
+            "total": total,
+            "page": page,
+            "pageSize": page_size
+        }
+    
+    def model_stats(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict]:
+        """按模型统计调用次数、失败率、回退率和平均耗时"""
+        where, params = self._build_filters(since=since, until=until)
+        with self._lock:
+            rows = self._connect().execute(
+                f"""
+                SELECT model,
+                       COUNT(*) AS total,
+                       SUM(success = 0) AS failures,
+                       SUM(fallback) AS fallbacks,
+                       AVG(latency_ms) AS avg_latency_ms
+                FROM interactions {where}
+                GROUP BY model
+                ORDER BY model
+                """,
+                params
+            ).fetchall()
+        
+        return [
+            {
+                "model": row["model"],
+                "total": row["total"],
+                "failures": row["failures"],
+                "fallbacks": row["fallbacks"],
+                "failureRate": round(row["failures"] / row["total"], 4) if row["total"] else 0.0,
+                "fallbackRate": round(row["fallbacks"] / row["total"], 4) if row["total"] else 0.0,
+                "avgLatencyMs": round(row["avg_latency_ms"], 1) if row["avg_latency_ms"] is not None else None
+            }
+            for row in rows
+        ]
+    
+    @staticmethod
+    def _build_filters(**filters) -> tuple:
+        clauses = []
+        params: List = []
+        
+        if filters.get("model"):
+            clauses.append("model = ?")
+            params.append(filters["model"].lower())
+        if filters.get("hexagram_number") is not None:
+            clauses.append("hexagram_number = ?")
+            params.append(filters["hexagram_number"])
+        if filters.get("hexagram_name"):
+            clauses.append("hexagram_name = ?")
+            params.append(filters["hexagram_name"])
+        if filters.get("success") is not None:
+            clauses.append("success = ?")
+            params.append(int(filters["success"]))
+        if filters.get("fallback") is not None:
+            clauses.append("fallback = ?")
+            params.append(int(filters["fallback"]))
+        if filters.get("since") is not None:
+            clauses.append("timestamp >= ?")
+            params.append(filters["since"].isoformat())
+        if filters.get("until") is not None:
+            clauses.append("timestamp < ?")
+            params.append(filters["until"].isoformat())
+        if filters.get("min_latency_ms") is not None:
+            clauses.append("latency_ms >= ?")
+            params.append(filters["min_latency_ms"])
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+    
+    @staticmethod
+    def _row_to_item(row: sqlite3.Row) -> Dict:
+        return {
+            "id": row["id"],
+            "timestamp": row["timestamp"],
+            "model": row["model"],
+            "hexagramNumber": row["hexagram_number"],
+            "hexagramName": row["hexagram_name"],
+            "changedHexagramNumber": row["changed_hexagram_number"],
+            "changedHexagramName": row["changed_hexagram_name"],
+            "success": bool(row["success"]),
+            "fallback": bool(row["fallback"]),
+            "latencyMs": row["latency_ms"],
+            "question": row["question"],
+            "errorMessage": row["error_message"],
+            "source": row["source"]
+        }
+    
+    def backfill(self, log_dir: Path) -> Dict[str, int]:
+        """
+        导入目录下的历史日志（已导入且未修改的文件跳过）
+        
+        返回：
+            {"files": 导入文件数, "records": 新增记录数, "skipped": 跳过文件数}
+        """
+        log_dir = Path(log_dir)
+        result = {"files": 0, "records": 0, "skipped": 0}
+        
+        paths = sorted(log_dir.glob("*.md")) + sorted(log_dir.glob("*.json")) + sorted(log_dir.glob("interactions-*.jsonl*"))
+        for path in paths:
+            mtime = path.stat().st_mtime
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT mtime FROM imported_sources WHERE path = ?", (str(path),)
+                ).fetchone()
+            if row is not None and row["mtime"] == mtime:
+                result["skipped"] += 1
+                continue
+            
+            try:
+                rows = list(self._parse_file(path))
+            except Exception as e:
+                print(f"[ERROR] 导入交互日志失败 {path}: {e}")
+                continue
+            
+            added = self.add_rows(rows)
+            with self._lock:
+                db = self._connect()
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO imported_sources (path, mtime, records) VALUES (?, ?, ?)",
+                        (str(path), mtime, len(rows))
+                    )
+            result["files"] += 1
+            result["records"] += added
+        
+        return result
+    
+    def _parse_file(self, path: Path) -> Iterable[Dict]:
+        if path.suffix == ".md":
+            yield parse_markdown_log(path)
+        elif path.suffix == ".json":
+            yield parse_json_log(path)
+        else:
+            from app.services.interaction_logger import iter_entries
+            for entry in iter_entries(path):
+                yield row_from_entry(entry, source=str(path))
+
+
+def _file_id(path: Path) -> str:
+    """历史日志没有 id，用文件名生成稳定的 id，重复导入不会产生重复记录"""
+    return hashlib.sha1(path.name.encode("utf-8")).hexdigest()[:32]
+
+
+def row_from_record(record: Dict, source: Optional[str] = None) -> Dict:
+    """由写入器中的交互记录生成索引行"""
+    # interaction_logger 导入时会创建带索引的写入器，延迟导入以避免循环引用
+    from app.services.interaction_logger import is_fallback
+    
+    original_hexagram = record["original_hexagram"]
+    changed_hexagram = record["changed_hexagram"]
+    return {
+        "id": record["id"],
+        "timestamp": record["timestamp"].isoformat(),
+        "model": record["model_name"],
+        "hexagram_number": original_hexagram.get("number"),
+        "hexagram_name": original_hexagram.get("name"),
+        "changed_hexagram_number": changed_hexagram.get("number") if changed_hexagram else None,
+        "changed_hexagram_name": changed_hexagram.get("name") if changed_hexagram else None,
+        "success": int(bool(record["success"])),
+        "fallback": int(is_fallback(record["a2ui_response"])),
+        "latency_ms": round(record["latency_ms"], 1) if record.get("latency_ms") is not None else None,
+        "question": record["question"],
+        "error_message": record["error_message"],
+        "source": source
+    }
+
+
+def row_from_entry(entry: Dict, source: Optional[str] = None) -> Dict:
+    """由 JSONL 分段中的一行生成索引行"""
+    return {
+        "id": entry["id"],
+        "timestamp": entry["timestamp"],
+        "model": entry["model"],
+        "hexagram_number": entry.get("hexagram_number"),
+        "hexagram_name": entry.get("hexagram_name"),
+        "changed_hexagram_number": entry.get("changed_hexagram_number"),
+        "changed_hexagram_name": entry.get("changed_hexagram_name"),
+        "success": int(bool(entry.get("success"))),
+        "fallback": int(bool(entry.get("fallback"))),
+        "latency_ms": entry.get("latency_ms"),
+        "question": entry.get("question"),
+        "error_message": entry.get("error_message"),
+        "source": source
+    }
+
+
+def _table_value(text: str, label: str) -> Optional[str]:
+    """读取 Markdown 表格中 | **label** | value | 的值（取第一处）"""
+    match = re.search(rf"^\| \*\*{re.escape(label)}\*\* \| (.*?) \|$", text, re.M)
+    return match.group(1).strip() if match else None
+
+
+def parse_markdown_log(path: Path) -> Dict:
+    """解析旧版 Markdown 交互日志"""
+    text = path.read_text(encoding="utf-8")
+    head, _, rest = text.partition("### 本卦信息")
+    original_part, _, changed_part = rest.partition("### 变卦信息")
+    changed_part = changed_part.partition("### 六爻详情")[0]
+    
+    timestamp = datetime.strptime(_table_value(head, "时间"), "%Y年%m月%d日 %H:%M:%S")
+    
+    # 文件名以 _模型.md 结尾时以文件名为准，早期日志只有 Gemini
+    model = None
+    for name in _MODEL_BY_DISPLAY_NAME.values():
+        if path.stem.endswith(f"_{name}"):
+            model = name
+    if model is None:
+        model = _MODEL_BY_DISPLAY_NAME.get(_table_value(head, "模型") or "", "gemini")
+    
+    question_match = re.search(r"### 用户问题\n\n> (.*)\n", head)
+    
+    def hexagram_number(part: str) -> Optional[int]:
+        value = _table_value(part, "卦序")
+        match = re.search(r"\d+", value or "")
+        return int(match.group()) if match else None
+    
+    return {
+        "id": _file_id(path),
+        "timestamp": timestamp.isoformat(),
+        "model": model,
+        "hexagram_number": hexagram_number(original_part),
+        "hexagram_name": _table_value(original_part, "卦名"),
+        "changed_hexagram_number": hexagram_number(changed_part) if changed_part else None,
+        "changed_hexagram_name": _table_value(changed_part, "卦名") if changed_part else None,
+        "success": int("成功" in (_table_value(head, "状态") or "")),
+        "fallback": int('"generatedBy": "fallback"' in text),
+        "latency_ms": None,
+        "question": question_match.group(1) if question_match else None,
+        "error_message": _table_value(head, "错误信息"),
+        "source": str(path)
+    }
+
+
+def parse_json_log(path: Path) -> Dict:
+    """解析早期 JSON 交互日志"""
+    from app.services.interaction_logger import is_fallback
+    
+    data = json.loads(path.read_text(encoding="utf-8"))
+    metadata = data.get("metadata", {})
+    inputs = data.get("input", {})
+    original_hexagram = inputs.get("original_hexagram") or {}
+    changed_hexagram = inputs.get("changed_hexagram") or None
+    
+    return {
+        "id": _file_id(path),
+        "timestamp": metadata.get("timestamp"),
+        "model": "gemini",
+        "hexagram_number": original_hexagram.get("number"),
+        "hexagram_name": original_hexagram.get("name"),
+        "changed_hexagram_number": changed_hexagram.get("number") if changed_hexagram else None,
+        "changed_hexagram_name": changed_hexagram.get("name") if changed_hexagram else None,
+        "success": int(bool(metadata.get("success"))),
+        "fallback": int(is_fallback(data.get("output", {}).get("a2ui_response"))),
+        "latency_ms": None,
+        "question": inputs.get("question"),
+        "error_message": metadata.get("error_message"),
+        "source": str(path)
+    }
+
+
+class IndexSink:
+    """交互日志写入目标：增量更新索引"""
+    
+    def __init__(self, index: InteractionIndex):
+        self.index = index
+    
+    def write_batch(self, batch: List[Dict]):
+        self.index.add_rows(row_from_record(record) for record in batch)
+    
+    def maybe_rotate(self):
+        pass
+    
+    def close(self):
+        self.index.close()
+
+
+# 全局索引实例
+interaction_index = InteractionIndex.from_env()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 交互记录索引")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    backfill_parser = subparsers.add_parser("backfill", help="导入历史交互日志")
+    backfill_parser.add_argument(
+        "log_dir", nargs="?", type=Path,
+        default=Path(__file__).parent.parent.parent / "logs" / "ai_interactions",
+        help="日志目录"
+    )
+    
+    args = parser.parse_args()
+    if args.command == "backfill":
+        result = interaction_index.backfill(args.log_dir)
+        print(f"导入 {result['files']} 个文件，新增 {result['records']} 条记录，跳过 {result['skipped']} 个未变化的文件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,647 @@
+"""
+AI 交互日志写入器
+
+请求路径上只把交互记录放入有界队列，由后台线程批量写入磁盘，
+不阻塞事件循环。队列满时丢弃新记录并计数，不会拖慢请求。
+
+日志格式：
+    jsonl: 追加写入 JSONL 分段文件（默认），按大小/时间轮转，关闭的分段压缩保存。
+           Prompt 与模板一致时只记录模板 hash，模板全文单独保存一次
+    markdown: 每条记录一个 Markdown 文件（旧格式）
+    JSONL 分段可用 export 命令离线导出为 Markdown：
+        python -m app.services.interaction_logger export logs/ai_interactions/interactions-*.jsonl.gz
+
+环境变量：
+    INTERACTION_LOG_QUEUE_SIZE: 队列容量，默认 1000
+    INTERACTION_LOG_BATCH_SIZE: 每批最多处理的记录数，默认 50
+    INTERACTION_LOG_FORMAT: jsonl / markdown / both，默认 jsonl
+    INTERACTION_LOG_SEGMENT_MB: 分段文件大小上限（MB），默认 64
+    INTERACTION_LOG_SEGMENT_SECONDS: 分段文件时长上限（秒），默认 3600
+    INTERACTION_LOG_COMPRESSION: gzip / zstd / none，默认 gzip（zstd 需安装 zstandard）
+    INTERACTION_INDEX_ENABLED: 设为 0 时不更新交互记录索引（见 interaction_index）
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+from app.services.metrics import LOG_WRITE_SECONDS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# 爻的数字（老阴 6 / 少阳 7 / 少阴 8 / 老阳 9）对应的正面数量
+_LINE_NUMBER_TO_HEADS = {6: 0, 7: 2, 8: 1, 9: 3}
+
+# 模板注册文件名
+PROMPT_TEMPLATES_FILE = "prompt_templates.jsonl"
+
+
+def render_markdown(record: Dict) -> str:
+    """把一条交互记录渲染为 Markdown 文档"""
+    timestamp = record["timestamp"]
+    model_display_name = record["model_display_name"]
+    question = record["question"]
+    original_hexagram = record["original_hexagram"]
+    changed_hexagram = record["changed_hexagram"]
+    lines = record["lines"]
+    prompt = record["prompt"]
+    raw_response = record["raw_response"]
+    parsed_sections = record["parsed_sections"]
+    a2ui_response = record["a2ui_response"]
+    success = record["success"]
+    error_message = record["error_message"]
+
+    # 构建 Markdown 内容
+    md_content = f"""# AI 交互日志
+
+## 元信息
+
+| 项目 | 内容 |
+|------|------|
+| **时间** | {timestamp.strftime("%Y年%m月%d日 %H:%M:%S")} |
+| **状态** | {"✅ 成功" if success else "❌ 失败"} |
+| **模型** | {model_display_name} |
+| **卦名** | {original_hexagram.get("name", "未知")} |
+{"| **错误信息** | " + error_message + " |" if error_message else ""}
+
+---
+
+## 输入参数
+
+### 用户问题
+
+> {question}
+
+### 本卦信息
+
+| 项目 | 内容 |
+|------|------|
+| **卦名** | {original_hexagram.get("name")} |
+| **卦序** | 第 {original_hexagram.get("number")} 卦 |
+| **卦辞** | {original_hexagram.get("judgment")} |
+| **上卦** | {original_hexagram.get("upperTrigram", {}).get("name")}（{original_hexagram.get("upperTrigram", {}).get("symbol")}）- {original_hexagram.get("upperTrigram", {}).get("nature")} |
+| **下卦** | {original_hexagram.get("lowerTrigram", {}).get("name")}（{original_hexagram.get("lowerTrigram", {}).get("symbol")}）- {original_hexagram.get("lowerTrigram", {}).get("nature")} |
+
+"""
+    
+    # 变卦信息（如果有）
+    if changed_hexagram:
+        md_content += f"""### 变卦信息
+
+| 项目 | 内容 |
+|------|------|
+| **卦名** | {changed_hexagram.get("name")} |
+| **卦序** | 第 {changed_hexagram.get("number")} 卦 |
+| **卦辞** | {changed_hexagram.get("judgment")} |
+
+"""
+    
+    # 六爻详情
+    md_content += """### 六爻详情
+
+| 位置 | 名称 | 符号 | 变爻 |
+|------|------|------|------|
+"""
+    for line in lines:
+        changing_mark = "🔄 是" if line.get("changing") else "否"
+        md_content += f"| {line.get('positionName')} | {line.get('name')} | {line.get('symbol')} | {changing_mark} |\n"
+    
+    # Prompt
+    md_content += f"""
+### 发送给 {model_display_name} 的 Prompt
+
+```
+{prompt}
+```
+
+---
+
+## 输出结果
+
+### {model_display_name} 原始响应
+
+```
+{raw_response}
+```
+
+### 解析后的内容
+
+"""
+    
+    # 解析后的 sections
+    for title, content in parsed_sections.items():
+        md_content += f"""#### {title}
+
+{content}
+
+"""
+    
+    # A2UI Response（JSON 格式）
+    md_content += f"""### A2UI Response (JSON)
+
+```json
+{json.dumps(a2ui_response, ensure_ascii=False, indent=2)}
+```
+
+---
+
+*日志生成时间: {timestamp.isoformat()}*
+"""
+    
+    return md_content
+
+
+def is_fallback(a2ui_response: Optional[Dict]) -> bool:
+    """A2UI 数据是否为回退响应"""
+    if not isinstance(a2ui_response, dict):
+        return False
+    return (a2ui_response.get("metadata") or {}).get("generatedBy") == "fallback"
+
+
+def build_entry(record: Dict) -> Dict:
+    """
+    把交互记录压缩为一行 JSONL
+    
+    卦象只保存卦序、卦名和六爻数字（可由此还原完整卦象），
+    A2UI 中重复的卦象数据（data）置空不再保存
+    """
+    original_hexagram = record["original_hexagram"]
+    changed_hexagram = record["changed_hexagram"]
+    
+    # 保留 data 键的位置（置空），还原时按原顺序填回
+    a2ui_response = record["a2ui_response"]
+    if isinstance(a2ui_response, dict) and "data" in a2ui_response:
+        a2ui_response = {k: (None if k == "data" else v) for k, v in a2ui_response.items()}
+    
+    entry = {
+        "id": record.get("id") or uuid.uuid4().hex,
+        "timestamp": record["timestamp"].isoformat(),
+        "model": record["model_name"],
+        "model_display_name": record["model_display_name"],
+        "success": record["success"],
+        "fallback": is_fallback(record["a2ui_response"]),
+        "error_message": record["error_message"],
+        "latency_ms": round(record["latency_ms"], 1) if record.get("latency_ms") is not None else None,
+        "question": record["question"],
+        "hexagram_number": original_hexagram.get("number"),
+        "hexagram_name": original_hexagram.get("name"),
+        "changed_hexagram_number": changed_hexagram.get("number") if changed_hexagram else None,
+        "changed_hexagram_name": changed_hexagram.get("name") if changed_hexagram else None,
+        "line_numbers": [line.get("number") for line in record["lines"]],
+        "prompt_template": None,
+        "prompt": record["prompt"],
+        "raw_response": record["raw_response"],
+        "a2ui_response": a2ui_response
+    }
+    
+    # Prompt 与模板渲染结果一致时只保存模板 hash
+    template = record.get("prompt_template")
+    if template and record["prompt"]:
+        from app.services.base_ai_service import BaseAIService
+        variables = BaseAIService.build_prompt_variables(
+            record["model_name"], record["question"], original_hexagram, changed_hexagram, record["lines"]
+        )
+        if template.format(**variables) == record["prompt"]:
+            entry["prompt_template"] = record["prompt_template_hash"]
+            entry["prompt"] = None
+    
+    return entry
+
+
+def restore_record(entry: Dict, templates: Dict[str, str]) -> Dict:
+    """由 JSONL 行还原完整交互记录（用于离线导出）"""
+    from app.services.base_ai_service import BaseAIService
+    from app.services.liuyao_service import LiuYaoService
+    
+    coin_results = [
+        [1] * _LINE_NUMBER_TO_HEADS.get(number, 0) + [0] * (3 - _LINE_NUMBER_TO_HEADS.get(number, 0))
+        for number in entry["line_numbers"]
+    ]
+    hexagram_result = LiuYaoService().calculate_hexagram(coin_results)
+    original_hexagram = hexagram_result["original_hexagram"]
+    changed_hexagram = hexagram_result.get("changed_hexagram")
+    lines = hexagram_result["lines"]
+    
+    prompt = entry["prompt"]
+    if entry["prompt_template"]:
+        template = templates.get(entry["prompt_template"])
+        if template is None:
+            prompt = f"[Prompt 模板 {entry['prompt_template']} 缺失]"
+        else:
+            prompt = template.format(**BaseAIService.build_prompt_variables(
+                entry["model"], entry["question"], original_hexagram, changed_hexagram, lines
+            ))
+    
+    a2ui_response = dict(entry["a2ui_response"] or {})
+    if "data" in a2ui_response:
+        a2ui_response["data"] = {
+            "question": entry["question"],
+            "originalHexagram": original_hexagram,
+            "changedHexagram": changed_hexagram,
+            "lines": lines
+        }
+    
+    return {
+        "id": entry["id"],
+        "timestamp": datetime.fromisoformat(entry["timestamp"]),
+        "model_name": entry["model"],
+        "model_display_name": entry["model_display_name"],
+        "question": entry["question"],
+        "original_hexagram": original_hexagram,
+        "changed_hexagram": changed_hexagram,
+        "lines": lines,
+        "prompt": prompt,
+        "raw_response": entry["raw_response"],
+        "parsed_sections": BaseAIService._extract_sections_from_a2ui(a2ui_response) if a2ui_response else {},
+        "a2ui_response": a2ui_response,
+        "success": entry["success"],
+        "error_message": entry["error_message"]
+    }
+
+
+def open_segment(path: Path):
+    """以文本方式打开 JSONL 分段（自动识别 gzip / zstd 压缩）"""
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError("读取 .zst 分段需要安装 zstandard")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_entries(path: Path) -> Iterator[Dict]:
+    """逐行读取 JSONL 分段，跳过写入中断造成的残行"""
+    with open_segment(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def load_templates(log_dir: Path) -> Dict[str, str]:
+    """读取模板注册文件：hash -> 模板全文"""
+    templates = {}
+    path = log_dir / PROMPT_TEMPLATES_FILE
+    if path.exists():
+        for entry in iter_entries(path):
+            templates[entry["hash"]] = entry["template"]
+    return templates
+
+
+class MarkdownFileSink:
+    """每条记录写一个 Markdown 文件"""
+    
+    def write_batch(self, batch: List[Dict]):
+        for record in batch:
+            timestamp = record["timestamp"]
+            log_dir: Path = record["log_dir"]
+            log_filename = timestamp.strftime("%Y%m%d_%H%M%S") + f"_{record['original_hexagram'].get('name', 'unknown')}_{record['model_name']}.md"
+            log_path = log_dir / log_filename
+            
+            with open(log_path, "w", encoding="utf-8") as f:
+                f.write(render_markdown(record))
+            print(f"[LOG] AI 交互日志已保存: {log_path}")
+    
+    def maybe_rotate(self):
+        pass
+    
+    def close(self):
+        pass
+
+
+class JsonlSegmentSink:
+    """追加写入 JSONL 分段文件，按大小/时间轮转，关闭的分段压缩保存"""
+    
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_age: float = 3600, compression: str = "gzip"):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        if compression == "zstd" and zstandard is None:
+            print("[WARN] 未安装 zstandard，交互日志改用 gzip 压缩")
+            compression = "gzip"
+        self.compression = compression
+        
+        self._dir: Optional[Path] = None
+        self._path: Optional[Path] = None
+        self._file = None
+        self._opened_at = 0.0
+        self._size = 0
+        self._seq = 0
+        self._known_templates: Dict[Path, Set[str]] = {}
+    
+    @property
+    def current_path(self) -> Optional[Path]:
+        """当前正在写入的分段"""
+        return self._path
+    
+    def write_batch(self, batch: List[Dict]):
+        entries = []
+        for record in batch:
+            log_dir: Path = record["log_dir"]
+            if log_dir != self._dir:
+                self._rotate(log_dir)
+            entry = build_entry(record)
+            if entry["prompt_template"]:
+                self._register_template(log_dir, entry["prompt_template"], record["prompt_template"])
+            entries.append(entry)
+        
+        if self._file is None:
+            self._rotate(self._dir)
+        
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        
+        print(f"[LOG] {len(entries)} 条 AI 交互日志已写入: {self._path}")
+        self.maybe_rotate()
+    
+    def maybe_rotate(self):
+        """分段超过大小或时长上限时轮转"""
+        if self._file is None:
+            return
+        if self._size >= self.max_bytes or time.time() - self._opened_at >= self.max_age:
+            self._rotate(self._dir)
+    
+    def close(self):
+        self._close_segment()
+    
+    def _rotate(self, log_dir: Path):
+        """关闭（并压缩）当前分段，在 log_dir 下开启新分段"""
+        self._close_segment()
+        
+        log_dir.mkdir(parents=True, exist_ok=True)
+        self._seq += 1
+        name = f"interactions-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._seq}.jsonl"
+        self._dir = log_dir
+        self._path = log_dir / name
+        self._file = open(self._path, "ab")
+        self._opened_at = time.time()
+        self._size = 0
+    
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        
+        path = self._path
+        if self._size == 0:
+            path.unlink(missing_ok=True)
+        elif self.compression in ("gzip", "zstd"):
+            self._compress(path)
+    
+    def _compress(self, path: Path):
+        """压缩已关闭的分段，完成后删除原文件"""
+        if self.compression == "zstd":
+            target = path.with_name(path.name + ".zst")
+            with open(path, "rb") as src, open(target, "wb") as dst:
+                zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+        else:
+            target = path.with_name(path.name + ".gz")
+            with open(path, "rb") as src, gzip.open(target, "wb", compresslevel=6) as dst:
+                while True:
+                    block = src.read(1024 * 1024)
+                    if not block:
+                        break
+                    dst.write(block)
+        path.unlink()
+    
+    def _register_template(self, log_dir: Path, template_hash: str, template: str):
+        """模板首次出现时写入模板注册文件"""
+        known = self._known_templates.get(log_dir)
+        if known is None:
+            known = set(load_templates(log_dir))
+            self._known_templates[log_dir] = known
+        if template_hash in known:
+            return
+        with open(log_dir / PROMPT_TEMPLATES_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"hash": template_hash, "template": template}, ensure_ascii=False) + "\n")
+        known.add(template_hash)
+
+
+def create_sinks(log_format: str) -> List:
+    """根据日志格式创建写入目标"""
+    sinks = []
+    if log_format in ("jsonl", "both"):
+        sinks.append(JsonlSegmentSink(
+            max_bytes=int(float(os.getenv("INTERACTION_LOG_SEGMENT_MB", "64")) * 1024 * 1024),
+            max_age=float(os.getenv("INTERACTION_LOG_SEGMENT_SECONDS", "3600")),
+            compression=os.getenv("INTERACTION_LOG_COMPRESSION", "gzip")
+        ))
+    if log_format in ("markdown", "both"):
+        sinks.append(MarkdownFileSink())
+    if os.getenv("INTERACTION_INDEX_ENABLED", "1") != "0":
+        from app.services.interaction_index import IndexSink, interaction_index
+        sinks.append(IndexSink(interaction_index))
+    return sinks
+
+
+def export_markdown(segment_paths: List[Path], out_dir: Path) -> int:
+    """
+    离线导出：把 JSONL 分段中的记录渲染为 Markdown 文件
+    
+    返回：
+        导出的记录数
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    templates_by_dir: Dict[Path, Dict[str, str]] = {}
+    count = 0
+    
+    for segment_path in segment_paths:
+        log_dir = segment_path.parent
+        if log_dir not in templates_by_dir:
+            templates_by_dir[log_dir] = load_templates(log_dir)
+        
+        for entry in iter_entries(segment_path):
+            record = restore_record(entry, templates_by_dir[log_dir])
+            filename = (
+                record["timestamp"].strftime("%Y%m%d_%H%M%S")
+                + f"_{record['original_hexagram'].get('name', 'unknown')}_{record['model_name']}_{record['id'][:8]}.md"
+            )
+            with open(out_dir / filename, "w", encoding="utf-8") as f:
+                f.write(render_markdown(record))
+            count += 1
+    
+    return count
+
+
+class InteractionLogWriter:
+    """后台批量写入交互日志"""
+    
+    # 等待新记录的最长时间（秒），超时后检查是否需要退出
+    POLL_INTERVAL = 1.0
+    
+    def __init__(self, max_queue: int = 1000, batch_size: int = 50, sinks: Optional[List] = None):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.sinks = sinks if sinks is not None else [JsonlSegmentSink()]
+        
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        
+        # 统计计数
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+    
+    @classmethod
+    def from_env(cls) -> "InteractionLogWriter":
+        """根据环境变量创建写入器"""
+        return cls(
+            max_queue=int(os.getenv("INTERACTION_LOG_QUEUE_SIZE", "1000")),
+            batch_size=int(os.getenv("INTERACTION_LOG_BATCH_SIZE", "50")),
+            sinks=create_sinks(os.getenv("INTERACTION_LOG_FORMAT", "jsonl"))
+        )
+    
+    def submit(self, record: Dict) -> bool:
+        """
+        提交一条交互记录（不阻塞）
+        
+        返回：
+            是否成功入队，队列已满时丢弃并返回 False
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+    
+    def flush(self, timeout: Optional[float] = None):
+        """等待队列中已有的记录全部写完"""
+        if self._thread is None:
+            return
+        if timeout is None:
+            self._queue.join()
+            return
+        
+        done = threading.Event()
+        
+        def wait():
+            self._queue.join()
+            done.set()
+        
+        threading.Thread(target=wait, daemon=True).start()
+        done.wait(timeout)
+    
+    def stop(self, timeout: float = 5.0):
+        """写完剩余记录后停止后台线程，关闭（并压缩）当前分段"""
+        self.flush(timeout)
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._stopping.clear()
+        
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"[ERROR] 关闭交互日志失败: {e}")
+    
+    def stats(self) -> Dict:
+        """写入统计"""
+        return {
+            "queueDepth": self._queue.qsize(),
+            "maxQueue": self.max_queue,
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+    
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="interaction-log-writer", daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                self._maybe_rotate()
+                continue
+            
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    def _write_batch(self, batch: List[Dict]):
+        """把一批记录写入所有目标"""
+        ok = True
+        with LOG_WRITE_SECONDS.time():
+            for sink in self.sinks:
+                try:
+                    sink.write_batch(batch)
+                except Exception as e:
+                    ok = False
+                    print(f"[ERROR] 保存 AI 交互日志失败: {e}")
+        if ok:
+            self.written += len(batch)
+        else:
+            self.failed += len(batch)
+    
+    def _maybe_rotate(self):
+        """空闲时检查分段是否需要按时间轮转"""
+        for sink in self.sinks:
+            try:
+                sink.maybe_rotate()
+            except Exception as e:
+                print(f"[ERROR] 轮转交互日志失败: {e}")
+
+
+# 全局写入器实例
+interaction_log_writer = InteractionLogWriter.from_env()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 交互日志工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    export_parser = subparsers.add_parser("export", help="把 JSONL 分段导出为 Markdown")
+    export_parser.add_argument("segments", nargs="+", type=Path, help="JSONL 分段文件（.jsonl/.jsonl.gz/.jsonl.zst）")
+    export_parser.add_argument("-o", "--out-dir", type=Path, default=Path("logs/markdown_export"), help="输出目录")
+    
+    args = parser.parse_args()
+    if args.command == "export":
+        count = export_markdown(args.segments, args.out_dir)
+        print(f"已导出 {count} 条记录到 {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+AI 解读结果缓存
+
+相同问题 + 相同卦象 + 相同模型的解读直接复用，避免重复构建 Prompt 和付费调用。
+- 进程内：LRU + TTL
+- 磁盘（可选）：SQLite，重启后保留，同机多个 uvicorn worker 共享
+
+环境变量：
+    INTERPRETATION_CACHE_SIZE: 进程内最多缓存条数，默认 1024，0 表示关闭缓存
+    INTERPRETATION_CACHE_TTL: 缓存有效期（秒），默认 86400
+    INTERPRETATION_CACHE_DB: SQLite 文件路径，不设置则不启用磁盘缓存
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+# 问题首尾可忽略的标点
+_QUESTION_PUNCTUATION = "?？!！.。,，;；:：~～…、"
+_WHITESPACE = re.compile(r"\s+")
+
+
+class InterpretationCache:
+    """解读结果缓存（进程内 LRU + 可选 SQLite）"""
+    
+    # 磁盘缓存每写入多少次清理一次过期数据
+    PURGE_INTERVAL = 256
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        
+        # 统计计数
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @classmethod
+    def from_env(cls) -> "InterpretationCache":
+        """根据环境变量创建缓存"""
+        return cls(
+            max_entries=int(os.getenv("INTERPRETATION_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("INTERPRETATION_CACHE_TTL", "86400")),
+            db_path=os.getenv("INTERPRETATION_CACHE_DB") or None
+        )
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+    
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """规范化问题：全半角统一、去首尾空白和标点、合并空白、英文小写"""
+        question = unicodedata.normalize("NFKC", question)
+        question = _WHITESPACE.sub(" ", question).strip().strip(_QUESTION_PUNCTUATION).strip()
+        return question.lower()
+    
+    @classmethod
+    def make_key(
+        cls,
+        model_name: str,
+        question: str,
+        original_hexagram: Dict,
+        changed_hexagram: Optional[Dict]
+    ) -> str:
+        """生成缓存 key：(规范化问题, 本卦, 变卦, 模型)"""
+        changed_number = changed_hexagram.get("number") if changed_hexagram else 0
+        raw_key = "\x1f".join([
+            model_name,
+            cls.normalize_question(question),
+            str(original_hexagram.get("number")),
+            str(changed_number)
+        ])
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+    
+    async def get(self, key: str) -> Optional[Dict]:
+        """读取缓存，未命中或已过期返回 None"""
+        if not self.enabled:
+            return None
+        
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        
+        if self.db_path:
+            value = await asyncio.to_thread(self._db_get, key, now)
+            if value is not None:
+                self.disk_hits += 1
+                self._remember(key, value, now + self.ttl)
+                return value
+        
+        self.misses += 1
+        return None
+    
+    async def set(self, key: str, value: Dict):
+        """写入缓存"""
+        if not self.enabled:
+            return
+        
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        
+        if self.db_path:
+            await asyncio.to_thread(self._db_set, key, value, expires_at)
+    
+    def stats(self) -> Dict:
+        """缓存统计"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttl": self.ttl,
+            "disk": bool(self.db_path),
+            "hits": self.hits,
+            "diskHits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
+    
+    def _remember(self, key: str, value: Dict, expires_at: float):
+        """写入进程内 LRU，超出容量时淘汰最久未使用的条目"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开 SQLite 连接（WAL 模式，支持多进程并发读写）"""
+        if self._db is None:
+            db = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS interpretation_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db = db
+        return self._db
+    
+    def _db_get(self, key: str, now: float) -> Optional[Dict]:
+        try:
+            with self._db_lock:
+                row = self._connect().execute(
+                    "SELECT value FROM interpretation_cache WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[ERROR] 读取解读缓存失败: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+    
+    def _db_set(self, key: str, value: Dict, expires_at: float):
+        try:
+            payload = json.dumps(value, ensure_ascii=False)
+            with self._db_lock:
+                db = self._connect()
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO interpretation_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, payload, expires_at)
+                    )
+                    self._writes += 1
+                    if self._writes % self.PURGE_INTERVAL == 0:
+                        db.execute("DELETE FROM interpretation_cache WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            print(f"[ERROR] 写入解读缓存失败: {e}")
+
+
+# 全局缓存实例
+interpretation_cache = InterpretationCache.from_env()
@@ -0,0 +1,269 @@
+"""
+后台任务队列
+
+占卜的 AI 解读可以作为后台任务执行：提交后立即返回任务 ID，
+由固定数量的 worker 在后台运行，客户端轮询（可长轮询）或订阅任务结果，
+不必为整个上游调用保持一个长时间的 HTTP 请求。
+- 排队任务数有上限，队列满时拒绝提交
+- 结束的任务保留一段时间（结果 TTL）后清除
+- 排队中或运行中的任务都可以取消
+
+环境变量：
+    DIVINATION_JOB_WORKERS: 并发执行的任务数，默认 16
+    DIVINATION_JOB_MAX_QUEUE: 最多排队任务数，默认 256
+    DIVINATION_JOB_RESULT_TTL: 结束的任务保留时长（秒），默认 600
+"""
+import asyncio
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限"""
+    
+    def __init__(self, max_queue: int):
+        super().__init__(f"后台任务队列已满（{max_queue}），请稍后重试")
+        self.max_queue = max_queue
+
+
+class Job:
+    """一个后台任务"""
+    
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    
+    FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+    
+    def __init__(self, job_id: str, func: Callable[[], Awaitable[Any]], payload: Dict):
+        self.id = job_id
+        self.func = func
+        # 调用方附带的数据（如卦象），随任务一起返回
+        self.payload = payload
+        self.status = self.QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        # 状态变化时通知等待者（长轮询、订阅），每次变化后替换为新的 Event
+        self._changed = asyncio.Event()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in self.FINISHED
+    
+    def set_status(self, status: str):
+        """更新状态并唤醒等待者"""
+        self.status = status
+        if status in self.FINISHED:
+            self.finished_at = time.time()
+            self.func = None
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    async def wait_changed(self, timeout: float) -> bool:
+        """
+        等待下一次状态变化
+        
+        返回：
+            超时前状态是否发生了变化
+        """
+        if self.finished:
+            return False
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    async def wait_finished(self, timeout: float) -> bool:
+        """等待任务结束，返回超时前是否已结束"""
+        end = time.monotonic() + timeout
+        while not self.finished:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return False
+            await self.wait_changed(remaining)
+        return True
+
+
+class JobQueue:
+    """有界后台任务队列（固定数量的 worker + 结果 TTL）"""
+    
+    # 每隔多少秒清理一次过期任务
+    PURGE_INTERVAL = 5.0
+    
+    def __init__(self, workers: int = 16, max_queue: int = 256, result_ttl: float = 600):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        # 排队中（未取消）的任务数；排队时取消的任务仍留在 _queue 中，由 worker 取出后跳过
+        self._queued = 0
+        self._workers: List[asyncio.Task] = []
+        self._stopping = False
+        self._last_purge = 0.0
+        
+        # 统计计数
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.expired = 0
+    
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        """根据环境变量创建任务队列"""
+        return cls(
+            workers=int(os.getenv("DIVINATION_JOB_WORKERS", "16")),
+            max_queue=int(os.getenv("DIVINATION_JOB_MAX_QUEUE", "256")),
+            result_ttl=float(os.getenv("DIVINATION_JOB_RESULT_TTL", "600"))
+        )
+    
+    def _ensure_started(self):
+        """首次提交时在当前事件循环中启动 worker"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    def submit(self, func: Callable[[], Awaitable[Any]], payload: Optional[Dict] = None) -> Job:
+        """
+        提交任务
+        
+        参数：
+            func: 任务函数，返回值作为任务结果
+            payload: 随任务保存的数据
+        
+        异常：
+            JobQueueFull: 排队任务数已达上限
+        """
+        self._purge()
+        self._ensure_started()
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise JobQueueFull(self.max_queue)
+        
+        job = Job(secrets.token_urlsafe(12), func, payload or {})
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self._queued += 1
+        self.submitted += 1
+        return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        """获取任务，不存在或已过期时返回 None"""
+        self._purge()
+        return self._jobs.get(job_id)
+    
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        取消任务：排队中的任务不再执行，运行中的任务被取消（进而取消上游调用）
+        
+        返回：
+            任务，不存在或已过期时返回 None
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            self._queued -= 1
+            self._finish(job, Job.CANCELLED)
+        return job
+    
+    async def stop(self):
+        """停止 worker，取消所有未结束的任务（应用关闭时调用）"""
+        self._stopping = True
+        for job in list(self._jobs.values()):
+            if not job.finished:
+                self.cancel(job.id)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._queued = 0
+        self._stopping = False
+    
+    def stats(self) -> Dict:
+        """任务队列统计"""
+        running = sum(1 for job in self._jobs.values() if job.status == Job.RUNNING)
+        return {
+            "queued": self._queued,
+            "running": running,
+            "workers": self.workers,
+            "maxQueue": self.max_queue,
+            "retained": len(self._jobs),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "expired": self.expired
+        }
+    
+    async def _worker(self):
+        """依次从队列取出任务执行"""
+        while True:
+            job = await self._queue.get()
+            if job.finished:
+                # 排队时已取消（取消时已从排队数中减去）
+                continue
+            
+            self._queued -= 1
+            job.task = asyncio.create_task(job.func())
+            job.set_status(Job.RUNNING)
+            try:
+                job.result = await job.task
+                self._finish(job, Job.SUCCEEDED)
+            except asyncio.CancelledError:
+                if self._stopping or not job.task.cancelled():
+                    # worker 自身被取消（应用关闭；任务可能同时被 stop 取消，不能据此判断）
+                    job.task.cancel()
+                    self._finish(job, Job.CANCELLED)
+                    raise
+                self._finish(job, Job.CANCELLED)
+            except Exception as e:
+                self._finish(job, Job.FAILED, str(e) or type(e).__name__)
+            finally:
+                job.task = None
+    
+    def _finish(self, job: Job, status: str, error: Optional[str] = None):
+        job.error = error
+        job.set_status(status)
+        if status == Job.SUCCEEDED:
+            self.succeeded += 1
+        elif status == Job.FAILED:
+            self.failed += 1
+        else:
+            self.cancelled += 1
+    
+    def _purge(self):
+        """清除结束超过 TTL 的任务（节流执行）"""
+        now = time.time()
+        if now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self.expired += len(expired)
+
+
+# 全局任务队列
+job_queue = JobQueue.from_env()
@@ -0,0 +1,37 @@
+"""
+上游调用耗时统计
+
+保留最近若干次成功调用的耗时，用于计算分位数（如对冲请求的 p95 触发时间）
+"""
+from collections import deque
+from typing import Deque, Optional
+
+
+class LatencyTracker:
+    """最近 N 次调用耗时的滑动样本"""
+    
+    def __init__(self, max_samples: int = 200):
+        self._samples: Deque[float] = deque(maxlen=max_samples)
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+    
+    def add(self, latency_ms: float):
+        """记录一次调用耗时（毫秒）"""
+        self._samples.append(latency_ms)
+    
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        计算耗时分位数
+        
+        参数：
+            p: 分位（0-100）
+        
+        返回：
+            分位耗时（毫秒），无样本时返回 None
+        """
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(len(ordered) * p / 100), len(ordered) - 1)
+        return ordered[index]
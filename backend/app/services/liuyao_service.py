@@ -10,8 +10,15 @@
    - 0正3反 = 老阴（6）⚋ → 变为阳
 3. 从下往上排列，得到六爻
 4. 根据六爻组成八卦，下三爻为下卦（内卦），上三爻为上卦（外卦）
+
+卦象编码：
+    六爻用 6 位整数（卦掩码）表示，第 i 位对应第 i+1 爻（初爻为最低位），1=阳，0=阴。
+    变爻同样编码为变爻掩码，变卦 = 本卦掩码 XOR 变爻掩码。
+    64 卦和 24 种爻（6 个爻位 × 4 种爻）在模块导入时预计算，
+    每次起卦只需计算掩码并查表。
 """
-from typing import List, Dict, Optional
+from array import array
+from typing import Iterable, List, Dict, Optional, Tuple
 
 
 class LiuYaoService:
@@ -116,6 +123,15 @@ class LiuYaoService:
     # 爻位名称
     LINE_NAMES = ["初爻", "二爻", "三爻", "四爻", "五爻", "上爻"]
     
+    # 预计算查找表（模块末尾填充，所有条目只读，调用方不应修改）
+    # LINE_TABLE[爻位][正面数量] -> 爻信息
+    LINE_TABLE: List[List[Dict]] = []
+    # HEXAGRAM_TABLE[卦掩码] -> 卦信息（含上下卦、爻值）
+    HEXAGRAM_TABLE: List[Dict] = []
+    # MASK_BY_CODE / CHANGE_MASK_BY_CODE[正面数量编码] -> 本卦掩码 / 变爻掩码
+    MASK_BY_CODE: array = array("B")
+    CHANGE_MASK_BY_CODE: array = array("B")
+    
     def calculate_line(self, coins: List[int]) -> Dict:
         """
         根据三枚铜钱的正反面计算单爻
@@ -195,67 +211,126 @@ class LiuYaoService:
             "judgment": "卦辞待查"
         }
     
-    def calculate_hexagram(self, coin_results: List[List[int]]) -> Dict:
+    @staticmethod
+    def count_heads(coins: List[int]) -> int:
+        """计算正面数量，与 calculate_line 一致：非 1/2/3 均视为 0（老阴）"""
+        heads = sum(coins)
+        return heads if heads in (1, 2, 3) else 0
+    
+    def calculate_masks(self, coin_results: List[List[int]]) -> Tuple[int, int, List[Dict]]:
         """
-        根据6次掷铜钱结果计算完整卦象
-        
-        参数：
-            coin_results: 6次掷铜钱结果
+        根据6次掷铜钱结果计算卦掩码
         
         返回：
-            卦象信息，包含本卦、变卦（如有）、六爻详情（使用 camelCase 以匹配前端）
+            (本卦掩码, 变爻掩码, 六爻详情)
         """
-        # 计算六爻
+        line_table = self.LINE_TABLE
+        mask = 0
+        change_mask = 0
         lines = []
-        has_changing = False
         
         for i, coins in enumerate(coin_results):
-            line = self.calculate_line(coins)
-            line["position"] = i + 1
-            line["positionName"] = self.LINE_NAMES[i]  # camelCase
+            line = line_table[i][self.count_heads(coins)]
             lines.append(line)
-            
+            if line["value"]:
+                mask |= 1 << i
             if line["changing"]:
-                has_changing = True
-        
-        # 提取爻值（从下到上）
-        original_values = tuple(line["value"] for line in lines)
-        
-        # 计算下卦（内卦）和上卦（外卦）
-        # 下卦：初爻、二爻、三爻
-        # 上卦：四爻、五爻、上爻
-        lower_lines = original_values[:3]
-        upper_lines = original_values[3:]
-        
-        lower_trigram = self.get_trigram(lower_lines)
-        upper_trigram = self.get_trigram(upper_lines)
-        
-        # 获取本卦（使用 camelCase）
-        original_hexagram = self.get_hexagram(upper_trigram["name"], lower_trigram["name"])
-        original_hexagram["lowerTrigram"] = lower_trigram  # camelCase
-        original_hexagram["upperTrigram"] = upper_trigram  # camelCase
-        original_hexagram["lines"] = list(original_values)
+                change_mask |= 1 << i
         
+        return mask, change_mask, lines
+    
+    def encode_heads(self, coin_results: List[List[int]]) -> int:
+        """把6次掷铜钱结果编码为 12 位整数，每爻 2 位存正面数量（初爻在最低位）"""
+        code = 0
+        for i, coins in enumerate(coin_results):
+            code |= self.count_heads(coins) << (2 * i)
+        return code
+    
+    def encode_heads_batch(self, batch: Iterable[List[List[int]]]) -> array:
+        """批量编码起卦结果，返回紧凑的无符号短整型数组"""
+        return array("H", map(self.encode_heads, batch))
+    
+    def build_result(self, mask: int, change_mask: int, lines: List[Dict]) -> Dict:
+        """根据掩码组装卦象结果（结构同 calculate_hexagram）"""
         result = {
-            "original_hexagram": original_hexagram,
+            "original_hexagram": self.HEXAGRAM_TABLE[mask],
             "lines": lines,
-            "has_changing": has_changing
+            "has_changing": change_mask != 0
         }
         
-        # 如果有变爻，计算变卦
-        if has_changing:
-            changed_values = tuple(line["changedValue"] for line in lines)  # camelCase
-            changed_lower_lines = changed_values[:3]
-            changed_upper_lines = changed_values[3:]
-            
-            changed_lower_trigram = self.get_trigram(changed_lower_lines)
-            changed_upper_trigram = self.get_trigram(changed_upper_lines)
-            
-            changed_hexagram = self.get_hexagram(changed_upper_trigram["name"], changed_lower_trigram["name"])
-            changed_hexagram["lowerTrigram"] = changed_lower_trigram  # camelCase
-            changed_hexagram["upperTrigram"] = changed_upper_trigram  # camelCase
-            changed_hexagram["lines"] = list(changed_values)
-            
-            result["changed_hexagram"] = changed_hexagram
+        # 如果有变爻，变卦 = 本卦掩码 XOR 变爻掩码
+        if change_mask:
+            result["changed_hexagram"] = self.HEXAGRAM_TABLE[mask ^ change_mask]
         
         return result
+    
+    def calculate_hexagram(self, coin_results: List[List[int]]) -> Dict:
+        """
+        根据6次掷铜钱结果计算完整卦象
+        
+        参数：
+            coin_results: 6次掷铜钱结果
+        
+        返回：
+            卦象信息，包含本卦、变卦（如有）、六爻详情（使用 camelCase 以匹配前端）
+            返回的卦、爻信息来自预计算表，为共享只读对象
+        """
+        mask, change_mask, lines = self.calculate_masks(coin_results)
+        return self.build_result(mask, change_mask, lines)
+
+
+def _build_line_table(service: LiuYaoService) -> List[List[Dict]]:
+    """预计算 6 个爻位 × 4 种正面数量的爻信息"""
+    table = []
+    for i, position_name in enumerate(LiuYaoService.LINE_NAMES):
+        row = []
+        for heads in range(4):
+            line = service.calculate_line([1] * heads + [0] * (3 - heads))
+            line["position"] = i + 1
+            line["positionName"] = position_name  # camelCase
+            row.append(line)
+        table.append(row)
+    return table
+
+
+def _build_hexagram_table(service: LiuYaoService) -> List[Dict]:
+    """预计算 64 卦，下标为卦掩码"""
+    table = []
+    for mask in range(64):
+        values = tuple((mask >> i) & 1 for i in range(6))
+        lower_trigram = service.get_trigram(values[:3])
+        upper_trigram = service.get_trigram(values[3:])
+        
+        hexagram = service.get_hexagram(upper_trigram["name"], lower_trigram["name"])
+        hexagram["lowerTrigram"] = lower_trigram  # camelCase
+        hexagram["upperTrigram"] = upper_trigram  # camelCase
+        hexagram["lines"] = list(values)
+        table.append(hexagram)
+    return table
+
+
+_table_builder = LiuYaoService()
+LiuYaoService.LINE_TABLE = _build_line_table(_table_builder)
+LiuYaoService.HEXAGRAM_TABLE = _build_hexagram_table(_table_builder)
+del _table_builder
+
+
+def _build_code_tables() -> Tuple[array, array]:
+    """预计算 12 位正面数量编码到本卦掩码、变爻掩码的映射"""
+    masks = array("B", bytes(4096))
+    change_masks = array("B", bytes(4096))
+    for code in range(4096):
+        mask = 0
+        change_mask = 0
+        for i in range(6):
+            heads = (code >> (2 * i)) & 3
+            if heads >= 2:
+                mask |= 1 << i
+            if heads in (0, 3):
+                change_mask |= 1 << i
+        masks[code] = mask
+        change_masks[code] = change_mask
+    return masks, change_masks
+
+
+LiuYaoService.MASK_BY_CODE, LiuYaoService.CHANGE_MASK_BY_CODE = _build_code_tables()
@@ -0,0 +1,249 @@
+"""
+运行指标
+
+进程内收集计数器、仪表和直方图，以 Prometheus 文本格式在 /metrics 输出，
+不依赖外部采集组件。指标可在事件循环和日志写入线程中同时更新。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+
+# 耗时直方图的默认分桶（秒）：覆盖从微秒级的查表到数十秒的模型调用
+DEFAULT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 90.0, 120.0
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """格式化标签，如 {stage="upstream",model="gemini"}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    """转义标签值中的反斜杠、换行和引号"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """格式化样本值，整数不带小数点"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类：按标签值分组保存样本"""
+    
+    TYPE = ""
+    
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+    
+    def render(self) -> List[str]:
+        """输出 Prometheus 文本格式"""
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.TYPE}"] + self._render_samples()
+    
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    
+    TYPE = "counter"
+    
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+    
+    TYPE = "gauge"
+    
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+    
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+    
+    TYPE = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：(各分桶计数, 总和, 总数)
+        self._values: Dict[Tuple[str, ...], List] = {}
+    
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+    
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """计时上下文，退出时记录耗时（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, ([*entry[0]], entry[1], entry[2])) for key, entry in self._values.items())
+        
+        out = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                out.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labels, key, 'le="+Inf"')
+            out.append(f"{self.name}_bucket{le} {count}")
+            out.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            out.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return out
+
+
+class MetricsRegistry:
+    """指标注册表"""
+    
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+    
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        """输出全部指标（Prometheus 文本格式 0.0.4）"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# 占卜请求各阶段耗时：hexagram/cache/admission/prompt_build/upstream/parse/log_write/serialize/store/total
+STAGE_SECONDS = registry.register(Histogram(
+    "zhouyi_stage_seconds", "占卜请求各阶段耗时（秒）", ("stage", "model")
+))
+
+# 上游模型 token 用量：prompt/completion，prompt_cached 为命中前缀缓存的输入 token（包含在 prompt 中）
+UPSTREAM_TOKENS = registry.register(Counter(
+    "zhouyi_upstream_tokens_total", "上游模型 token 用量", ("model", "type")
+))
+
+# 回退响应次数：not_configured/circuit_open/timeout/upstream_error/parse_error
+FALLBACKS = registry.register(Counter(
+    "zhouyi_fallback_total", "使用回退响应的次数", ("model", "reason")
+))
+
+# 解读缓存查询
+CACHE_REQUESTS = registry.register(Counter(
+    "zhouyi_cache_requests_total", "解读缓存查询次数", ("model", "result")
+))
+
+# 进行中的请求（抓取时由准入控制器和请求合并的状态填充）
+UPSTREAM_IN_FLIGHT = registry.register(Gauge(
+    "zhouyi_upstream_in_flight", "进行中的上游调用数", ("model",)
+))
+UPSTREAM_WAITING = registry.register(Gauge(
+    "zhouyi_upstream_waiting", "排队等待准入的上游调用数", ("model",)
+))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "zhouyi_requests_in_flight", "进行中的占卜请求数", ("endpoint",)
+))
+
+# 上游调用重试：retried 为已重试，budget_exhausted 为可重试但重试预算不足
+UPSTREAM_RETRIES = registry.register(Counter(
+    "zhouyi_upstream_retries_total", "上游调用的重试次数", ("result",)
+))
+# 剩余重试预算（抓取时由重试预算的状态填充）
+RETRY_BUDGET_TOKENS = registry.register(Gauge(
+    "zhouyi_retry_budget_tokens", "剩余的全局重试预算"
+))
+
+# 交互日志后台批量写入耗时
+LOG_WRITE_SECONDS = registry.register(Histogram(
+    "zhouyi_interaction_log_write_seconds", "交互日志每批写入耗时（秒）"
+))
+
+
+def observe_stage(stage: str, model: str, started: float) -> float:
+    """
+    记录一个阶段的耗时
+    
+    参数：
+        stage: 阶段名称
+        model: 模型名称
+        started: 阶段开始时间（time.perf_counter()）
+    
+    返回：
+        当前时间（time.perf_counter()），可作为下一阶段的开始时间
+    """
+    now = time.perf_counter()
+    STAGE_SECONDS.observe(now - started, stage=stage, model=model)
+    return now
@@ -0,0 +1,396 @@
+"""
+分享海报渲染
+
+由保存的占卜结果在服务端渲染分享海报（卦象六爻、卦名、吉凶、二维码），
+代替前端 html2canvas 截图：
+- SVG 格式无额外依赖；PNG 格式需要 Pillow 和一个中文字体（POSTER_FONT_PATH）
+- 二维码需要 qrcode 包，未安装时显示链接文字
+- 渲染在进程池中执行，不占用事件循环
+- 结果按内容 hash 缓存在磁盘，相同海报只渲染一次，并发的相同请求合并
+
+环境变量：
+    POSTER_CACHE_DIR: 海报缓存目录，默认 logs/posters
+    POSTER_WORKERS: 渲染进程数，默认 2
+    POSTER_APP_URL: 二维码指向的地址
+    POSTER_FONT_PATH: PNG 使用的字体文件（需包含中文字形）
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from app.services.single_flight import SingleFlight
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+try:
+    import qrcode
+except ImportError:
+    qrcode = None
+
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent.parent / "logs" / "posters"
+
+# 海报版式版本，修改版式后递增，使旧缓存失效
+POSTER_VERSION = 1
+
+# 画布尺寸
+WIDTH = 750
+HEIGHT = 1334
+
+# 配色（与前端 SharePoster.vue 一致）
+BACKGROUND = "#0d0d1a"
+GOLD = "#d4af37"
+TEXT = "#f5f0e1"
+MUTED = "#8a8aa3"
+FORTUNE_COLORS = {
+    "success": "#00a86b",
+    "warning": "#ffc107",
+    "error": "#e34234",
+}
+
+# 问题每行字数、最多行数
+QUESTION_LINE_CHARS = 16
+QUESTION_MAX_LINES = 3
+
+MEDIA_TYPES = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+}
+
+
+class PosterUnavailable(Exception):
+    """当前环境无法渲染该格式（缺少可选依赖或字体）"""
+
+
+def poster_fields(divination: Dict) -> Dict:
+    """
+    从保存的占卜结果中提取海报需要的字段
+    
+    参数：
+        divination: GET /api/divination/{id} 返回的占卜结果
+    """
+    original = divination["originalHexagram"]
+    changed = divination.get("changedHexagram")
+    a2ui = divination.get("a2uiResponse") or {}
+    
+    # 吉凶取 A2UI 中的第一个 badge 组件
+    fortune, fortune_type = "平", "warning"
+    for component in a2ui.get("components", []):
+        if component.get("type") == "badge":
+            props = component.get("props", {})
+            fortune = props.get("label") or fortune
+            fortune_type = props.get("color") or fortune_type
+            break
+    
+    return {
+        "hexagram_name": original["name"],
+        "changed_hexagram_name": changed["name"] if changed else None,
+        "upper_trigram": original["upperTrigram"]["name"],
+        "lower_trigram": original["lowerTrigram"]["name"],
+        # 初爻在前
+        "lines": list(original["lines"]),
+        "changing": [bool(line.get("changing")) for line in divination.get("lines", [])],
+        "question": (a2ui.get("data") or {}).get("question", ""),
+        "fortune": fortune,
+        "fortune_color": FORTUNE_COLORS.get(fortune_type, GOLD),
+    }
+
+
+def _wrap_question(question: str) -> List[str]:
+    """按固定字数折行，超出的部分以省略号结尾"""
+    question = " ".join(question.split())
+    lines = [question[i:i + QUESTION_LINE_CHARS] for i in range(0, len(question), QUESTION_LINE_CHARS)]
+    if len(lines) > QUESTION_MAX_LINES:
+        lines = lines[:QUESTION_MAX_LINES]
+        lines[-1] = lines[-1][:-1] + "…"
+    return lines or [""]
+
+
+def _qr_matrix(url: str) -> Optional[List[List[bool]]]:
+    """二维码点阵，未安装 qrcode 或没有地址时返回 None"""
+    if qrcode is None or not url:
+        return None
+    qr = qrcode.QRCode(border=1, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _line_bars(lines: List[int]) -> List[Tuple[int, int, int, int, int]]:
+    """
+    六爻的矩形（上爻在最上方）
+    
+    返回：
+        [(爻序号, x, y, 宽, 高)]，阳爻一段，阴爻左右两段
+    """
+    bars = []
+    bar_width, bar_height, gap = 300, 26, 22
+    left = (WIDTH - bar_width) // 2
+    top = 300
+    for row, index in enumerate(reversed(range(6))):
+        y = top + row * (bar_height + gap)
+        if lines[index]:
+            bars.append((index, left, y, bar_width, bar_height))
+        else:
+            half = (bar_width - 40) // 2
+            bars.append((index, left, y, half, bar_height))
+            bars.append((index, left + bar_width - half, y, half, bar_height))
+    return bars
+
+
+def render_svg(fields: Dict, app_url: str) -> bytes:
+    """渲染 SVG 海报"""
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" viewBox="0 0 {WIDTH} {HEIGHT}" '
+        f'font-family="\'PingFang SC\',\'Noto Sans CJK SC\',\'Microsoft YaHei\',sans-serif">',
+        f'<rect width="{WIDTH}" height="{HEIGHT}" fill="{BACKGROUND}"/>',
+        f'<text x="{WIDTH // 2}" y="120" font-size="64" fill="{GOLD}" text-anchor="middle">☯ 周易占卜</text>',
+        f'<text x="{WIDTH // 2}" y="180" font-size="28" fill="{MUTED}" text-anchor="middle">古老智慧，指引迷津</text>',
+    ]
+    
+    changing = fields["changing"]
+    for index, x, y, width, height in _line_bars(fields["lines"]):
+        parts.append(f'<rect x="{x}" y="{y}" width="{width}" height="{height}" rx="4" fill="{GOLD}"/>')
+        if index < len(changing) and changing[index] and x < WIDTH // 2:
+            parts.append(f'<circle cx="{x - 30}" cy="{y + height // 2}" r="8" fill="none" stroke="{GOLD}" stroke-width="3"/>')
+    
+    name = escape(fields["hexagram_name"])
+    if fields["changed_hexagram_name"]:
+        name += f" → {escape(fields['changed_hexagram_name'])}"
+    parts.append(f'<text x="{WIDTH // 2}" y="660" font-size="56" fill="{TEXT}" text-anchor="middle">{name}</text>')
+    parts.append(
+        f'<text x="{WIDTH // 2}" y="715" font-size="28" fill="{MUTED}" text-anchor="middle">'
+        f'上卦 {escape(fields["upper_trigram"])} · 下卦 {escape(fields["lower_trigram"])}</text>'
+    )
+    
+    parts.append(f'<text x="{WIDTH // 2}" y="800" font-size="26" fill="{MUTED}" text-anchor="middle">所问之事</text>')
+    for i, line in enumerate(_wrap_question(fields["question"])):
+        parts.append(
+            f'<text x="{WIDTH // 2}" y="{850 + i * 44}" font-size="32" fill="{TEXT}" text-anchor="middle">{escape(line)}</text>'
+        )
+    
+    parts.append(f'<text x="{WIDTH // 2}" y="1020" font-size="26" fill="{MUTED}" text-anchor="middle">卦象启示</text>')
+    parts.append(
+        f'<text x="{WIDTH // 2}" y="1085" font-size="56" fill="{fields["fortune_color"]}" text-anchor="middle">'
+        f'{escape(fields["fortune"])}</text>'
+    )
+    
+    parts.append(f'<text x="60" y="1220" font-size="30" fill="{GOLD}">✨ 测测你的运势 ✨</text>')
+    matrix = _qr_matrix(app_url)
+    if matrix is None:
+        parts.append(f'<text x="60" y="1265" font-size="22" fill="{MUTED}">{escape(app_url)}</text>')
+    else:
+        parts.append(f'<text x="60" y="1265" font-size="22" fill="{MUTED}">长按识别二维码，开启你的命运之旅</text>')
+        size = 160
+        cell = size / len(matrix)
+        left, top = WIDTH - 60 - size, HEIGHT - 60 - size
+        parts.append(f'<rect x="{left}" y="{top}" width="{size}" height="{size}" fill="#ffffff"/>')
+        path = "".join(
+            f"M{left + c * cell:.2f} {top + r * cell:.2f}h{cell:.2f}v{cell:.2f}h-{cell:.2f}z"
+            for r, row in enumerate(matrix) for c, dark in enumerate(row) if dark
+        )
+        parts.append(f'<path d="{path}" fill="#1a1a2e"/>')
+    
+    parts.append("</svg>")
+    return "".join(parts).encode("utf-8")
+
+
+def render_png(fields: Dict, app_url: str, font_path: str) -> bytes:
+    """渲染 PNG 海报（需要 Pillow 和中文字体）"""
+    from io import BytesIO
+    
+    image = Image.new("RGB", (WIDTH, HEIGHT), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    fonts: Dict[int, "ImageFont.FreeTypeFont"] = {}
+    
+    def text(y: int, content: str, size: int, fill: str, x: Optional[int] = None):
+        if size not in fonts:
+            fonts[size] = ImageFont.truetype(font_path, size)
+        font = fonts[size]
+        if x is None:
+            x = (WIDTH - draw.textlength(content, font=font)) / 2
+        # 与 SVG 一致，y 为基线位置
+        draw.text((x, y), content, font=font, fill=fill, anchor="ls")
+    
+    text(120, "周易占卜", 64, GOLD)
+    text(180, "古老智慧，指引迷津", 28, MUTED)
+    
+    changing = fields["changing"]
+    for index, x, y, width, height in _line_bars(fields["lines"]):
+        draw.rounded_rectangle((x, y, x + width, y + height), radius=4, fill=GOLD)
+        if index < len(changing) and changing[index] and x < WIDTH // 2:
+            cx, cy = x - 30, y + height // 2
+            draw.ellipse((cx - 8, cy - 8, cx + 8, cy + 8), outline=GOLD, width=3)
+    
+    name = fields["hexagram_name"]
+    if fields["changed_hexagram_name"]:
+        name += f" → {fields['changed_hexagram_name']}"
+    text(660, name, 56, TEXT)
+    text(715, f"上卦 {fields['upper_trigram']} · 下卦 {fields['lower_trigram']}", 28, MUTED)
+    
+    text(800, "所问之事", 26, MUTED)
+    for i, line in enumerate(_wrap_question(fields["question"])):
+        text(850 + i * 44, line, 32, TEXT)
+    
+    text(1020, "卦象启示", 26, MUTED)
+    text(1085, fields["fortune"], 56, fields["fortune_color"])
+    
+    text(1220, "测测你的运势", 30, GOLD, x=60)
+    matrix = _qr_matrix(app_url)
+    if matrix is None:
+        text(1265, app_url, 22, MUTED, x=60)
+    else:
+        text(1265, "长按识别二维码，开启你的命运之旅", 22, MUTED, x=60)
+        size = 160
+        cell = size / len(matrix)
+        left, top = WIDTH - 60 - size, HEIGHT - 60 - size
+        draw.rectangle((left, top, left + size, top + size), fill="#ffffff")
+        for r, row in enumerate(matrix):
+            for c, dark in enumerate(row):
+                if dark:
+                    x0, y0 = left + c * cell, top + r * cell
+                    draw.rectangle((x0, y0, x0 + cell, y0 + cell), fill="#1a1a2e")
+    
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def render_poster(fields: Dict, fmt: str, app_url: str, font_path: Optional[str]) -> bytes:
+    """渲染海报（在渲染进程中执行）"""
+    if fmt == "png":
+        return render_png(fields, app_url, font_path)
+    return render_svg(fields, app_url)
+
+
+class PosterRenderer:
+    """海报渲染器（进程池 + 磁盘缓存）"""
+    
+    def __init__(
+        self,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+        workers: int = 2,
+        app_url: str = "",
+        font_path: Optional[str] = None
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.workers = workers
+        self.app_url = app_url
+        self.font_path = font_path
+        
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # 同一张海报的并发请求只渲染一次
+        self._single_flight = SingleFlight()
+        
+        # 统计计数
+        self.rendered = 0
+        self.cache_hits = 0
+    
+    @classmethod
+    def from_env(cls) -> "PosterRenderer":
+        """根据环境变量创建渲染器"""
+        return cls(
+            cache_dir=Path(os.getenv("POSTER_CACHE_DIR") or DEFAULT_CACHE_DIR),
+            workers=int(os.getenv("POSTER_WORKERS", "2")),
+            app_url=os.getenv("POSTER_APP_URL", "http://223.109.142.31:8866"),
+            font_path=os.getenv("POSTER_FONT_PATH") or None
+        )
+    
+    def check_format(self, fmt: str):
+        """
+        检查能否渲染该格式
+        
+        异常：
+            PosterUnavailable: 不支持的格式，或缺少 PNG 所需的 Pillow / 字体
+        """
+        if fmt not in MEDIA_TYPES:
+            raise PosterUnavailable(f"不支持的海报格式: {fmt}，可用格式: {', '.join(MEDIA_TYPES)}")
+        if fmt == "png" and (Image is None or not self.font_path):
+            raise PosterUnavailable("PNG 海报需要安装 Pillow 并通过 POSTER_FONT_PATH 配置中文字体，可使用 SVG 格式")
+    
+    def cache_key(self, divination_id: str, fmt: str) -> str:
+        """
+        海报的内容 hash（也用作 ETag）
+        
+        占卜结果按内容寻址，id 相同内容即相同；再加上版式版本和渲染配置
+        """
+        content = f"{divination_id}\0{fmt}\0{POSTER_VERSION}\0{self.app_url}\0{qrcode is not None}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:24]
+    
+    async def render(self, divination_id: str, divination: Dict, fmt: str) -> bytes:
+        """
+        渲染海报，优先读取磁盘缓存
+        
+        参数：
+            divination_id: 占卜结果 id
+            divination: 占卜结果
+            fmt: svg / png
+        """
+        self.check_format(fmt)
+        key = self.cache_key(divination_id, fmt)
+        path = self.cache_dir / f"{key}.{fmt}"
+        
+        cached = await asyncio.to_thread(self._read, path)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        
+        async def render_and_store() -> bytes:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(
+                self._get_pool(), render_poster, poster_fields(divination), fmt, self.app_url, self.font_path
+            )
+            await asyncio.to_thread(self._write, path, data)
+            self.rendered += 1
+            return data
+        
+        data, _ = await self._single_flight.do(key, render_and_store)
+        return data
+    
+    def stats(self) -> Dict:
+        """渲染统计"""
+        return {
+            "formats": [fmt for fmt in MEDIA_TYPES if fmt == "svg" or (Image is not None and self.font_path)],
+            "qrcode": qrcode is not None,
+            "rendered": self.rendered,
+            "cacheHits": self.cache_hits
+        }
+    
+    def shutdown(self):
+        """关闭渲染进程池（应用关闭时调用）"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # 使用 spawn 启动渲染进程，避免 fork 带上事件循环和后台线程的状态
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+    
+    @staticmethod
+    def _read(path: Path) -> Optional[bytes]:
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+    
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        """先写临时文件再改名，并发读取不会读到不完整的文件"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+
+# 全局海报渲染器
+poster_renderer = PosterRenderer.from_env()
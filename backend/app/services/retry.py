@@ -0,0 +1,150 @@
+"""
+上游调用重试策略
+
+- 只重试连接失败、超时、429 和 5xx 等可恢复错误
+- 重试次数有上限，退避时间带随机抖动（full jitter），避免同时重试
+- 全局重试预算：每次调用存入少量额度，每次重试消耗 1，
+  上游大面积故障时重试总量被限制在调用量的一定比例内，不会放大流量
+- 不会在请求截止时间之后发起重试
+"""
+import asyncio
+import os
+import random
+import sys
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from app.services import deadline
+from app.services.metrics import UPSTREAM_RETRIES
+
+
+T = TypeVar("T")
+
+# 单次调用的最大重试次数
+MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+# 退避时间（秒）：第 n 次重试在 [0, min(MAX_DELAY, BASE_DELAY * 2^n)] 内随机
+RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", "4"))
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RetryBudget:
+    """全局重试预算"""
+    
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 20.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        
+        # 统计计数
+        self.retries = 0
+        self.exhausted = 0
+    
+    @classmethod
+    def from_env(cls) -> "RetryBudget":
+        """根据环境变量创建"""
+        return cls(
+            ratio=float(os.getenv("AI_RETRY_BUDGET_RATIO", "0.2")),
+            max_tokens=float(os.getenv("AI_RETRY_BUDGET_MAX", "20"))
+        )
+    
+    def deposit(self):
+        """每次上游调用存入额度"""
+        self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+    
+    def try_spend(self) -> bool:
+        """尝试消耗一次重试额度"""
+        if self._tokens < 1:
+            self.exhausted += 1
+            UPSTREAM_RETRIES.inc(result="budget_exhausted")
+            return False
+        self._tokens -= 1
+        self.retries += 1
+        UPSTREAM_RETRIES.inc(result="retried")
+        return True
+    
+    def stats(self) -> Dict:
+        """重试统计（/api/health 和 /metrics 中展示）"""
+        return {
+            "tokens": round(self._tokens, 2),
+            "retries": self.retries,
+            "budgetExhausted": self.exhausted
+        }
+
+
+retry_budget = RetryBudget.from_env()
+
+
+def is_retryable(error: BaseException) -> bool:
+    """是否为可恢复、值得重试的错误"""
+    if isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    # openai 只在首次使用 DeepSeek 时导入，未导入时异常不可能来自它
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return False
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+
+def backoff_delay(attempt: int, error: BaseException) -> Optional[float]:
+    """
+    计算第 attempt 次重试前的等待时间
+    
+    参数：
+        attempt: 已重试次数（从 0 开始）
+        error: 本次失败的异常
+    
+    返回：
+        等待秒数；不应重试（不可恢复、次数用尽、预算不足或时间不够）时返回 None
+    """
+    if attempt >= MAX_RETRIES or not is_retryable(error):
+        return None
+    
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    left = deadline.remaining()
+    if left is not None and left <= delay:
+        return None
+    if not retry_budget.try_spend():
+        return None
+    return delay
+
+
+async def call_with_retry(func: Callable[[], Awaitable[T]], description: str) -> T:
+    """
+    调用上游，可恢复错误按退避策略重试，整体不超过请求截止时间
+    
+    参数：
+        func: 发起一次上游调用的函数
+        description: 日志中的调用描述
+    
+    异常：
+        最后一次失败的异常；超过截止时间时为 TimeoutError
+    """
+    retry_budget.deposit()
+    attempt = 0
+    while True:
+        left = deadline.remaining()
+        try:
+            async with asyncio.timeout(left):
+                return await func()
+        except TimeoutError as e:
+            # 截止时间到，不再重试
+            if left is not None and deadline.remaining() == 0:
+                raise TimeoutError(f"{description} 超过请求截止时间") from e
+            raise
+        except Exception as e:
+            delay = backoff_delay(attempt, e)
+            if delay is None:
+                raise
+            attempt += 1
+            print(f"[RETRY] {description} 失败（{type(e).__name__}），{delay:.2f} 秒后第 {attempt} 次重试")
+            await asyncio.sleep(delay)
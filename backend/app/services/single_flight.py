@@ -0,0 +1,129 @@
+"""
+请求合并（single-flight）
+
+相同 key 的并发调用只执行一次上游调用，所有调用方等待同一个结果。
+上游调用在独立的 Task 中运行：单个调用方取消不影响其他调用方，
+所有调用方都取消后才取消上游调用。
+
+流式调用（stream）还会把上游发布的事件转发给每个调用方，
+中途加入的调用方先收到已发布的事件，再继续接收后续事件。
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+# 流式调用发布事件的回调：publish(事件, 数据)
+Publish = Callable[[str, Any], None]
+
+
+class _Call:
+    """一次进行中的上游调用"""
+    
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.events: List[Tuple[str, Any]] = []
+        self.updated = asyncio.get_running_loop().create_future()
+    
+    def publish(self, event: str, data: Any):
+        """记录事件并唤醒等待新事件的调用方"""
+        self.events.append((event, data))
+        if not self.updated.done():
+            self.updated.set_result(None)
+        self.updated = asyncio.get_running_loop().create_future()
+
+
+class SingleFlight:
+    """按 key 合并并发的异步调用"""
+    
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        
+        # 统计计数
+        self.executed = 0
+        self.coalesced = 0
+    
+    def in_flight(self, key: str) -> bool:
+        """该 key 是否有进行中的调用"""
+        return key in self._calls
+    
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        执行调用，相同 key 已有进行中的调用时直接等待其结果
+        
+        返回：
+            (结果, 是否复用了其他请求的调用)
+        """
+        call, shared = self._join(key, lambda call: func())
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            self._leave(call)
+    
+    async def stream(self, key: str, func: Callable[[Publish], Awaitable[T]]) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        流式执行调用，相同 key 已有进行中的调用时加入该调用
+        
+        参数：
+            func: 上游调用，通过传入的 publish 回调发布事件
+        
+        产出：
+            已发布和后续发布的 (事件, 数据)，最后产出 ("done", func 的返回值)；
+            由 do 发起的调用没有中间事件，只产出 ("done", 结果)
+        
+        异常：
+            func 抛出的异常，在其之前发布的事件照常产出
+        """
+        call, _ = self._join(key, lambda call: func(call.publish))
+        try:
+            index = 0
+            while True:
+                while index < len(call.events):
+                    yield call.events[index]
+                    index += 1
+                if call.task.done():
+                    break
+                await asyncio.wait({call.updated, call.task}, return_when=asyncio.FIRST_COMPLETED)
+            
+            result = call.task.result()
+        finally:
+            self._leave(call)
+        yield "done", result
+    
+    def stats(self) -> Dict:
+        """合并统计"""
+        return {
+            "inFlight": len(self._calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced
+        }
+    
+    def _join(self, key: str, start: Callable[[_Call], Awaitable[T]]) -> Tuple[_Call, bool]:
+        """加入相同 key 进行中的调用，没有时发起新调用"""
+        call = self._calls.get(key)
+        shared = call is not None
+        
+        if call is None:
+            call = _Call()
+            call.task = asyncio.ensure_future(start(call))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        
+        call.waiters += 1
+        return call, shared
+    
+    @staticmethod
+    def _leave(call: _Call):
+        """调用方离开，所有调用方都离开后取消上游调用"""
+        call.waiters -= 1
+        if call.waiters == 0 and not call.task.done():
+            call.task.cancel()
+    
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
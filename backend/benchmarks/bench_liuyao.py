@@ -0,0 +1,101 @@
+"""
+起卦性能基准
+
+对比预计算查表路径与原先逐次构建字典的路径，并校验两者结果一致。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.bench_liuyao
+"""
+import itertools
+import random
+import timeit
+from typing import Dict, List
+
+from app.services.liuyao_service import LiuYaoService
+
+
+def legacy_calculate_hexagram(service: LiuYaoService, coin_results: List[List[int]]) -> Dict:
+    """原先的起卦实现：每次调用构建爻字典、按元组查八卦、按卦名查六十四卦"""
+    lines = []
+    has_changing = False
+    
+    for i, coins in enumerate(coin_results):
+        line = service.calculate_line(coins)
+        line["position"] = i + 1
+        line["positionName"] = service.LINE_NAMES[i]
+        lines.append(line)
+        if line["changing"]:
+            has_changing = True
+    
+    original_values = tuple(line["value"] for line in lines)
+    lower_trigram = service.get_trigram(original_values[:3])
+    upper_trigram = service.get_trigram(original_values[3:])
+    
+    original_hexagram = service.get_hexagram(upper_trigram["name"], lower_trigram["name"])
+    original_hexagram["lowerTrigram"] = lower_trigram
+    original_hexagram["upperTrigram"] = upper_trigram
+    original_hexagram["lines"] = list(original_values)
+    
+    result = {
+        "original_hexagram": original_hexagram,
+        "lines": lines,
+        "has_changing": has_changing
+    }
+    
+    if has_changing:
+        changed_values = tuple(line["changedValue"] for line in lines)
+        changed_lower_trigram = service.get_trigram(changed_values[:3])
+        changed_upper_trigram = service.get_trigram(changed_values[3:])
+        
+        changed_hexagram = service.get_hexagram(changed_upper_trigram["name"], changed_lower_trigram["name"])
+        changed_hexagram["lowerTrigram"] = changed_lower_trigram
+        changed_hexagram["upperTrigram"] = changed_upper_trigram
+        changed_hexagram["lines"] = list(changed_values)
+        
+        result["changed_hexagram"] = changed_hexagram
+    
+    return result
+
+
+def verify(service: LiuYaoService) -> int:
+    """遍历全部 4^6 种起卦组合，确认新旧实现结果一致"""
+    throws = [[1] * heads + [0] * (3 - heads) for heads in range(4)]
+    count = 0
+    for combo in itertools.product(throws, repeat=6):
+        coin_results = list(combo)
+        assert service.calculate_hexagram(coin_results) == legacy_calculate_hexagram(service, coin_results)
+        count += 1
+    return count
+
+
+def main(number: int = 20000):
+    service = LiuYaoService()
+    
+    print(f"校验通过：{verify(service)} 种起卦组合结果一致")
+    
+    rng = random.Random(42)
+    samples = [
+        [[rng.randint(0, 1) for _ in range(3)] for _ in range(6)]
+        for _ in range(256)
+    ]
+    
+    def run_legacy():
+        for coin_results in samples:
+            legacy_calculate_hexagram(service, coin_results)
+    
+    def run_table():
+        for coin_results in samples:
+            service.calculate_hexagram(coin_results)
+    
+    rounds = max(1, number // len(samples))
+    calls = rounds * len(samples)
+    legacy = min(timeit.repeat(run_legacy, number=rounds, repeat=5)) / calls
+    table = min(timeit.repeat(run_table, number=rounds, repeat=5)) / calls
+    
+    print(f"原实现    : {legacy * 1e6:8.2f} µs/次")
+    print(f"预计算查表: {table * 1e6:8.2f} µs/次")
+    print(f"加速比    : {legacy / table:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+交互日志语料
+
+从 logs/ai_interactions 下的历史交互日志（早期 JSON、旧版 Markdown、JSONL 分段）
+提取问题、起卦结果和模型原始响应，供压测桩服务和回放基准使用
+"""
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from app.services.interaction_logger import iter_entries
+
+
+DEFAULT_LOG_DIR = Path(__file__).parent.parent / "logs" / "ai_interactions"
+
+# 爻名 / 爻的数字对应的正面数量
+_LINE_NAME_TO_HEADS = {"老阴": 0, "少阴": 1, "少阳": 2, "老阳": 3}
+_LINE_NUMBER_TO_HEADS = {6: 0, 8: 1, 7: 2, 9: 3}
+
+_MODEL_BY_DISPLAY_NAME = {"Google Gemini": "gemini", "Gemini": "gemini", "DeepSeek": "deepseek"}
+
+
+def _coins(heads: int) -> List[int]:
+    """正面数量 -> 三枚铜钱结果"""
+    return [1] * heads + [0] * (3 - heads)
+
+
+def _sample(source: Path, model: str, question: str, coin_results: Optional[List[List[int]]],
+            raw_response: str, success: bool, hexagram_name: Optional[str],
+            a2ui_response: Optional[Dict]) -> Dict:
+    return {
+        "source": str(source),
+        "model": model,
+        "question": question,
+        "coin_results": coin_results,
+        "raw_response": raw_response or "",
+        "success": success,
+        "hexagram_name": hexagram_name,
+        "a2ui_response": a2ui_response,
+        # 早期日志是纯文本解读，只有含 A2UI JSON 的响应可用作桩服务的返回
+        "is_a2ui": '"components"' in (raw_response or "")
+    }
+
+
+def parse_json_sample(path: Path) -> Dict:
+    """解析早期 JSON 日志"""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    inputs = data.get("input", {})
+    lines = inputs.get("lines") or []
+    coin_results = [_coins(_LINE_NAME_TO_HEADS[line["name"]]) for line in lines] if len(lines) == 6 else None
+    return _sample(
+        source=path,
+        model="gemini",
+        question=inputs.get("question", ""),
+        coin_results=coin_results,
+        raw_response=data.get("output", {}).get("raw_response", ""),
+        success=bool(data.get("metadata", {}).get("success")),
+        hexagram_name=(inputs.get("original_hexagram") or {}).get("name"),
+        a2ui_response=data.get("output", {}).get("a2ui_response")
+    )
+
+
+def parse_markdown_sample(path: Path) -> Dict:
+    """解析旧版 Markdown 日志"""
+    text = path.read_text(encoding="utf-8")
+    
+    model_match = re.search(r"\| \*\*模型\*\* \| (.+?) \|", text)
+    model = _MODEL_BY_DISPLAY_NAME.get(model_match.group(1), "gemini") if model_match else "gemini"
+    if path.stem.endswith("_deepseek"):
+        model = "deepseek"
+    
+    question_match = re.search(r"### 用户问题\n\n> (.*)\n", text)
+    
+    lines_part = text.partition("### 六爻详情")[2].partition("###")[0]
+    names = re.findall(r"^\| \S+爻 \| (\S+) \|", lines_part, re.MULTILINE)
+    coin_results = [_coins(_LINE_NAME_TO_HEADS[name]) for name in names] if len(names) == 6 else None
+    
+    # 原始响应位于 "### xxx 原始响应" 后的代码块，响应自身可能含有 ``` 标记，取到下一节之前
+    raw_match = re.search(r"原始响应\n\n```\n(.*)\n```\n\n### 解析后的内容", text, re.DOTALL)
+    a2ui_match = re.search(r"### A2UI Response \(JSON\)\n\n```json\n(.*)\n```\n\n---", text, re.DOTALL)
+    hexagram_match = re.search(r"\| \*\*卦名\*\* \| (.+?) \|", text)
+    
+    return _sample(
+        source=path,
+        model=model,
+        question=question_match.group(1) if question_match else "",
+        coin_results=coin_results,
+        raw_response=raw_match.group(1) if raw_match else "",
+        success="✅ 成功" in text.partition("## 输入参数")[0],
+        hexagram_name=hexagram_match.group(1) if hexagram_match else None,
+        a2ui_response=json.loads(a2ui_match.group(1)) if a2ui_match else None
+    )
+
+
+def iter_segment_samples(path: Path) -> Iterator[Dict]:
+    """解析 JSONL 分段中的记录"""
+    for entry in iter_entries(path):
+        numbers = entry.get("line_numbers") or []
+        coin_results = [_coins(_LINE_NUMBER_TO_HEADS[n]) for n in numbers] if len(numbers) == 6 else None
+        yield _sample(
+            source=path,
+            model=entry["model"],
+            question=entry["question"],
+            coin_results=coin_results,
+            raw_response=entry.get("raw_response") or "",
+            success=bool(entry["success"]),
+            hexagram_name=entry.get("hexagram_name"),
+            a2ui_response=entry.get("a2ui_response")
+        )
+
+
+def load_corpus(log_dir: Path = DEFAULT_LOG_DIR) -> List[Dict]:
+    """
+    读取目录下的全部交互日志
+    
+    返回：
+        样本列表，按文件名排序，每项含 source/model/question/coin_results/raw_response/success/
+        hexagram_name/a2ui_response（日志中记录的解析结果）/is_a2ui
+    """
+    samples = []
+    for path in sorted(Path(log_dir).iterdir()):
+        name = path.name
+        if name.endswith(".json"):
+            samples.append(parse_json_sample(path))
+        elif name.endswith(".md"):
+            samples.append(parse_markdown_sample(path))
+        elif name.startswith("interactions-") and ".jsonl" in name:
+            samples.extend(iter_segment_samples(path))
+    return samples
@@ -0,0 +1,251 @@
+"""
+占卜接口压测
+
+在本机启动上游桩服务和后端服务（桩服务模拟 DeepSeek / Gemini），以指定并发请求
+/api/divination/liuyao（或流式接口），报告吞吐、端到端耗时分位，
+并根据压测前后 /metrics 直方图的差值估算各阶段耗时分位。全程离线运行。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.load_test --concurrency 32 --requests 500 --model deepseek
+    python -m benchmarks.load_test --latency lognormal:1:0.6 --error-rate 0.05 --stream
+    python -m benchmarks.load_test --app-env DEEPSEEK_RATE_LIMIT=20 --app-env DEEPSEEK_MAX_CONCURRENCY=64
+    python -m benchmarks.load_test --app-url http://127.0.0.1:8000   # 压测已启动的服务
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.corpus import load_corpus
+
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+_BUCKET_LINE = re.compile(r'^zhouyi_stage_seconds_bucket\{stage="([^"]*)",model="([^"]*)",le="([^"]+)"\} (\S+)$')
+
+
+def percentile(values: List[float], p: float) -> float:
+    """样本分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+def parse_stage_buckets(text: str) -> Dict[Tuple[str, str], Dict[float, float]]:
+    """从 /metrics 中解析各阶段直方图的累积分桶计数"""
+    buckets: Dict[Tuple[str, str], Dict[float, float]] = defaultdict(dict)
+    for line in text.splitlines():
+        match = _BUCKET_LINE.match(line)
+        if match:
+            stage, model, le, count = match.groups()
+            buckets[(stage, model)][float("inf") if le == "+Inf" else float(le)] = float(count)
+    return buckets
+
+
+def histogram_quantile(q: float, buckets: Dict[float, float]) -> Optional[float]:
+    """按累积分桶估算分位数（桶内线性插值，与 Prometheus histogram_quantile 一致）"""
+    bounds = sorted(buckets)
+    if not bounds or buckets[bounds[-1]] <= 0:
+        return None
+    
+    rank = q * buckets[bounds[-1]]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def diff_buckets(after: Dict, before: Dict) -> Dict:
+    """两次抓取之间的分桶增量"""
+    return {
+        key: {le: count - before.get(key, {}).get(le, 0.0) for le, count in values.items()}
+        for key, values in after.items()
+    }
+
+
+def start_process(args: List[str], env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    """在 backend 目录下启动子进程，输出写入日志文件"""
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=BACKEND_DIR, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    """等待服务可访问"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务未能在 {timeout:.0f} 秒内启动: {url}")
+
+
+async def run_load(
+    app_url: str,
+    model: str,
+    concurrency: int,
+    total: int,
+    stream: bool,
+    samples: List[Dict]
+) -> Tuple[List[float], Counter, float]:
+    """
+    以固定并发发送请求
+    
+    返回：
+        (各请求耗时秒数, 状态统计, 总耗时秒数)
+    """
+    path = "/api/divination/liuyao/stream" if stream else "/api/divination/liuyao"
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    counter = iter(range(total))
+    
+    async def worker(client: httpx.AsyncClient):
+        for i in counter:
+            sample = random.choice(samples)
+            # 问题带序号，避免命中解读缓存和请求合并
+            body = {
+                "question": f"{sample['question']} #{i}",
+                "coin_results": sample["coin_results"],
+                "model": model
+            }
+            started = time.perf_counter()
+            try:
+                if stream:
+                    async with client.stream("POST", path, json=body) as response:
+                        async for _ in response.aiter_bytes():
+                            pass
+                else:
+                    response = await client.post(path, json=body)
+                status = str(response.status_code)
+                if response.status_code == 200 and not stream and '"generatedBy":"fallback"' in response.text.replace(" ", ""):
+                    status = "200-fallback"
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            outcomes[status] += 1
+    
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=app_url, timeout=130.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    
+    return latencies, outcomes, elapsed
+
+
+def report(latencies: List[float], outcomes: Counter, elapsed: float, stage_buckets: Dict):
+    """输出压测结果"""
+    print(f"\n请求数: {len(latencies)}，耗时 {elapsed:.2f}s，吞吐 {len(latencies) / elapsed:.1f} req/s")
+    print("状态: " + ", ".join(f"{status}={count}" for status, count in sorted(outcomes.items())))
+    print(
+        f"端到端: p50={percentile(latencies, 50) * 1000:.1f}ms "
+        f"p95={percentile(latencies, 95) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms"
+    )
+    
+    if stage_buckets:
+        print(f"\n{'阶段':<16}{'模型':<10}{'次数':>8}{'p50(ms)':>12}{'p95(ms)':>12}{'p99(ms)':>12}")
+        for (stage, model), buckets in sorted(stage_buckets.items()):
+            count = buckets.get(float("inf"), 0)
+            if count <= 0:
+                continue
+            quantiles = [histogram_quantile(q, buckets) * 1000 for q in (0.5, 0.95, 0.99)]
+            print(f"{stage:<16}{model:<10}{int(count):>8}" + "".join(f"{v:>12.2f}" for v in quantiles))
+
+
+async def main_async(args):
+    samples = [s for s in load_corpus() if s["coin_results"]]
+    if not samples:
+        raise SystemExit("交互日志中没有可用的起卦样本")
+    
+    processes = []
+    workdir = Path(tempfile.mkdtemp(prefix="zhouyi-load-"))
+    app_url = args.app_url
+    try:
+        if app_url is None:
+            stub_url = f"http://127.0.0.1:{args.stub_port}"
+            processes.append(start_process([
+                sys.executable, "-m", "benchmarks.stub_server",
+                "--port", str(args.stub_port),
+                "--latency", args.latency,
+                "--error-rate", str(args.error_rate),
+                "--hang-rate", str(args.hang_rate),
+                "--truncate-rate", str(args.truncate_rate)
+            ], {}, workdir / "stub.log"))
+            
+            # 后端的日志、索引写入临时目录，不污染仓库内的日志
+            processes.append(start_process([
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--port", str(args.app_port), "--log-level", "warning"
+            ], {
+                "DEEPSEEK_API_KEY": "stub",
+                "GEMINI_API_KEY": "stub",
+                "DEEPSEEK_BASE_URL": f"{stub_url}/v1",
+                "GEMINI_BASE_URL": f"{stub_url}/v1beta",
+                "AI_INTERACTION_LOG_DIR": str(workdir / "ai_interactions"),
+                "INTERACTION_INDEX_DB": str(workdir / "interaction_index.db"),
+                "DIVINATION_STORE_DB": str(workdir / "divinations.db"),
+                "INTERPRETATION_CACHE_SIZE": "0",
+                **dict(item.split("=", 1) for item in args.app_env)
+            }, workdir / "app.log"))
+            
+            app_url = f"http://127.0.0.1:{args.app_port}"
+            await wait_ready(f"{stub_url}/stats")
+            await wait_ready(f"{app_url}/api/health")
+            print(f"桩服务 {stub_url}，后端 {app_url}，日志目录 {workdir}")
+        
+        async with httpx.AsyncClient(base_url=app_url) as client:
+            before = parse_stage_buckets((await client.get("/metrics")).text)
+            latencies, outcomes, elapsed = await run_load(
+                app_url, args.model, args.concurrency, args.requests, args.stream, samples
+            )
+            after = parse_stage_buckets((await client.get("/metrics")).text)
+        
+        report(latencies, outcomes, elapsed, diff_buckets(after, before))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="占卜接口离线压测")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发数")
+    parser.add_argument("--requests", type=int, default=200, help="请求总数")
+    parser.add_argument("--model", default="deepseek", choices=["deepseek", "gemini"])
+    parser.add_argument("--stream", action="store_true", help="压测流式接口")
+    parser.add_argument("--app-url", default=None, help="压测已启动的后端，不再启动桩服务和后端")
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--latency", default="lognormal:1:0.5", help="桩服务耗时分布，见 benchmarks.stub_server")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="后端的环境变量（可重复），如准入并发上限 DEEPSEEK_MAX_CONCURRENCY=64")
+    args = parser.parse_args()
+    
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+交互日志回放基准
+
+把历史交互日志中的真实模型响应整理为语料，回放到：
+- BaseAIService._parse_a2ui_response：解析吞吐，并与日志中记录的解析结果比对组件
+- BaseAIService._extract_sections_from_a2ui：提取 sections 的吞吐
+- /api/divination/liuyao 完整接口：共享 HTTP 客户端注入录制的响应，测量端到端吞吐
+
+响应是确定的，可作为解析和序列化优化的回归基准；
+含 A2UI JSON 的响应解析失败或组件与记录不一致时，以非零状态退出。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.replay
+    python -m benchmarks.replay --log-dir path/to/logs --number 2000 --endpoint-rounds 20
+"""
+import os
+import tempfile
+
+# 回放产生的交互日志、索引和占卜结果写入临时目录，须在导入 app 模块前设置
+_WORKDIR = tempfile.mkdtemp(prefix="zhouyi-replay-")
+os.environ.setdefault("AI_INTERACTION_LOG_DIR", os.path.join(_WORKDIR, "ai_interactions"))
+os.environ.setdefault("INTERACTION_INDEX_DB", os.path.join(_WORKDIR, "interaction_index.db"))
+os.environ.setdefault("DIVINATION_STORE_DB", os.path.join(_WORKDIR, "divinations.db"))
+os.environ["INTERPRETATION_CACHE_SIZE"] = "0"
+# 回放测的是本地处理，关闭上游限速
+os.environ["GEMINI_RATE_LIMIT"] = os.environ["DEEPSEEK_RATE_LIMIT"] = "0"
+os.environ["DEEPSEEK_API_KEY"] = os.environ["GEMINI_API_KEY"] = "replay"
+
+import argparse
+import time
+import timeit
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import http_client
+from app.services.ai_factory import AIServiceFactory
+from app.services.base_ai_service import BaseAIService
+from app.services.liuyao_service import LiuYaoService
+from benchmarks.corpus import DEFAULT_LOG_DIR, load_corpus
+
+
+def check_sample(service: BaseAIService, sample: Dict, hexagram_result: Dict) -> Dict:
+    """解析一条样本并与日志中记录的结果比对"""
+    result = {"source": Path(sample["source"]).name, "model": sample["model"], "is_a2ui": sample["is_a2ui"]}
+    try:
+        parsed = service._parse_a2ui_response(
+            raw_response=sample["raw_response"],
+            question=sample["question"],
+            original_hexagram=hexagram_result["original_hexagram"],
+            changed_hexagram=hexagram_result.get("changed_hexagram"),
+            lines=hexagram_result["lines"]
+        )
+    except ValueError as e:
+        result.update(parsed=False, components=0, matches=None, error=str(e)[:60])
+        return result
+    
+    recorded = (sample["a2ui_response"] or {}).get("components")
+    result.update(
+        parsed=True,
+        components=len(parsed.get("components", [])),
+        matches=None if recorded is None else parsed.get("components") == recorded,
+        error=None
+    )
+    return result
+
+
+def bench_parse(service: BaseAIService, cases: List, number: int) -> Dict[str, float]:
+    """解析和提取 sections 的每条耗时（微秒）"""
+    def parse_all():
+        for sample, hexagram_result in cases:
+            service._parse_a2ui_response(
+                sample["raw_response"], sample["question"], hexagram_result["original_hexagram"],
+                hexagram_result.get("changed_hexagram"), hexagram_result["lines"]
+            )
+    
+    parsed = [
+        service._parse_a2ui_response(
+            sample["raw_response"], sample["question"], hexagram_result["original_hexagram"],
+            hexagram_result.get("changed_hexagram"), hexagram_result["lines"]
+        )
+        for sample, hexagram_result in cases
+    ]
+    
+    def extract_all():
+        for a2ui_response in parsed:
+            BaseAIService._extract_sections_from_a2ui(a2ui_response)
+    
+    total_bytes = sum(len(sample["raw_response"].encode("utf-8")) for sample, _ in cases)
+    parse_seconds = min(timeit.repeat(parse_all, number=number, repeat=3))
+    extract_seconds = min(timeit.repeat(extract_all, number=number, repeat=3))
+    return {
+        "parse_us": parse_seconds / (number * len(cases)) * 1e6,
+        "parse_mb_s": total_bytes * number / parse_seconds / 1e6,
+        "extract_us": extract_seconds / (number * len(cases)) * 1e6
+    }
+
+
+# 当前回放的录制响应，由共享 HTTP 客户端的 MockTransport 返回
+_current = {"raw_response": ""}
+
+
+def _replay_handler(request: httpx.Request) -> httpx.Response:
+    """按请求的上游格式包装录制的响应"""
+    text = _current["raw_response"]
+    if "v1beta" in request.url.path:
+        return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": text}]}}]})
+    return httpx.Response(200, json={
+        "id": "replay", "object": "chat.completion", "created": 0, "model": "deepseek-chat",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}]
+    })
+
+
+def install_replay_transport():
+    """
+    替换共享 HTTP 客户端，须在创建 AI 服务之前调用
+    （DeepSeek 的 AsyncOpenAI 客户端在构造时绑定共享连接池）
+    """
+    http_client._client = httpx.AsyncClient(transport=httpx.MockTransport(_replay_handler))
+    # 回放的是单个模型的解析和序列化，关闭失败切换，避免纯文本样本回退后再请求另一个模型
+    AIServiceFactory.FAILOVER_ENABLED = False
+
+
+def bench_endpoint(samples: List[Dict], rounds: int) -> Dict[str, float]:
+    """完整接口回放，每轮问题不同以绕开单飞合并"""
+    latencies = []
+    with TestClient(app) as client:
+        for i in range(rounds):
+            for sample in samples:
+                _current["raw_response"] = sample["raw_response"]
+                started = time.perf_counter()
+                response = client.post("/api/divination/liuyao", json={
+                    "question": f"{sample['question']} #{i}",
+                    "coin_results": sample["coin_results"],
+                    "model": sample["model"]
+                })
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+    
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "req_s": len(latencies) / sum(latencies),
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="交互日志回放基准")
+    parser.add_argument("--log-dir", type=Path, default=DEFAULT_LOG_DIR, help="交互日志目录")
+    parser.add_argument("--number", type=int, default=200, help="解析基准每轮重复次数")
+    parser.add_argument("--endpoint-rounds", type=int, default=10, help="完整接口回放轮数")
+    args = parser.parse_args()
+    
+    install_replay_transport()
+    liuyao_service = LiuYaoService()
+    samples = [s for s in load_corpus(args.log_dir) if s["coin_results"]]
+    service = AIServiceFactory.get_service("deepseek")
+    
+    print(f"语料: {len(samples)} 条（含 A2UI JSON {sum(s['is_a2ui'] for s in samples)} 条）\n")
+    print(f"{'日志':<36}{'模型':<10}{'解析':<8}{'组件':>6}  与记录一致")
+    
+    regressions = 0
+    cases = []
+    for sample in samples:
+        hexagram_result = liuyao_service.calculate_hexagram(sample["coin_results"])
+        result = check_sample(service, sample, hexagram_result)
+        if result["parsed"]:
+            cases.append((sample, hexagram_result))
+        # 含 A2UI JSON 的响应必须能解析且与记录一致；早期纯文本解读无法解析属预期
+        if sample["is_a2ui"] and (not result["parsed"] or result["matches"] is False):
+            regressions += 1
+        status = "ok" if result["parsed"] else ("失败" if sample["is_a2ui"] else "纯文本")
+        matches = {True: "是", False: "否", None: "-"}[result["matches"]]
+        print(f"{result['source']:<36}{result['model']:<10}{status:<8}{result['components']:>6}  {matches}")
+    
+    if cases:
+        stats = bench_parse(service, cases, args.number)
+        print(
+            f"\n解析: {stats['parse_us']:.1f}µs/条（{stats['parse_mb_s']:.1f} MB/s）"
+            f"，提取 sections: {stats['extract_us']:.1f}µs/条"
+        )
+    
+    stats = bench_endpoint(samples, args.endpoint_rounds)
+    print(
+        f"完整接口: {stats['requests']} 次，{stats['req_s']:.0f} req/s，"
+        f"p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms"
+    )
+    
+    if regressions:
+        print(f"\n{regressions} 条 A2UI 响应解析失败或与记录不一致")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
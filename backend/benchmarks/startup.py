@@ -0,0 +1,109 @@
+"""
+后端启动耗时基准
+
+在全新的解释器进程中多次测量：
+- 导入 app.main 的耗时（uvicorn worker 冷启动的主要部分）
+- 预热各模型的耗时（首次使用时导入服务模块、创建客户端）
+
+导入 app.main 时不应加载各家 SDK（默认检查 openai），加载了即视为回归并以非零状态退出；
+可用 --max-import-ms 为导入耗时设置上限。预热连接指向本机关闭的端口，全程离线运行。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 20 --max-import-ms 800
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+# 在子进程中执行：测量导入和预热耗时，最后一行输出 JSON
+_CHILD_CODE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+heavy = [name for name in sys.argv[1].split(",") if name and name in sys.modules]
+from app.services.ai_factory import AIServiceFactory
+warm_up = asyncio.run(AIServiceFactory.warm_up(sys.argv[2].split(",")))
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "warm_up_ms": warm_up,
+    "heavy": heavy
+}))
+"""
+
+
+def measure(models: List[str], forbidden: List[str]) -> Dict:
+    """在新进程中测量一次"""
+    env = dict(
+        os.environ,
+        GEMINI_API_KEY="startup",
+        DEEPSEEK_API_KEY="startup",
+        # 预热连接立即被拒绝，只测量导入和创建客户端
+        GEMINI_BASE_URL="http://127.0.0.1:9",
+        DEEPSEEK_BASE_URL="http://127.0.0.1:9",
+        AI_WARMUP_TIMEOUT="1"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD_CODE, ",".join(forbidden), ",".join(models)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _time_process(command: List[str]) -> float:
+    """进程从启动到退出的耗时（毫秒）"""
+    started = time.perf_counter()
+    subprocess.run(command, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后端启动耗时基准")
+    parser.add_argument("--runs", type=int, default=10, help="测量次数")
+    parser.add_argument("--models", default="gemini,deepseek", help="预热的模型（逗号分隔）")
+    parser.add_argument("--forbid", default="openai", help="导入 app.main 时不应加载的模块（逗号分隔）")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="导入耗时中位数上限（毫秒）")
+    args = parser.parse_args()
+    
+    models = [name for name in args.models.split(",") if name]
+    forbidden = [name for name in args.forbid.split(",") if name]
+    
+    # 首次运行预热字节码缓存，不计入结果
+    measure(models, forbidden)
+    results = [measure(models, forbidden) for _ in range(args.runs)]
+    
+    import_ms = sorted(r["import_ms"] for r in results)
+    print(f"空解释器启动: {statistics.median(_time_process([sys.executable, '-c', 'pass']) for _ in range(3)):.0f}ms")
+    print(
+        f"导入 app.main: 中位数 {statistics.median(import_ms):.0f}ms，"
+        f"最小 {import_ms[0]:.0f}ms，最大 {import_ms[-1]:.0f}ms（{args.runs} 次）"
+    )
+    for model in models:
+        warm_up_ms = [r["warm_up_ms"][model] for r in results]
+        print(f"预热 {model}: 中位数 {statistics.median(warm_up_ms):.0f}ms")
+    
+    failures = []
+    heavy = sorted({name for r in results for name in r["heavy"]})
+    if heavy:
+        failures.append(f"导入 app.main 时加载了 {', '.join(heavy)}")
+    if args.max_import_ms is not None and statistics.median(import_ms) > args.max_import_ms:
+        failures.append(f"导入耗时中位数超过 {args.max_import_ms:.0f}ms")
+    
+    if failures:
+        for failure in failures:
+            print(failure)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
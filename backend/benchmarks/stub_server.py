@@ -0,0 +1,232 @@
+"""
+上游模型桩服务
+
+本地模拟 OpenAI 兼容的 chat.completions 接口（DeepSeek）和 Gemini 的
+generateContent / streamGenerateContent 接口，压测时不消耗真实配额：
+- 响应内容取自历史交互日志中的 A2UI 原始响应
+- 响应耗时按可配置的分布采样，支持流式逐块输出
+- 可按比例注入错误状态码、挂起（用于测试超时）和截断输出（用于测试修复）
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.stub_server --port 9100 --latency lognormal:2:0.5 --error-rate 0.02
+
+后端指向桩服务：
+    DEEPSEEK_BASE_URL=http://127.0.0.1:9100/v1 GEMINI_BASE_URL=http://127.0.0.1:9100/v1beta
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from benchmarks.corpus import load_corpus
+
+
+# 日志中没有可用的 A2UI 响应时使用的最小载荷
+_MINIMAL_A2UI = json.dumps({
+    "version": "1.0",
+    "root": "interpretation-root",
+    "components": [
+        {"id": "interpretation-root", "type": "container", "children": ["card-overview"]},
+        {"id": "card-overview", "type": "card", "props": {"title": "📖 卦象总论"}, "children": ["text-overview"]},
+        {"id": "text-overview", "type": "text", "props": {"content": "桩服务返回的示例解读"}}
+    ],
+    "metadata": {"generatedBy": "stub"}
+}, ensure_ascii=False)
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    解析耗时分布（秒）
+    
+    支持：
+        fixed:1.5               固定值
+        uniform:0.5:3           均匀分布
+        exponential:2           指数分布（均值）
+        lognormal:2:0.5         对数正态分布（中位数、sigma），长尾更接近真实模型
+    """
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "exponential":
+        return lambda: random.expovariate(1 / values[0])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"不支持的耗时分布: {spec}")
+
+
+@dataclass
+class StubConfig:
+    """桩服务配置"""
+    latency: Callable[[], float]
+    # 流式输出时首块到达前占总耗时的比例
+    first_chunk_ratio: float = 0.2
+    chunk_chars: int = 40
+    error_rate: float = 0.0
+    error_status: int = 503
+    hang_rate: float = 0.0
+    truncate_rate: float = 0.0
+
+
+class StubUpstream:
+    """桩服务状态：载荷、配置和计数"""
+    
+    def __init__(self, config: StubConfig, payloads: List[str]):
+        self.config = config
+        self.payloads = payloads or [_MINIMAL_A2UI]
+        self.requests = 0
+        self.errors = 0
+    
+    def pick_payload(self) -> str:
+        """随机取一条载荷，按比例截断"""
+        payload = random.choice(self.payloads)
+        if random.random() < self.config.truncate_rate:
+            payload = payload[:len(payload) // 2]
+        return payload
+    
+    async def inject_fault(self) -> Optional[Response]:
+        """按比例注入挂起或错误，无需注入时返回 None"""
+        self.requests += 1
+        if random.random() < self.config.hang_rate:
+            await asyncio.sleep(3600)
+        if random.random() < self.config.error_rate:
+            self.errors += 1
+            return JSONResponse({"error": {"message": "stub injected error"}}, status_code=self.config.error_status)
+        return None
+    
+    async def iter_chunks(self, payload: str, latency: float) -> AsyncIterator[str]:
+        """按耗时把载荷分块输出：先等待首块时间，其余时间均摊到各块之间"""
+        chunks = [payload[i:i + self.config.chunk_chars] for i in range(0, len(payload), self.config.chunk_chars)]
+        await asyncio.sleep(latency * self.config.first_chunk_ratio)
+        interval = latency * (1 - self.config.first_chunk_ratio) / max(len(chunks), 1)
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(interval)
+    
+    async def chat_completions(self, request: Request) -> Response:
+        """OpenAI 兼容的 chat.completions 接口"""
+        body = await request.json()
+        fault = await self.inject_fault()
+        if fault is not None:
+            return fault
+        
+        payload = self.pick_payload()
+        latency = self.config.latency()
+        usage = {
+            "prompt_tokens": sum(len(m.get("content", "")) for m in body.get("messages", [])) // 2,
+            "completion_tokens": len(payload) // 2
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return JSONResponse({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": payload}}],
+                "usage": usage
+            })
+        
+        async def events():
+            async for chunk in self.iter_chunks(payload, latency):
+                yield "data: " + json.dumps({
+                    "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]
+                }, ensure_ascii=False) + "\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield "data: " + json.dumps({
+                    "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model"), "choices": [], "usage": usage
+                }) + "\n\n"
+            yield "data: [DONE]\n\n"
+        
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    async def gemini(self, request: Request) -> Response:
+        """Gemini 兼容的 generateContent / streamGenerateContent 接口"""
+        action = request.path_params["action"]
+        body = await request.json()
+        fault = await self.inject_fault()
+        if fault is not None:
+            return fault
+        
+        payload = self.pick_payload()
+        latency = self.config.latency()
+        prompt = "".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+        usage = {"promptTokenCount": len(prompt) // 2, "candidatesTokenCount": len(payload) // 2}
+        
+        def candidate(text: str) -> dict:
+            return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}], "usageMetadata": usage}
+        
+        if action.endswith(":generateContent"):
+            await asyncio.sleep(latency)
+            return JSONResponse(candidate(payload))
+        
+        async def events():
+            async for chunk in self.iter_chunks(payload, latency):
+                yield "data: " + json.dumps(candidate(chunk), ensure_ascii=False) + "\r\n\r\n"
+        
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    async def stats(self, request: Request) -> Response:
+        """桩服务计数"""
+        return JSONResponse({"requests": self.requests, "errors": self.errors, "payloads": len(self.payloads)})
+
+
+def create_app(config: StubConfig, payloads: List[str]) -> Starlette:
+    """创建桩服务应用"""
+    stub = StubUpstream(config, payloads)
+    return Starlette(routes=[
+        Route("/v1/chat/completions", stub.chat_completions, methods=["POST"]),
+        Route("/v1beta/models/{action:path}", stub.gemini, methods=["POST"]),
+        Route("/stats", stub.stats, methods=["GET"]),
+    ])
+
+
+def load_payloads() -> List[str]:
+    """历史日志中的 A2UI 原始响应"""
+    return [sample["raw_response"] for sample in load_corpus() if sample["is_a2ui"]]
+
+
+def main():
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(description="上游模型桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", default="lognormal:2:0.5", help="耗时分布，如 fixed:1、uniform:0.5:3、lognormal:2:0.5")
+    parser.add_argument("--first-chunk-ratio", type=float, default=0.2, help="流式输出首块前等待占总耗时的比例")
+    parser.add_argument("--chunk-chars", type=int, default=40, help="流式输出每块字符数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误状态码的比例")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="挂起不响应的比例")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="输出被截断的比例")
+    args = parser.parse_args()
+    
+    config = StubConfig(
+        latency=parse_latency(args.latency),
+        first_chunk_ratio=args.first_chunk_ratio,
+        chunk_chars=args.chunk_chars,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        hang_rate=args.hang_rate,
+        truncate_rate=args.truncate_rate
+    )
+    payloads = load_payloads()
+    print(f"桩服务载荷 {len(payloads)} 条，监听 {args.host}:{args.port}")
+    uvicorn.run(create_app(config, payloads), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
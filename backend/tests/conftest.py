@@ -0,0 +1,148 @@
+"""
+测试公共配置
+
+在 backend 目录下运行：
+    python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+# 保证从任意目录运行时都能导入 app 包
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import asyncio
+from typing import Dict, List, Optional
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import divination as divination_module
+from app.services import ai_factory as ai_factory_module
+from app.services.ai_factory import AIServiceFactory
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.divination_store import DivinationStore
+from app.services.interpretation_cache import InterpretationCache
+from app.services.poster import PosterRenderer
+from app.services.single_flight import SingleFlight
+
+
+class FakeService:
+    """可控制返回时机和结果的 AI 服务，替代真实的上游调用"""
+    
+    def __init__(self, name: str, components: int = 2):
+        self.name = name
+        self.components = [{"id": f"{name}-{i}", "type": "text", "props": {}} for i in range(components)]
+        self.configured = True
+        self.fail = False  # 为 True 时返回回退响应
+        self.fail_after = None  # 流式输出若干组件后失败
+        self.hold_after = None  # 流式输出若干组件后等待 resume
+        self.release = asyncio.Event()
+        self.release.set()
+        self.resume = asyncio.Event()
+        self.calls = 0
+        self.cancelled = 0
+    
+    def is_configured(self) -> bool:
+        return self.configured
+    
+    def response(self, question: str, generated_by: Optional[str] = None) -> Dict:
+        return {
+            "version": "1.0",
+            "components": list(self.components),
+            "data": {"question": question},
+            "metadata": {"question": question, "generatedBy": generated_by or self.name}
+        }
+    
+    def _generate_fallback_response(self, question, original_hexagram, changed_hexagram, lines) -> Dict:
+        return self.response(question, "fallback")
+    
+    async def generate_liuyao_interpretation(self, question, original_hexagram, changed_hexagram, lines) -> Dict:
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.response(question, "fallback" if self.fail else None)
+    
+    async def stream_liuyao_interpretation(self, question, original_hexagram, changed_hexagram, lines):
+        self.calls += 1
+        try:
+            await self.release.wait()
+            for i, component in enumerate(self.components):
+                if i == self.hold_after:
+                    await self.resume.wait()
+                if self.fail_after is not None and i >= self.fail_after:
+                    yield "done", self.response(question, "fallback")
+                    return
+                yield "component", component
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        yield "done", self.response(question, "fallback" if self.fail else None)
+
+
+class FakeFactory:
+    """已替换为 FakeService 的 AIServiceFactory 及其服务"""
+    
+    def __init__(self, services: Dict[str, FakeService]):
+        self.services = services
+    
+    def __getitem__(self, name: str) -> FakeService:
+        return self.services[name]
+    
+    @staticmethod
+    async def generate(question: str = "问事业", model: str = "gemini") -> Dict:
+        return await AIServiceFactory.generate_liuyao_interpretation(model, question, *HEXAGRAM_ARGS)
+    
+    @staticmethod
+    def stream(question: str = "问事业", model: str = "gemini"):
+        return AIServiceFactory.stream_liuyao_interpretation(model, question, *HEXAGRAM_ARGS)
+    
+    @staticmethod
+    async def collect(events) -> List:
+        return [item async for item in events]
+
+
+# 乾卦，无变爻
+HEXAGRAM_ARGS = ({"name": "乾为天", "number": 1, "lines": [1] * 6}, None, [])
+
+
+@pytest.fixture
+def factory(monkeypatch) -> FakeFactory:
+    """
+    隔离 AIServiceFactory 的全局状态：服务换成 FakeService，
+    准入、熔断、耗时、合并、路由统计和解读缓存都重新创建
+    """
+    services = {"gemini": FakeService("gemini"), "deepseek": FakeService("deepseek")}
+    monkeypatch.setattr(AIServiceFactory, "_instances", dict(services))
+    monkeypatch.setattr(AIServiceFactory, "_admission", {})
+    monkeypatch.setattr(AIServiceFactory, "_breakers", {
+        name: CircuitBreaker(name, min_calls=2, open_seconds=30) for name in services
+    })
+    monkeypatch.setattr(AIServiceFactory, "_latencies", {})
+    monkeypatch.setattr(AIServiceFactory, "_single_flight", SingleFlight())
+    monkeypatch.setattr(AIServiceFactory, "_routing_stats", {"failovers": 0, "hedged": 0, "hedgeWins": 0})
+    monkeypatch.setattr(AIServiceFactory, "FAILOVER_ENABLED", True)
+    monkeypatch.setattr(AIServiceFactory, "HEDGE_ENABLED", False)
+    monkeypatch.setattr(ai_factory_module, "interpretation_cache", InterpretationCache(max_entries=16))
+    return FakeFactory(services)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """
+    只挂载占卜路由的测试客户端，占卜结果存储和海报缓存放在临时目录
+    """
+    monkeypatch.setattr(divination_module, "divination_store", DivinationStore(tmp_path / "divinations.db"))
+    renderer = PosterRenderer(cache_dir=tmp_path / "posters", workers=1, app_url="http://localhost")
+    monkeypatch.setattr(divination_module, "poster_renderer", renderer)
+    
+    app = FastAPI()
+    app.include_router(divination_module.router, prefix="/api/divination")
+    with TestClient(app) as test_client:
+        yield test_client
+    
+    renderer.shutdown()
+    divination_module.divination_store.close()
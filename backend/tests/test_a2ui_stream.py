@@ -0,0 +1,171 @@
+"""
+A2UI 增量解析器测试
+"""
+import json
+
+import pytest
+
+from app.services.a2ui_stream import A2UIStreamParser
+
+
+DOC = {
+    "version": "1.0",
+    "root": "root",
+    "components": [
+        {
+            "id": "card-overview",
+            "type": "card",
+            "props": {"title": "📖 \"卦象\" {总论} [", "values": [1, 2.5, True, None, [3, [4]]]},
+            "children": ["text-overview"]
+        },
+        {
+            "id": "text-overview",
+            "type": "text",
+            "props": {"content": "第一行\n第二行 \\ 结束 乾"}
+        },
+        {
+            "id": "list-readings",
+            "type": "list",
+            "props": {"items": [["嵌套", "数组"], {"k": ["v", {"deep": []}]}]}
+        }
+    ],
+    "metadata": {"question": "问事业"}
+}
+
+
+def feed_in_chunks(parser: A2UIStreamParser, text: str, size: int) -> list:
+    """按固定长度分块输入，返回逐块产出的组件"""
+    components = []
+    for i in range(0, len(text), size):
+        components += parser.feed(text[i:i + size])
+    return components
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+@pytest.mark.parametrize("ensure_ascii", [False, True])
+def test_split_chunks(size, ensure_ascii):
+    """任意分块（包括切在转义符、\\u 转义中间）的结果与整体解析一致"""
+    raw = json.dumps(DOC, ensure_ascii=ensure_ascii, indent=2)
+    parser = A2UIStreamParser()
+    components = feed_in_chunks(parser, raw, size)
+    
+    assert components == DOC["components"]
+    assert parser.done
+    assert parser.close() == DOC
+    assert not parser.repaired
+
+
+def test_components_emitted_as_soon_as_closed():
+    """组件闭合后立即产出，不等根对象结束"""
+    raw = json.dumps(DOC, ensure_ascii=False)
+    first_end = raw.index('"text-overview"]}') + len('"text-overview"]}')
+    
+    parser = A2UIStreamParser()
+    assert parser.feed(raw[:first_end - 1]) == []
+    assert parser.feed(raw[first_end - 1:first_end]) == [DOC["components"][0]]
+    assert not parser.done
+
+
+def test_nested_arrays_inside_component_are_not_components():
+    """组件内部的嵌套数组、对象不会被当作组件产出"""
+    parser = A2UIStreamParser()
+    components = parser.feed(json.dumps(DOC, ensure_ascii=False))
+    
+    assert [component["id"] for component in components] == ["card-overview", "text-overview", "list-readings"]
+
+
+def test_ignores_text_around_json():
+    """忽略代码块标记和前后的说明文字"""
+    raw = "好的，以下是解读：\n```json\n" + json.dumps(DOC, ensure_ascii=False) + "\n```\n希望对你有帮助 {"
+    parser = A2UIStreamParser()
+    feed_in_chunks(parser, raw, 5)
+    
+    assert parser.close() == DOC
+
+
+@pytest.mark.parametrize("ensure_ascii", [False, True])
+def test_truncated_json_is_repaired(ensure_ascii):
+    """在任意位置截断都能修复为合法 JSON，已闭合的组件原样保留"""
+    raw = json.dumps(DOC, ensure_ascii=ensure_ascii)
+    start = raw.index("{")
+    
+    for cut in range(start + 1, len(raw) - 1):
+        parser = A2UIStreamParser()
+        components = feed_in_chunks(parser, raw[:cut], 4)
+        result = parser.close()
+        
+        assert isinstance(result, dict)
+        assert parser.repaired
+        assert result.get("components", [])[:len(components)] == components
+
+
+def test_truncated_in_string_value_keeps_prefix():
+    """截断在字符串值中间时保留已输出的部分"""
+    parser = A2UIStreamParser()
+    parser.feed('{"version": "1.0", "components": [{"id": "t", "props": {"content": "潜龙勿用，阳在下')
+    
+    result = parser.close()
+    assert result["components"][0]["props"]["content"] == "潜龙勿用，阳在下"
+    assert parser.repaired
+
+
+def test_truncated_in_key_drops_incomplete_member():
+    """截断在键或未完成的值处时丢弃不完整的成员"""
+    parser = A2UIStreamParser()
+    parser.feed('{"version": "1.0", "root": "r", "compon')
+    assert parser.close() == {"version": "1.0", "root": "r"}
+    
+    parser = A2UIStreamParser()
+    parser.feed('{"version": "1.0", "count": 12')
+    assert parser.close() == {"version": "1.0"}
+
+
+def test_truncated_unicode_escape():
+    """截断在 \\u 转义中间时去掉不完整的转义"""
+    parser = A2UIStreamParser()
+    parser.feed('{"content": "\\u4e7e\\u5')
+    assert parser.close() == {"content": "乾"}
+
+
+def test_no_json_raises():
+    parser = A2UIStreamParser()
+    parser.feed("抱歉，我无法回答这个问题。")
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_feed_after_done_is_ignored():
+    parser = A2UIStreamParser()
+    parser.feed('{"components": []}')
+    assert parser.done
+    assert parser.feed('{"components": [{"id": "x"}]}') == []
+    assert parser.close() == {"components": []}
+
+
+def test_only_unfinished_text_is_retained():
+    """已闭合的组件和成员不再保留原文，保留的输入与输出总长无关"""
+    doc = {"version": "1.0", "components": [{"id": f"c{i}", "props": {"content": "乾" * 200}} for i in range(50)]}
+    raw = json.dumps(doc, ensure_ascii=False)
+    parser = A2UIStreamParser()
+    retained = 0
+    for i in range(0, len(raw), 16):
+        parser.feed(raw[i:i + 16])
+        retained = max(retained, sum(len(chunk) for chunk in parser._chunks))
+    
+    assert parser.close() == doc
+    assert retained < 300
+
+
+def test_invalid_member_raises():
+    parser = A2UIStreamParser()
+    parser.feed('{"version": "1.0", "count": tru, "components": []}')
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_invalid_component_is_skipped():
+    parser = A2UIStreamParser()
+    components = parser.feed('{"components": [{"id": "a"}, {"id": tru}, {"id": "b"}]}')
+    
+    assert components == [{"id": "a"}, {"id": "b"}]
+    assert parser.close() == {"components": components}
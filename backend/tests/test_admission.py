@@ -0,0 +1,123 @@
+"""
+准入控制测试
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.services.ai_factory import AIServiceFactory
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_queue_full_is_rejected_with_429():
+    async def scenario():
+        admission = AdmissionController("test", max_concurrency=1, max_queue=1)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        
+        # 归还许可后排队的请求获得准入
+        admission.release()
+        await waiter
+        return rejected.value, admission.stats()
+    
+    rejected, stats = run(scenario())
+    assert rejected.status_code == 429
+    assert stats["rejectedQueueFull"] == 1
+    assert stats["active"] == 1 and stats["waiting"] == 0 and stats["admitted"] == 2
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        admission = AdmissionController("test", max_concurrency=1, queue_timeout=0.05)
+        await admission.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        return rejected.value, admission.stats()
+    
+    rejected, stats = run(scenario())
+    assert rejected.status_code == 503
+    assert stats["rejectedTimeout"] == 1 and stats["waiting"] == 0
+
+
+def test_request_deadline_shortens_queue_wait():
+    """请求截止时间早于 queue_timeout 时按截止时间拒绝"""
+    async def scenario():
+        admission = AdmissionController("test", max_concurrency=1, queue_timeout=30)
+        await admission.acquire()
+        started = time.monotonic()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire(deadline=started + 0.05)
+        return rejected.value, time.monotonic() - started
+    
+    rejected, elapsed = run(scenario())
+    assert rejected.status_code == 503
+    assert elapsed < 1
+
+
+def test_rate_limit_rejects_when_token_arrives_after_deadline():
+    async def scenario():
+        admission = AdmissionController("test", rate=1, burst=1, queue_timeout=0.05)
+        await admission.acquire()
+        admission.release()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        return rejected.value, admission.stats()
+    
+    rejected, stats = run(scenario())
+    assert rejected.status_code == 503
+    assert stats["active"] == 0
+
+
+def test_stream_rejected_before_ready(factory):
+    """流式调用准入被拒时在 ready 之前抛出，调用方可以直接返回 429"""
+    async def scenario():
+        admission = AdmissionController("gemini", max_concurrency=1, max_queue=0)
+        AIServiceFactory._admission["gemini"] = admission
+        await admission.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await anext(factory.stream())
+        return rejected.value
+    
+    assert run(scenario()).status_code == 429
+
+
+@pytest.mark.parametrize("events_before_close", [1, 2])
+def test_stream_closed_early_releases_permit(factory, events_before_close):
+    """流式调用在完成之前被关闭（且没有其他相同请求）时取消上游调用，归还准入许可"""
+    async def scenario():
+        factory["gemini"].hold_after = 1
+        events = factory.stream()
+        received = [await anext(events) for _ in range(events_before_close)]
+        active = AIServiceFactory.get_admission("gemini").stats()["active"]
+        await events.aclose()
+        await asyncio.sleep(0)
+        return received, active, AIServiceFactory.get_admission("gemini").stats()
+    
+    received, active, stats = run(scenario())
+    assert received[0] == ("ready", {"source": "model"})
+    assert active == 1
+    assert stats["active"] == 0
+    assert factory["gemini"].cancelled == 1
+
+
+def test_stream_closed_in_half_open_frees_trial(factory):
+    async def scenario():
+        breaker = AIServiceFactory.get_breaker("gemini")
+        breaker.state = breaker.HALF_OPEN
+        factory["gemini"].hold_after = 0
+        events = factory.stream()
+        await anext(events)
+        blocked = breaker.allow_request()
+        await events.aclose()
+        await asyncio.sleep(0)
+        return blocked, breaker.allow_request()
+    
+    assert run(scenario()) == (False, True)
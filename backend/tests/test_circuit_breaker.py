@@ -0,0 +1,146 @@
+"""
+熔断器状态转换测试
+"""
+import pytest
+
+from app.services import circuit_breaker as circuit_breaker_module
+from app.services.circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    """可手动推进的 time.monotonic"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker_module.time, "monotonic", fake)
+    return fake
+
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    options = dict(window_seconds=60, min_calls=4, failure_rate=0.5, slow_call_ms=1000,
+                   slow_call_rate=0.8, open_seconds=30, half_open_calls=1)
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+
+def call(breaker: CircuitBreaker, success: bool = True, latency_ms: float = 10) -> bool:
+    """发起一次调用并报告结果，返回是否放行"""
+    if not breaker.allow_request():
+        return False
+    breaker.record(success, latency_ms)
+    return True
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        call(breaker, success=False)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_opens_on_failure_rate(clock):
+    breaker = make_breaker()
+    call(breaker)
+    call(breaker)
+    call(breaker, success=False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    call(breaker, success=False)
+    
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()["opened"] == 1
+
+
+def test_opens_on_slow_call_rate(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        call(breaker, latency_ms=1500)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_old_results_leave_the_window(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        call(breaker, success=False)
+    clock.now += 61
+    call(breaker, success=False)
+    
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["windowCalls"] == 1
+
+
+def test_open_short_circuits_until_cooldown(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        call(breaker, success=False)
+    
+    assert not breaker.allow_request()
+    assert not breaker.available()
+    assert breaker.stats()["shortCircuited"] == 1
+    
+    clock.now += 30
+    assert breaker.available()
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def open_then_half_open(clock, **kwargs) -> CircuitBreaker:
+    breaker = make_breaker(**kwargs)
+    for _ in range(4):
+        call(breaker, success=False)
+    clock.now += 30
+    return breaker
+
+
+def test_half_open_limits_trial_calls(clock):
+    breaker = open_then_half_open(clock)
+    assert breaker.allow_request()
+    # 试探调用尚未返回，不再放行
+    assert not breaker.allow_request()
+
+
+def test_half_open_success_closes(clock):
+    breaker = open_then_half_open(clock, half_open_calls=2)
+    assert call(breaker)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert call(breaker)
+    
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["windowCalls"] == 0
+
+
+@pytest.mark.parametrize("success, latency_ms", [(False, 10), (True, 1500)])
+def test_half_open_failure_or_slow_call_reopens(clock, success, latency_ms):
+    breaker = open_then_half_open(clock)
+    assert call(breaker, success=success, latency_ms=latency_ms)
+    
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()["opened"] == 2
+    assert not breaker.allow_request()
+
+
+def test_abandoned_trial_frees_the_slot(clock):
+    breaker = open_then_half_open(clock)
+    assert breaker.allow_request()
+    breaker.abandon()
+    
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_results_of_calls_admitted_before_opening_are_ignored(clock):
+    breaker = make_breaker()
+    assert breaker.allow_request()
+    for _ in range(4):
+        call(breaker, success=False)
+    assert breaker.state == CircuitBreaker.OPEN
+    
+    breaker.record(True, 10)
+    assert breaker.state == CircuitBreaker.OPEN
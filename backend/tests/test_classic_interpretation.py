@@ -0,0 +1,129 @@
+"""
+经传解读（变占规则）测试
+"""
+import pytest
+
+from app.services.classic_interpretation import build_classic_response, judge_fortune, select_readings
+from app.services.hexagram_corpus import hexagram_corpus
+from app.services.liuyao_service import LiuYaoService
+
+
+liuyao_service = LiuYaoService()
+
+# 正面数量：3=老阳（变），0=老阴（变），2=少阳，1=少阴
+OLD_YANG, YOUNG_YIN, YOUNG_YANG, OLD_YIN = 3, 1, 2, 0
+
+
+def divine(heads: list) -> dict:
+    """由六爻（初爻在前）的正面数量起卦"""
+    return liuyao_service.calculate_hexagram([[1] * count + [0] * (3 - count) for count in heads])
+
+
+def readings_for(heads: list):
+    result = divine(heads)
+    return result, select_readings(result["original_hexagram"], result.get("changed_hexagram"), result["lines"])
+
+
+def test_no_changing_lines_uses_judgment():
+    """六爻安静：本卦卦辞"""
+    result, (rule, readings) = readings_for([YOUNG_YANG] * 6)
+    
+    assert result["original_hexagram"]["number"] == 1
+    assert rule.startswith("六爻安静")
+    assert readings == ["「乾为天」卦辞：元亨，利贞。"]
+
+
+def test_one_changing_line_uses_that_line():
+    """一爻变：本卦变爻爻辞"""
+    _, (rule, readings) = readings_for([OLD_YANG] + [YOUNG_YANG] * 5)
+    
+    assert rule.startswith("一爻变")
+    assert readings == ["「乾为天」初九：潜龙勿用。"]
+
+
+def test_two_changing_lines_upper_first():
+    """二爻变：本卦两变爻爻辞，以上爻为主"""
+    result, (rule, readings) = readings_for([OLD_YANG, YOUNG_YANG, YOUNG_YANG, YOUNG_YANG, OLD_YANG, YOUNG_YANG])
+    name = result["original_hexagram"]["name"]
+    
+    assert rule.startswith("二爻变")
+    assert readings == [f"「{name}」{hexagram_corpus.line(1, 5)}", f"「{name}」{hexagram_corpus.line(1, 1)}"]
+
+
+def test_three_changing_lines_uses_both_judgments():
+    """三爻变：本卦、之卦卦辞，以本卦为主"""
+    result, (rule, readings) = readings_for([OLD_YANG, OLD_YANG, OLD_YANG, YOUNG_YANG, YOUNG_YANG, YOUNG_YANG])
+    original, changed = result["original_hexagram"], result["changed_hexagram"]
+    
+    assert rule.startswith("三爻变")
+    assert readings == [
+        f"「{original['name']}」卦辞：{hexagram_corpus.judgment(original['number'])}",
+        f"「{changed['name']}」卦辞：{hexagram_corpus.judgment(changed['number'])}"
+    ]
+
+
+def test_four_changing_lines_uses_changed_static_lines_lower_first():
+    """四爻变：之卦两不变爻爻辞，以下爻为主"""
+    result, (rule, readings) = readings_for([YOUNG_YANG, OLD_YANG, OLD_YANG, YOUNG_YANG, OLD_YANG, OLD_YANG])
+    changed = result["changed_hexagram"]
+    
+    assert rule.startswith("四爻变")
+    assert readings == [
+        f"「{changed['name']}」{hexagram_corpus.line(changed['number'], 1)}",
+        f"「{changed['name']}」{hexagram_corpus.line(changed['number'], 4)}"
+    ]
+
+
+def test_five_changing_lines_uses_changed_static_line():
+    """五爻变：之卦不变爻爻辞"""
+    result, (rule, readings) = readings_for([OLD_YANG, OLD_YANG, YOUNG_YIN, OLD_YANG, OLD_YANG, OLD_YANG])
+    changed = result["changed_hexagram"]
+    
+    assert rule.startswith("五爻变")
+    assert readings == [f"「{changed['name']}」{hexagram_corpus.line(changed['number'], 3)}"]
+    # 不变爻在之卦中仍是同一爻
+    assert readings[0].startswith(f"「{changed['name']}」六三")
+
+
+@pytest.mark.parametrize("heads, expected", [
+    ([OLD_YANG] * 6, "「乾为天」用九：见群龙无首，吉。"),
+    ([OLD_YIN] * 6, "「坤为地」用六：利永贞。"),
+])
+def test_six_changing_lines_qian_kun_use_yong(heads, expected):
+    """六爻皆变：乾坤以用九、用六断"""
+    _, (rule, readings) = readings_for(heads)
+    
+    assert rule.startswith("六爻皆变")
+    assert readings == [expected]
+
+
+def test_six_changing_lines_other_hexagrams_use_changed_judgment():
+    """六爻皆变：余卦以之卦卦辞断"""
+    result, (rule, readings) = readings_for([OLD_YANG, OLD_YIN] * 3)
+    changed = result["changed_hexagram"]
+    
+    assert rule == "六爻皆变，以之卦卦辞断"
+    assert readings == [f"「{changed['name']}」卦辞：{hexagram_corpus.judgment(changed['number'])}"]
+
+
+def test_every_outcome_builds_a_response():
+    """4096 种起卦结果都能生成完整的解读"""
+    for code in range(4096):
+        result = divine([(code >> (2 * i)) & 3 for i in range(6)])
+        response = build_classic_response(
+            "问", result["original_hexagram"], result.get("changed_hexagram"), result["lines"],
+            generated_by="local", notice="说明"
+        )
+        ids = [component["id"] for component in response["components"]]
+        assert "badge-fortune" in ids and "list-readings" in ids
+
+
+@pytest.mark.parametrize("readings, expected", [
+    (["「乾为天」卦辞：元亨，利贞。"], "平"),
+    (["「乾为天」用九：见群龙无首，吉。"], "吉"),
+    (["「坤为地」六五：黄裳，元吉。"], "大吉"),
+    (["「某」卦辞：无攸利。"], "小凶"),
+    (["「某」六三：凶。"], "凶"),
+])
+def test_judge_fortune(readings, expected):
+    assert judge_fortune(readings)[0] == expected
@@ -0,0 +1,140 @@
+"""
+占卜 API 测试
+"""
+import itertools
+import json
+
+import pytest
+
+from app.api import divination as divination_module
+from app.services.liuyao_service import LiuYaoService
+
+
+# 第一、四爻为老阳（变爻），其余为少阳
+COIN_RESULTS = [[1, 1, 1], [1, 0, 0], [1, 0, 0], [1, 1, 1], [1, 0, 0], [1, 0, 0]]
+
+BASE = "/api/divination"
+
+
+@pytest.fixture
+def share_id(client) -> str:
+    """用不调用 AI 的 local 模式完成并保存一次占卜"""
+    response = client.post(f"{BASE}/liuyao", json={
+        "question": "问事业", "coin_results": COIN_RESULTS, "model": "local"
+    })
+    assert response.status_code == 200
+    return response.json()["shareId"]
+
+
+def test_get_divination_returns_saved_content_with_etag(client, share_id):
+    response = client.get(f"{BASE}/{share_id}")
+    
+    assert response.status_code == 200
+    assert response.json()["shareId"] == share_id
+    assert response.headers["etag"] == f'"{share_id}"'
+    assert "immutable" in response.headers["cache-control"]
+
+
+@pytest.mark.parametrize("if_none_match", ['"{id}"', 'W/"{id}"', '"other", "{id}"', "*"])
+def test_get_divination_matching_etag_returns_304(client, share_id, if_none_match):
+    response = client.get(f"{BASE}/{share_id}", headers={"If-None-Match": if_none_match.format(id=share_id)})
+    
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == f'"{share_id}"'
+
+
+def test_get_divination_other_etag_returns_content(client, share_id):
+    response = client.get(f"{BASE}/{share_id}", headers={"If-None-Match": '"other"'})
+    
+    assert response.status_code == 200
+    assert response.json()["shareId"] == share_id
+
+
+def test_get_divination_unknown_id_returns_404_even_if_etag_matches(client, share_id):
+    unknown = "A" * 12 if share_id != "A" * 12 else "B" * 12
+    
+    assert client.get(f"{BASE}/{unknown}").status_code == 404
+    assert client.get(f"{BASE}/{unknown}", headers={"If-None-Match": f'"{unknown}"'}).status_code == 404
+    assert client.get(f"{BASE}/{unknown}", headers={"If-None-Match": "*"}).status_code == 404
+
+
+def test_get_divination_invalid_id_returns_404(client):
+    assert client.get(f"{BASE}/not-an-id").status_code == 404
+    assert client.get(f"{BASE}/not-an-id", headers={"If-None-Match": "*"}).status_code == 404
+
+
+def test_poster_etag_and_304(client, share_id):
+    response = client.get(f"{BASE}/{share_id}/poster.svg")
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("image/svg+xml")
+    assert "immutable" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+    
+    revalidated = client.get(f"{BASE}/{share_id}/poster.svg", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+
+
+def test_poster_unknown_id_or_format_returns_404(client, share_id):
+    unknown = "A" * 12 if share_id != "A" * 12 else "B" * 12
+    
+    assert client.get(f"{BASE}/{unknown}/poster.svg", headers={"If-None-Match": "*"}).status_code == 404
+    assert client.get(f"{BASE}/{share_id}/poster.gif").status_code == 404
+
+
+def test_batch_matches_calculate_hexagram(client):
+    # 每爻 0~3 枚正面的全部组合，跨越多个分块
+    batch = [
+        [[1] * heads + [0] * (3 - heads) for heads in counts]
+        for counts in itertools.product(range(4), repeat=6)
+    ]
+    
+    response = client.post(f"{BASE}/liuyao/batch", json={"coin_results": batch})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == len(batch) > divination_module.BATCH_CHUNK_SIZE
+    
+    service = LiuYaoService()
+    for index, (row, coin_results) in enumerate(zip(rows, batch)):
+        expected = service.calculate_hexagram(coin_results)
+        assert row == {
+            "index": index,
+            "success": True,
+            "originalHexagram": expected["original_hexagram"],
+            "changedHexagram": expected.get("changed_hexagram"),
+            "lines": expected["lines"],
+            "hasChanging": expected["has_changing"]
+        }
+
+
+def test_batch_reports_invalid_groups_without_failing_the_rest(client):
+    batch = [COIN_RESULTS, COIN_RESULTS[:5], COIN_RESULTS[:5] + [[1, 1]], COIN_RESULTS]
+    
+    response = client.post(f"{BASE}/liuyao/batch", json={"coin_results": batch})
+    
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["index"] for row in rows] == [0, 1, 2, 3]
+    assert [row["success"] for row in rows] == [True, False, False, True]
+    assert rows[1]["error"] == "需要6次掷铜钱结果"
+    assert rows[2]["error"] == "第6次掷铜钱需要3枚铜钱结果"
+    assert rows[0] == rows[3] | {"index": 0}
+
+
+def test_batch_rejects_oversized_requests(client, monkeypatch):
+    monkeypatch.setattr(divination_module, "BATCH_MAX_SIZE", 2)
+    
+    response = client.post(f"{BASE}/liuyao/batch", json={"coin_results": [COIN_RESULTS] * 3})
+    
+    assert response.status_code == 400
+    assert client.post(f"{BASE}/liuyao/batch", json={"coin_results": [COIN_RESULTS] * 2}).status_code == 200
+
+
+def test_batch_empty(client):
+    response = client.post(f"{BASE}/liuyao/batch", json={"coin_results": []})
+    
+    assert response.status_code == 200
+    assert response.text == ""
@@ -0,0 +1,191 @@
+"""
+幂等请求存储测试
+"""
+import asyncio
+
+import pytest
+
+from app.services.idempotency import IdempotencyConflict, IdempotencyStore
+
+
+class Upstream:
+    """记录调用次数、可控制何时返回的上游"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.fail = False
+    
+    async def __call__(self) -> str:
+        self.calls += 1
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("upstream failed")
+        return f"result-{self.calls}"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_retry_shares_in_flight_request():
+    async def scenario():
+        store, upstream = IdempotencyStore(), Upstream()
+        first = asyncio.create_task(store.do("k", "f", upstream))
+        retry = asyncio.create_task(store.do("k", "f", upstream))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await first, await retry, upstream.calls, store.stats()
+    
+    first, retry, calls, stats = run(scenario())
+    assert first == ("result-1", False)
+    assert retry == ("result-1", True)
+    assert calls == 1
+    assert stats["replayed"] == 1
+
+
+def test_completed_result_is_replayed():
+    async def scenario():
+        store, upstream = IdempotencyStore(), Upstream()
+        upstream.release.set()
+        await store.do("k", "f", upstream)
+        return await store.do("k", "f", upstream), upstream.calls
+    
+    assert run(scenario()) == (("result-1", True), 1)
+
+
+def test_different_fingerprint_conflicts():
+    async def scenario():
+        store, upstream = IdempotencyStore(), Upstream()
+        upstream.release.set()
+        await store.do("k", "f", upstream)
+        with pytest.raises(IdempotencyConflict):
+            await store.do("k", "other", upstream)
+        return store.stats()["conflicts"]
+    
+    assert run(scenario()) == 1
+
+
+def test_failed_request_is_not_saved():
+    async def scenario():
+        store, upstream = IdempotencyStore(), Upstream()
+        upstream.fail = True
+        upstream.release.set()
+        with pytest.raises(RuntimeError):
+            await store.do("k", "f", upstream)
+        upstream.fail = False
+        return await store.do("k", "f", upstream), upstream.calls
+    
+    assert run(scenario()) == (("result-2", False), 2)
+
+
+def test_caller_cancellation_does_not_cancel_request():
+    """首个请求的客户端断开后请求继续执行，重试取得同一结果"""
+    async def scenario():
+        store, upstream = IdempotencyStore(), Upstream()
+        first = asyncio.create_task(store.do("k", "f", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await store.do("k", "f", upstream), upstream.calls
+    
+    assert run(scenario()) == (("result-1", True), 1)
+
+
+def test_expired_result_is_executed_again():
+    async def scenario():
+        store, upstream = IdempotencyStore(ttl=0), Upstream()
+        upstream.release.set()
+        await store.do("k", "f", upstream)
+        await asyncio.sleep(0.01)
+        return await store.do("k", "f", upstream), upstream.calls
+    
+    assert run(scenario()) == (("result-2", False), 2)
+
+
+def test_in_flight_keys_are_not_evicted():
+    async def scenario():
+        store, upstream = IdempotencyStore(max_keys=2), Upstream()
+        tasks = [asyncio.create_task(store.do(f"k{i}", "f", upstream)) for i in range(4)]
+        await asyncio.sleep(0)
+        in_flight = store.stats()
+        retry = asyncio.create_task(store.do("k0", "f", upstream))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        await asyncio.gather(*tasks)
+        return in_flight, (await retry)[1], upstream.calls, store.stats()
+    
+    in_flight, replayed, calls, stats = run(scenario())
+    assert in_flight["keys"] == 4 and in_flight["evictions"] == 0
+    assert replayed
+    assert calls == 4
+    # 完成后淘汰到上限以内
+    assert stats["keys"] == 2 and stats["evictions"] == 2
+
+
+class StreamUpstream(Upstream):
+    """发布两个事件的流式上游"""
+    
+    async def __call__(self, publish) -> str:
+        publish("component", 1)
+        result = await super().__call__()
+        publish("component", 2)
+        return result
+
+
+async def collect(events) -> list:
+    return [item async for item in events]
+
+
+def test_stream_retry_attaches_to_in_flight_request():
+    async def scenario():
+        store, upstream = IdempotencyStore(), StreamUpstream()
+        _, first = store.stream("k", "f", upstream)
+        received = [await anext(first)]
+        replayed, retry = store.stream("k", "f", upstream)
+        retry = asyncio.create_task(collect(retry))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        received += await collect(first)
+        return received, replayed, await retry, upstream.calls
+    
+    received, replayed, retry, calls = run(scenario())
+    assert received == [("component", 1), ("component", 2), ("done", "result-1")]
+    assert replayed and retry == received
+    assert calls == 1
+
+
+def test_stream_retry_after_completion_gets_result_only():
+    async def scenario():
+        store, upstream = IdempotencyStore(), StreamUpstream()
+        upstream.release.set()
+        _, first = store.stream("k", "f", upstream)
+        await collect(first)
+        replayed, retry = store.stream("k", "f", upstream)
+        # 非流式请求同样复用
+        return replayed, await collect(retry), await store.do("k", "f", upstream), upstream.calls
+    
+    assert run(scenario()) == (True, [("done", "result-1")], ("result-1", True), 1)
+
+
+def test_stream_continues_after_client_leaves():
+    async def scenario():
+        store, upstream = IdempotencyStore(), StreamUpstream()
+        _, first = store.stream("k", "f", upstream)
+        await anext(first)
+        await first.aclose()
+        upstream.release.set()
+        return await store.do("k", "f", upstream), upstream.calls
+    
+    assert run(scenario()) == (("result-1", True), 1)
+
+
+def test_stream_conflict_is_raised_before_streaming():
+    async def scenario():
+        store, upstream = IdempotencyStore(), StreamUpstream()
+        store.stream("k", "f", upstream)
+        with pytest.raises(IdempotencyConflict):
+            store.stream("k", "other", upstream)
+    
+    run(scenario())
@@ -0,0 +1,153 @@
+"""
+解读缓存测试
+"""
+import asyncio
+
+from app.services import ai_factory as ai_factory_module
+from app.services.interpretation_cache import InterpretationCache
+
+
+ORIGINAL = {"name": "乾为天", "number": 1}
+CHANGED = {"name": "天风姤", "number": 44}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_normalize_question_ignores_width_whitespace_punctuation_and_case():
+    assert InterpretationCache.normalize_question("  问 事业？ ") == "问 事业"
+    assert InterpretationCache.normalize_question("问\t\n事业!!") == "问 事业"
+    assert InterpretationCache.normalize_question("ＡＢＣ　Job？") == "abc job"
+
+
+def test_make_key_depends_on_model_question_and_hexagrams():
+    key = InterpretationCache.make_key("gemini", "问事业？", ORIGINAL, CHANGED)
+    
+    assert key == InterpretationCache.make_key("gemini", " 问事业 ", ORIGINAL, CHANGED)
+    assert key != InterpretationCache.make_key("deepseek", "问事业", ORIGINAL, CHANGED)
+    assert key != InterpretationCache.make_key("gemini", "问婚姻", ORIGINAL, CHANGED)
+    assert key != InterpretationCache.make_key("gemini", "问事业", ORIGINAL, None)
+    assert key != InterpretationCache.make_key("gemini", "问事业", {"number": 2}, CHANGED)
+
+
+def test_get_set_and_stats():
+    async def scenario():
+        cache = InterpretationCache(max_entries=4)
+        assert await cache.get("a") is None
+        await cache.set("a", {"value": 1})
+        assert await cache.get("a") == {"value": 1}
+        return cache.stats()
+    
+    stats = run(scenario())
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    assert stats["hitRate"] == 0.5
+
+
+def test_evicts_least_recently_used():
+    async def scenario():
+        cache = InterpretationCache(max_entries=2)
+        await cache.set("a", {"value": "a"})
+        await cache.set("b", {"value": "b"})
+        await cache.get("a")
+        await cache.set("c", {"value": "c"})
+        return cache, [await cache.get(key) for key in ("a", "b", "c")]
+    
+    cache, values = run(scenario())
+    assert values == [{"value": "a"}, None, {"value": "c"}]
+    assert cache.evictions == 1
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    async def scenario():
+        cache = InterpretationCache(max_entries=4, ttl=10)
+        monkeypatch.setattr("time.time", lambda: 1000.0)
+        await cache.set("a", {"value": 1})
+        monkeypatch.setattr("time.time", lambda: 1011.0)
+        return cache, await cache.get("a")
+    
+    cache, value = run(scenario())
+    assert value is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_disabled_cache_stores_nothing():
+    async def scenario():
+        cache = InterpretationCache(max_entries=0)
+        await cache.set("a", {"value": 1})
+        return cache, await cache.get("a")
+    
+    cache, value = run(scenario())
+    assert value is None
+    assert not cache.enabled
+    assert cache.misses == 0
+
+
+def test_sqlite_tier_survives_a_new_instance(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    
+    async def scenario():
+        await InterpretationCache(max_entries=4, db_path=db_path).set("a", {"value": "持久"})
+        
+        cache = InterpretationCache(max_entries=4, db_path=db_path)
+        first = await cache.get("a")
+        second = await cache.get("a")
+        return cache, first, second
+    
+    cache, first, second = run(scenario())
+    assert first == second == {"value": "持久"}
+    # 第一次从磁盘读取并回填进程内缓存，第二次命中进程内缓存
+    assert cache.disk_hits == 1
+    assert cache.hits == 1
+
+
+def test_sqlite_tier_skips_expired_rows(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "cache.db")
+    
+    async def scenario():
+        monkeypatch.setattr("time.time", lambda: 1000.0)
+        await InterpretationCache(max_entries=4, ttl=10, db_path=db_path).set("a", {"value": 1})
+        monkeypatch.setattr("time.time", lambda: 1011.0)
+        return await InterpretationCache(max_entries=4, ttl=10, db_path=db_path).get("a")
+    
+    assert run(scenario()) is None
+
+
+def test_factory_caches_interpretation(factory):
+    async def scenario():
+        first = await factory.generate("问事业？")
+        second = await factory.generate("问事业")
+        return first, second
+    
+    first, second = run(scenario())
+    assert factory["gemini"].calls == 1
+    assert first["components"] == second["components"]
+    # 命中缓存时换成本次请求的原始问题
+    assert second["metadata"]["question"] == "问事业"
+    assert ai_factory_module.interpretation_cache.hits == 1
+
+
+def test_factory_does_not_cache_fallback_responses(factory):
+    factory["gemini"].fail = True
+    factory["deepseek"].fail = True
+    
+    async def scenario():
+        await factory.generate()
+        await factory.generate()
+    
+    run(scenario())
+    assert factory["gemini"].calls == 2
+    assert ai_factory_module.interpretation_cache.stats()["entries"] == 0
+
+
+def test_factory_stream_serves_cache_hits(factory):
+    async def scenario():
+        await factory.collect(factory.stream())
+        return await factory.collect(factory.stream())
+    
+    events = run(scenario())
+    assert factory["gemini"].calls == 1
+    assert events[0] == ("ready", {"source": "cache"})
+    assert [data for kind, data in events if kind == "component"] == factory["gemini"].components
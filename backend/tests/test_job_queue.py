@@ -0,0 +1,177 @@
+"""
+后台任务队列测试
+"""
+import asyncio
+
+import pytest
+
+from app.services.job_queue import Job, JobQueue, JobQueueFull
+
+
+class Blocker:
+    """可控制何时返回的任务函数"""
+    
+    def __init__(self, result="ok"):
+        self.result = result
+        self.release = asyncio.Event()
+        self.cancelled = False
+    
+    async def __call__(self):
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_job_succeeds_and_keeps_payload():
+    async def scenario():
+        queue, func = JobQueue(workers=1), Blocker()
+        job = queue.submit(func, {"model": "gemini"})
+        await settle()
+        running = job.status
+        func.release.set()
+        finished = await job.wait_finished(1)
+        await queue.stop()
+        return running, finished, job
+    
+    running, finished, job = run(scenario())
+    assert running == Job.RUNNING
+    assert finished and job.status == Job.SUCCEEDED
+    assert job.result == "ok" and job.payload == {"model": "gemini"}
+
+
+def test_failed_job_records_error():
+    async def scenario():
+        queue, func = JobQueue(workers=1), Blocker(RuntimeError("upstream failed"))
+        func.release.set()
+        job = queue.submit(func)
+        await job.wait_finished(1)
+        await queue.stop()
+        return job, queue.stats()["failed"]
+    
+    job, failed = run(scenario())
+    assert job.status == Job.FAILED and job.error == "upstream failed"
+    assert failed == 1
+
+
+def test_full_queue_rejects():
+    async def scenario():
+        queue = JobQueue(workers=1, max_queue=2)
+        jobs = [queue.submit(Blocker())]
+        await settle()
+        # 第一个任务已在运行，不占排队名额
+        jobs += [queue.submit(Blocker()) for _ in range(2)]
+        with pytest.raises(JobQueueFull):
+            queue.submit(Blocker())
+        stats = queue.stats()
+        await queue.stop()
+        return jobs, stats
+    
+    jobs, stats = run(scenario())
+    assert jobs[0].status == Job.CANCELLED
+    assert stats["queued"] == 2 and stats["running"] == 1 and stats["rejected"] == 1
+
+
+def test_cancelled_queued_jobs_free_queue_slots():
+    async def scenario():
+        queue = JobQueue(workers=1, max_queue=1)
+        running = queue.submit(Blocker())
+        await settle()
+        queued = queue.submit(Blocker())
+        queue.cancel(queued.id)
+        # 取消的任务仍在内部队列中，但不再占用排队名额
+        replacement = queue.submit(Blocker())
+        stats = queue.stats()
+        await queue.stop()
+        return queued, replacement, stats
+    
+    queued, replacement, stats = run(scenario())
+    assert queued.status == Job.CANCELLED
+    assert replacement.status == Job.CANCELLED  # stop() 取消了未结束的任务
+    assert stats["queued"] == 1 and stats["cancelled"] == 1
+
+
+def test_cancelled_queued_job_is_skipped():
+    async def scenario():
+        queue = JobQueue(workers=1)
+        first, second = Blocker(), Blocker()
+        first_job = queue.submit(first)
+        await settle()
+        second_job = queue.submit(second)
+        queue.cancel(second_job.id)
+        first.release.set()
+        await first_job.wait_finished(1)
+        await settle()
+        stats = queue.stats()
+        await queue.stop()
+        return second_job, second, stats
+    
+    second_job, second, stats = run(scenario())
+    assert second_job.status == Job.CANCELLED and second_job.task is None
+    assert not second.cancelled
+    assert stats["queued"] == 0 and stats["succeeded"] == 1
+
+
+def test_cancel_running_job_cancels_task():
+    async def scenario():
+        queue, func = JobQueue(workers=1), Blocker()
+        job = queue.submit(func)
+        await settle()
+        queue.cancel(job.id)
+        await job.wait_finished(1)
+        # worker 继续处理后续任务
+        follow = Blocker()
+        follow.release.set()
+        follow_job = queue.submit(follow)
+        await follow_job.wait_finished(1)
+        await queue.stop()
+        return job, func, follow_job
+    
+    job, func, follow_job = run(scenario())
+    assert job.status == Job.CANCELLED and func.cancelled
+    assert follow_job.status == Job.SUCCEEDED
+
+
+def test_finished_jobs_expire_after_ttl(monkeypatch):
+    monkeypatch.setattr(JobQueue, "PURGE_INTERVAL", 0)
+    
+    async def scenario():
+        queue, func = JobQueue(workers=1, result_ttl=0.01), Blocker()
+        func.release.set()
+        job = queue.submit(func)
+        await job.wait_finished(1)
+        kept = queue.get(job.id)
+        await asyncio.sleep(0.05)
+        expired = queue.get(job.id)
+        stats = queue.stats()
+        await queue.stop()
+        return kept, expired, stats
+    
+    kept, expired, stats = run(scenario())
+    assert kept is not None and expired is None
+    assert stats["expired"] == 1 and stats["retained"] == 0
+
+
+def test_wait_changed_times_out():
+    async def scenario():
+        queue = JobQueue(workers=1)
+        job = queue.submit(Blocker())
+        await settle()
+        changed = await job.wait_changed(0.01)
+        await queue.stop()
+        return changed
+    
+    assert run(scenario()) is False
@@ -0,0 +1,104 @@
+"""
+分享海报测试
+"""
+import asyncio
+
+import pytest
+
+from app.services.poster import PosterRenderer, PosterUnavailable, poster_fields
+
+
+DIVINATION = {
+    "shareId": "AAAAAAAAAAAA",
+    "originalHexagram": {
+        "name": "乾为天",
+        "upperTrigram": {"name": "乾"},
+        "lowerTrigram": {"name": "乾"},
+        "lines": [1, 1, 1, 1, 1, 1]
+    },
+    "changedHexagram": {"name": "天风姤"},
+    "lines": [{"changing": True}] + [{"changing": False}] * 5,
+    "a2uiResponse": {
+        "components": [
+            {"type": "text", "props": {}},
+            {"type": "badge", "props": {"label": "吉", "color": "success"}}
+        ],
+        "data": {"question": "问事业"}
+    }
+}
+
+
+@pytest.fixture
+def renderer(tmp_path):
+    renderer = PosterRenderer(cache_dir=tmp_path, workers=1, app_url="http://localhost")
+    yield renderer
+    renderer.shutdown()
+
+
+def test_poster_fields():
+    fields = poster_fields(DIVINATION)
+    
+    assert fields["hexagram_name"] == "乾为天"
+    assert fields["changed_hexagram_name"] == "天风姤"
+    assert fields["changing"] == [True, False, False, False, False, False]
+    assert fields["question"] == "问事业"
+    assert fields["fortune"] == "吉"
+
+
+def test_cache_key_depends_on_id_format_and_app_url(tmp_path):
+    renderer = PosterRenderer(cache_dir=tmp_path, app_url="http://localhost")
+    key = renderer.cache_key("AAAAAAAAAAAA", "svg")
+    
+    assert key == renderer.cache_key("AAAAAAAAAAAA", "svg")
+    assert key != renderer.cache_key("BBBBBBBBBBBB", "svg")
+    assert key != renderer.cache_key("AAAAAAAAAAAA", "png")
+    assert key != PosterRenderer(cache_dir=tmp_path, app_url="http://example.com").cache_key("AAAAAAAAAAAA", "svg")
+
+
+def test_check_format(tmp_path):
+    renderer = PosterRenderer(cache_dir=tmp_path)
+    renderer.check_format("svg")
+    
+    with pytest.raises(PosterUnavailable):
+        renderer.check_format("gif")
+    # 未配置字体时不能渲染 PNG
+    with pytest.raises(PosterUnavailable):
+        renderer.check_format("png")
+
+
+def test_render_caches_on_disk(renderer, tmp_path):
+    async def scenario():
+        first = await renderer.render("AAAAAAAAAAAA", DIVINATION, "svg")
+        second = await renderer.render("AAAAAAAAAAAA", DIVINATION, "svg")
+        return first, second
+    
+    first, second = asyncio.run(scenario())
+    assert first == second
+    assert first.startswith(b"<svg")
+    assert "乾为天".encode("utf-8") in first
+    assert renderer.rendered == 1
+    assert renderer.cache_hits == 1
+    
+    # 缓存文件名为内容 hash，没有残留的临时文件
+    key = renderer.cache_key("AAAAAAAAAAAA", "svg")
+    assert [path.name for path in tmp_path.iterdir()] == [f"{key}.svg"]
+
+
+def test_render_reads_cache_written_by_another_renderer(renderer, tmp_path):
+    asyncio.run(renderer.render("AAAAAAAAAAAA", DIVINATION, "svg"))
+    
+    other = PosterRenderer(cache_dir=tmp_path, app_url="http://localhost")
+    data = asyncio.run(other.render("AAAAAAAAAAAA", DIVINATION, "svg"))
+    
+    assert data.startswith(b"<svg")
+    assert other.rendered == 0
+    assert other.cache_hits == 1
+
+
+def test_concurrent_renders_are_merged(renderer):
+    async def scenario():
+        return await asyncio.gather(*[renderer.render("AAAAAAAAAAAA", DIVINATION, "svg") for _ in range(4)])
+    
+    results = asyncio.run(scenario())
+    assert len(set(results)) == 1
+    assert renderer.rendered == 1
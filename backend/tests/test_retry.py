@@ -0,0 +1,128 @@
+"""
+重试策略和全局重试预算测试
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import deadline
+from app.services import retry as retry_module
+from app.services.retry import RetryBudget, backoff_delay, call_with_retry
+
+
+@pytest.fixture
+def budget(monkeypatch) -> RetryBudget:
+    """替换全局重试预算，退避时间设为 0"""
+    fresh = RetryBudget(ratio=0.5, max_tokens=2)
+    monkeypatch.setattr(retry_module, "retry_budget", fresh)
+    monkeypatch.setattr(retry_module, "RETRY_BASE_DELAY", 0)
+    return fresh
+
+
+def connect_error() -> httpx.ConnectError:
+    return httpx.ConnectError("connection refused")
+
+
+def status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://example.com")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+
+
+def test_budget_limits_retries_and_refills_with_calls():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+    
+    budget.deposit()
+    assert not budget.try_spend()
+    budget.deposit()
+    assert budget.try_spend()
+    assert budget.stats() == {"tokens": 0, "retries": 3, "budgetExhausted": 2}
+
+
+def test_budget_deposit_is_capped():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    for _ in range(10):
+        budget.deposit()
+    assert budget.stats()["tokens"] == 2
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (connect_error(), True),
+    (httpx.ReadTimeout("timeout"), True),
+    (status_error(429), True),
+    (status_error(503), True),
+    (status_error(400), False),
+    (status_error(401), False),
+    (ValueError("bad json"), False),
+])
+def test_only_recoverable_errors_are_retried(budget, error, retryable):
+    assert (backoff_delay(0, error) is not None) == retryable
+
+
+def test_no_retry_after_max_attempts(budget):
+    assert backoff_delay(retry_module.MAX_RETRIES, connect_error()) is None
+    assert budget.stats()["retries"] == 0
+
+
+def test_no_retry_when_budget_exhausted(budget):
+    budget.try_spend()
+    budget.try_spend()
+    assert backoff_delay(0, connect_error()) is None
+    assert budget.stats()["budgetExhausted"] == 1
+
+
+def test_no_retry_past_deadline(budget, monkeypatch):
+    """退避后已超过请求截止时间时不重试，也不消耗预算"""
+    monkeypatch.setattr(retry_module.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(retry_module, "RETRY_BASE_DELAY", 1)
+    
+    async def scenario(seconds: float):
+        deadline.set_deadline(seconds)
+        return backoff_delay(0, connect_error())
+    
+    assert asyncio.run(scenario(0.5)) is None
+    assert budget.stats()["retries"] == 0
+    assert asyncio.run(scenario(5)) == 1
+
+
+def test_call_with_retry_recovers(budget):
+    attempts = []
+    
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise connect_error()
+        return "ok"
+    
+    assert asyncio.run(call_with_retry(flaky, "test")) == "ok"
+    assert len(attempts) == 2
+    assert budget.stats()["retries"] == 1
+
+
+def test_call_with_retry_gives_up_when_budget_is_exhausted(budget):
+    budget.try_spend()
+    budget.try_spend()
+    attempts = []
+    
+    async def failing():
+        attempts.append(1)
+        raise connect_error()
+    
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(call_with_retry(failing, "test"))
+    # 本次调用存入 0.5，不足一次重试
+    assert len(attempts) == 1
+
+
+def test_call_with_retry_does_not_retry_client_errors(budget):
+    attempts = []
+    
+    async def rejected():
+        attempts.append(1)
+        raise status_error(400)
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(call_with_retry(rejected, "test"))
+    assert len(attempts) == 1
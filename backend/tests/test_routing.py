@@ -0,0 +1,130 @@
+"""
+失败切换和对冲请求测试
+"""
+import asyncio
+
+import pytest
+
+from app.services.ai_factory import AIServiceFactory
+from app.services.latency_tracker import LatencyTracker
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def generated_by(response) -> str:
+    return response["metadata"]["generatedBy"]
+
+
+def test_primary_success_does_not_touch_backup(factory):
+    response = run(factory.generate())
+    
+    assert generated_by(response) == "gemini"
+    assert factory["deepseek"].calls == 0
+    assert AIServiceFactory.get_routing_stats()["failovers"] == 0
+
+
+def test_failed_primary_fails_over_to_backup(factory):
+    factory["gemini"].fail = True
+    response = run(factory.generate())
+    
+    assert generated_by(response) == "deepseek"
+    assert AIServiceFactory.get_routing_stats()["failovers"] == 1
+
+
+def test_both_failing_returns_fallback(factory):
+    factory["gemini"].fail = True
+    factory["deepseek"].fail = True
+    
+    assert generated_by(run(factory.generate())) == "fallback"
+
+
+def test_unconfigured_backup_is_skipped(factory):
+    factory["gemini"].fail = True
+    factory["deepseek"].configured = False
+    
+    assert generated_by(run(factory.generate())) == "fallback"
+    assert factory["deepseek"].calls == 0
+
+
+def test_open_primary_breaker_goes_to_backup(factory):
+    factory["gemini"].fail = True
+    for i in range(2):
+        run(factory.generate(f"问{i}"))
+    assert AIServiceFactory.get_breaker("gemini").state == "open"
+    
+    calls = factory["gemini"].calls
+    response = run(factory.generate("新问题"))
+    assert generated_by(response) == "deepseek"
+    assert factory["gemini"].calls == calls
+
+
+@pytest.fixture
+def hedging(factory, monkeypatch):
+    """开启对冲，主模型已有足够的耗时样本，对冲延迟约 10 毫秒"""
+    monkeypatch.setattr(AIServiceFactory, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(AIServiceFactory, "HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(AIServiceFactory, "HEDGE_MIN_DELAY", 0)
+    tracker = LatencyTracker()
+    for _ in range(5):
+        tracker.add(10)
+    AIServiceFactory._latencies["gemini"] = tracker
+    return factory
+
+
+def test_slow_primary_is_hedged(hedging):
+    hedging["gemini"].release.clear()
+    response = run(hedging.generate())
+    
+    assert generated_by(response) == "deepseek"
+    # 较慢的主模型请求被取消
+    assert hedging["gemini"].cancelled == 1
+    stats = AIServiceFactory.get_routing_stats()
+    assert stats["hedged"] == 1 and stats["hedgeWins"] == 1 and stats["failovers"] == 0
+    assert AIServiceFactory.get_admission("gemini").stats()["active"] == 0
+
+
+def test_fast_primary_is_not_hedged(hedging):
+    response = run(hedging.generate())
+    
+    assert generated_by(response) == "gemini"
+    assert hedging["deepseek"].calls == 0
+    assert AIServiceFactory.get_routing_stats()["hedged"] == 0
+
+
+def test_hedge_returning_fallback_waits_for_primary(hedging):
+    async def scenario():
+        hedging["gemini"].release.clear()
+        hedging["deepseek"].fail = True
+        task = asyncio.create_task(hedging.generate())
+        await asyncio.sleep(0.05)
+        hedging["gemini"].release.set()
+        return await task
+    
+    response = run(scenario())
+    assert generated_by(response) == "gemini"
+    assert AIServiceFactory.get_routing_stats()["hedgeWins"] == 0
+
+
+def test_stream_failover_resets_components(factory):
+    factory["gemini"].fail_after = 1
+    events = run(factory.collect(factory.stream()))
+    
+    assert [event for event, _ in events] == [
+        "ready", "component", "failover", "component", "component", "done"
+    ]
+    assert events[2][1] == {"from": "gemini", "to": "deepseek"}
+    # failover 之后的组件即为最终结果
+    assert [data for event, data in events[3:5]] == events[-1][1]["components"]
+    assert generated_by(events[-1][1]) == "deepseek"
+
+
+def test_stream_both_failing_returns_fallback(factory):
+    factory["gemini"].fail = True
+    factory["deepseek"].fail = True
+    events = run(factory.collect(factory.stream()))
+    
+    assert generated_by(events[-1][1]) == "fallback"
+    assert AIServiceFactory.get_admission("gemini").stats()["active"] == 0
+    assert AIServiceFactory.get_admission("deepseek").stats()["active"] == 0
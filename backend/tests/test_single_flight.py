@@ -0,0 +1,198 @@
+"""
+请求合并测试
+"""
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+class Upstream:
+    """记录调用次数、可控制何时返回的上游"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+    
+    async def __call__(self, publish=None) -> str:
+        self.calls += 1
+        call = self.calls
+        try:
+            if publish:
+                publish("component", 1)
+            await self.release.wait()
+            if publish:
+                publish("component", 2)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"result-{call}"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def collect(events) -> list:
+    return [item async for item in events]
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        tasks = [asyncio.create_task(flight.do("k", upstream)) for _ in range(5)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await asyncio.gather(*tasks), upstream.calls, flight.stats()
+    
+    results, calls, stats = run(scenario())
+    assert results == [("result-1", False)] + [("result-1", True)] * 4
+    assert calls == 1
+    assert stats == {"inFlight": 0, "executed": 1, "coalesced": 4}
+
+
+def test_different_keys_are_not_coalesced():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        upstream.release.set()
+        await asyncio.gather(flight.do("a", upstream), flight.do("b", upstream))
+        return upstream.calls
+    
+    assert run(scenario()) == 2
+
+
+def test_one_caller_cancelling_does_not_cancel_others():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        first = asyncio.create_task(flight.do("k", upstream))
+        second = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await second, upstream.cancelled
+    
+    assert run(scenario()) == (("result-1", True), 0)
+
+
+def test_upstream_cancelled_when_all_callers_leave():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        task = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0)
+        task.cancel()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return upstream.cancelled, flight.in_flight("k")
+    
+    assert run(scenario()) == (1, False)
+
+
+def test_late_stream_subscriber_receives_published_events():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        first = flight.stream("k", upstream)
+        received = [await anext(first)]
+        late = asyncio.create_task(collect(flight.stream("k", upstream)))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        received += await collect(first)
+        return received, await late, upstream.calls
+    
+    received, late, calls = run(scenario())
+    assert received == [("component", 1), ("component", 2), ("done", "result-1")]
+    assert late == received
+    assert calls == 1
+
+
+def test_sync_caller_joins_stream_and_stream_joins_sync_call():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        stream = asyncio.create_task(collect(flight.stream("s", upstream)))
+        await asyncio.sleep(0)
+        joined_sync = asyncio.create_task(flight.do("s", upstream))
+        
+        sync = asyncio.create_task(flight.do("d", upstream))
+        await asyncio.sleep(0)
+        joined_stream = asyncio.create_task(collect(flight.stream("d", upstream)))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await stream, await joined_sync, await sync, await joined_stream, upstream.calls
+    
+    stream, joined_sync, sync, joined_stream, calls = run(scenario())
+    assert stream[-1] == ("done", "result-1") and joined_sync == ("result-1", True)
+    # 由 do 发起的调用没有中间事件
+    assert sync == ("result-2", False) and joined_stream == [("done", "result-2")]
+    assert calls == 2
+
+
+def test_stream_failure_is_raised_to_subscribers():
+    async def scenario():
+        flight = SingleFlight()
+        
+        async def failing(publish):
+            publish("component", 1)
+            raise RuntimeError("upstream failed")
+        
+        received = []
+        with pytest.raises(RuntimeError):
+            async for item in flight.stream("k", failing):
+                received.append(item)
+        return received, flight.in_flight("k")
+    
+    assert run(scenario()) == ([("component", 1)], False)
+
+
+def test_factory_coalesces_concurrent_requests(factory):
+    async def scenario():
+        factory["gemini"].release.clear()
+        tasks = [asyncio.create_task(factory.generate(f"问事业{'？' * i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        factory["gemini"].release.set()
+        return await asyncio.gather(*tasks)
+    
+    results = run(scenario())
+    assert factory["gemini"].calls == 1
+    # 合并的请求各自保留原始问题
+    assert [result["metadata"]["question"] for result in results] == ["问事业", "问事业？", "问事业？？"]
+
+
+def test_factory_coalesces_concurrent_streams_and_sync_requests(factory):
+    async def scenario():
+        factory["gemini"].hold_after = 1
+        first = factory.stream()
+        received = [await anext(first), await anext(first)]
+        second = asyncio.create_task(factory.collect(factory.stream("问事业？")))
+        sync = asyncio.create_task(factory.generate())
+        await asyncio.sleep(0)
+        factory["gemini"].resume.set()
+        received += await factory.collect(first)
+        return received, await second, await sync
+    
+    received, second, sync = run(scenario())
+    components = factory["gemini"].components
+    assert factory["gemini"].calls == 1
+    assert [event for event, _ in received] == ["ready", "component", "component", "done"]
+    assert second[0] == ("ready", {"source": "shared"})
+    assert [data for event, data in second if event == "component"] == components
+    assert second[-1][1]["metadata"]["question"] == "问事业？"
+    assert sync["components"] == components
+
+
+def test_stream_continues_for_others_after_first_client_leaves(factory):
+    async def scenario():
+        factory["gemini"].hold_after = 1
+        first = factory.stream()
+        await anext(first)
+        second = asyncio.create_task(factory.collect(factory.stream()))
+        await asyncio.sleep(0)
+        await first.aclose()
+        factory["gemini"].resume.set()
+        return await second
+    
+    second = run(scenario())
+    assert factory["gemini"].cancelled == 0
+    assert second[-1][0] == "done"
+    assert [data for event, data in second if event == "component"] == factory["gemini"].components
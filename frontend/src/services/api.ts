@@ -88,6 +88,7 @@ export interface A2UIResponse {
 }
 
 export interface LiuYaoResult {
+  shareId?: string  // 保存后的 id，可通过 getDivination 重新取得（用于分享链接）
   success: boolean
   originalHexagram: Hexagram
   changedHexagram?: Hexagram
@@ -112,18 +113,131 @@ export async function getAIModels(): Promise<AIModel[]> {
 
 /**
  * 六爻占卜
+ *
+ * idempotencyKey：同一次占卜的重试传入相同的 key（如 crypto.randomUUID()），
+ * 后端复用进行中或已完成的结果，不会重复调用 AI
  */
 export async function liuyaoDivination(
   question: string,
   coinResults: number[][],
-  model?: string
+  model?: string,
+  idempotencyKey?: string
 ): Promise<LiuYaoResult> {
   return api.post('/divination/liuyao', {
     question,
     coin_results: coinResults,
     model: model || undefined
+  }, {
+    headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined
   })
 }
 
+export interface LiuYaoStreamHandlers {
+  // 卦象计算完成（最先到达）
+  onHexagram?: (hexagram: Omit<LiuYaoResult, 'success' | 'a2uiResponse'>) => void
+  // 每生成完一个 A2UI 组件
+  onComponent?: (component: any) => void
+  // 主模型失败、切换到备用模型：此前收到的组件应丢弃，之后的组件来自备用模型
+  onFailover?: (failover: { from: string; to: string }) => void
+}
+
+/**
+ * 六爻占卜（流式）
+ *
+ * 通过 SSE 逐步接收卦象、A2UI 组件，最终返回完整结果
+ *
+ * idempotencyKey：同 liuyaoDivination，重试时接上进行中的解读或直接取得已完成的结果
+ */
+export async function liuyaoDivinationStream(
+  question: string,
+  coinResults: number[][],
+  model: string | undefined,
+  handlers: LiuYaoStreamHandlers = {},
+  idempotencyKey?: string
+): Promise<LiuYaoResult> {
+  const response = await fetch('/api/divination/liuyao/stream', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {})
+    },
+    body: JSON.stringify({
+      question,
+      coin_results: coinResults,
+      model: model || undefined
+    })
+  })
+
+  if (!response.ok || !response.body) {
+    let detail = `请求失败 (${response.status})`
+    try {
+      detail = (await response.json()).detail || detail
+    } catch {
+      // 忽略非 JSON 错误响应
+    }
+    throw new Error(detail)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let hexagram: Omit<LiuYaoResult, 'success' | 'a2uiResponse'> | null = null
+  let shareId: string | undefined
+
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    // 事件以空行分隔
+    let boundary = buffer.indexOf('\n\n')
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      boundary = buffer.indexOf('\n\n')
+
+      let event = 'message'
+      let data = ''
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      }
+      if (!data) continue
+      const payload = JSON.parse(data)
+
+      if (event === 'hexagram') {
+        hexagram = payload
+        handlers.onHexagram?.(payload)
+      } else if (event === 'component') {
+        handlers.onComponent?.(payload)
+      } else if (event === 'failover') {
+        handlers.onFailover?.(payload)
+      } else if (event === 'saved') {
+        shareId = payload.shareId
+      } else if (event === 'done' && hexagram) {
+        return { shareId, success: true, ...hexagram, a2uiResponse: payload }
+      }
+    }
+  }
+
+  throw new Error('占卜结果未完整返回，请稍后重试')
+}
+
+/**
+ * 读取保存的占卜结果（分享链接、重新打开结果页）
+ */
+export async function getDivination(shareId: string): Promise<LiuYaoResult> {
+  return api.get(`/divination/${encodeURIComponent(shareId)}`)
+}
+
+/**
+ * 服务端渲染的分享海报地址（可直接用作 <img> 的 src）
+ *
+ * svg 无需额外依赖；png 需要后端安装 Pillow 并配置中文字体
+ */
+export function getPosterUrl(shareId: string, format: 'svg' | 'png' = 'svg'): string {
+  return `/api/divination/${encodeURIComponent(shareId)}/poster.${format}`
+}
+
 export default api
 
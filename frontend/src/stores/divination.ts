@@ -45,6 +45,22 @@ export const useDivinationStore = defineStore('divination', () => {
     result.value = r
   }
 
+  /**
+   * 追加一个流式到达的 A2UI 组件
+   */
+  function appendComponent(component: any) {
+    result.value?.a2uiResponse.components.push(component)
+  }
+
+  /**
+   * 清空已流式到达的组件（切换到备用模型重新生成时）
+   */
+  function clearComponents() {
+    if (result.value) {
+      result.value.a2uiResponse.components = []
+    }
+  }
+
   /**
    * 设置加载状态
    */
@@ -132,6 +148,8 @@ export const useDivinationStore = defineStore('divination', () => {
     setQuestion,
     addCoinResult,
     setResult,
+    appendComponent,
+    clearComponents,
     setLoading,
     setError,
     reset,